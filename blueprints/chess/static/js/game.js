@@ -9,6 +9,74 @@
         'p': Pawn
     }
 
+    // compact position FEN letters -> piece types keys
+    fen_types_dict = {
+        'k': 'K',
+        'q': 'Q',
+        'r': 'r',
+        'b': 'b',
+        'n': 'k',
+        'p': 'p'
+    }
+
+    /**
+     * Decodes compact position string (see modules/chess/codec.py) to game data
+     */
+    decodePosition = function(data){
+        var fields = data.split(' ');
+        var ids = fields[3].split(',');
+        var game = {
+            board: {},
+            black_moves: fields[1] == 'b',
+            is_check: fields[2].indexOf('+') >= 0,
+            is_checkmate: fields[2].indexOf('#') >= 0,
+            is_stalemate: fields[2].indexOf('=') >= 0,
+            white_captures: [],
+            black_captures: []
+        };
+
+        var pieceData = function(letter, token, position){
+            var id_parts = token.split(':');
+            var is_black = letter == letter.toLowerCase();
+            return {
+                id: id_parts[0],
+                t: fen_types_dict[letter.toLowerCase()],
+                p: position,
+                m: id_parts.length > 1 ? parseInt(id_parts[1]) : 0,
+                b: is_black
+            };
+        };
+
+        _.each(fields[0].split('/'), function(rank, i){
+            var x = 0;
+            var y = 7 - i;
+            for (var j = 0; j < rank.length; j++) {
+                var letter = rank.charAt(j);
+                if (letter >= '1' && letter <= '8') {
+                    x += parseInt(letter);
+                    continue;
+                }
+
+                var piece = pieceData(letter, ids.shift(), [x, y]);
+                game.board[piece.id] = piece;
+                x++;
+            }
+        });
+
+        if (fields[4] != '-') {
+            _.each(fields[4].split(','), function(token){
+                var piece = pieceData(token.charAt(0), token.substr(1), null);
+                if (piece.b) {
+                    game.white_captures.push(piece);
+                } else {
+                    game.black_captures.push(piece);
+                }
+            });
+        }
+
+        return game;
+    }
+
     /**
      * Game object. Manages game, communicates with backend.
      */
@@ -23,12 +91,19 @@
         };
         this.game_data;
 
+        // game data format - 'compact' position strings, or full data if empty
+        this.format = 'compact';
+
+        // server-side game session id, if server keeps games
+        this.game_id = null;
+
         // game state
         this.black_moves = false;
         this.white_player_human = true;
         this.black_player_human = true;
         this.is_check = false;
         this.is_checkmate = false;
+        this.is_stalemate = false;
         this.locked = false;
     }
 
@@ -121,14 +196,21 @@
             blacks_capture_cont = $('.game .black_captures');
 
             this.game_data = game_data;
-            this.black_moves = game_data.game.black_moves;
-            this.is_check = game_data.game.is_check;
-            this.is_checkmate = game_data.game.is_checkmate;
+            this.game_id = game_data.game_id || null;
+            var game = game_data.game;
+            if (typeof game == 'string') {
+                game = decodePosition(game);
+            }
+
+            this.black_moves = game.black_moves;
+            this.is_check = game.is_check;
+            this.is_checkmate = game.is_checkmate;
+            this.is_stalemate = game.is_stalemate;
 
             // create pieces from data
-            _.each(game_data.game.board, this.updatePiece, this);
-            _.each(game_data.game.white_captures, this.updatePiece, this);
-            _.each(game_data.game.black_captures, this.updatePiece, this);
+            _.each(game.board, this.updatePiece, this);
+            _.each(game.white_captures, this.updatePiece, this);
+            _.each(game.black_captures, this.updatePiece, this);
 
             // moves
             this.pieces.reset_moves();
@@ -141,12 +223,12 @@
             // trigger events
             this.trigger('update');
 
-            if (this.is_check && !this.is_checkmate) {
-                this.trigger('check', this.black_moves);
-            } else if (this.is_check && this.is_checkmate) {
+            if (this.is_checkmate) {
                 this.trigger('checkmate', this.black_moves);
-            } else if (!this.is_check && this.is_checkmate) {
+            } else if (this.is_stalemate) {
                 this.trigger('stalemate', this.black_moves);
+            } else if (this.is_check) {
+                this.trigger('check', this.black_moves);
             }
 
             return this;
@@ -189,6 +271,7 @@
             }
 
             var g = this;
+            this.game_id = null;
             $.post(
                 url, 
                 this._prepare_post_data(),
@@ -222,7 +305,7 @@
                         ||
                         (!g.black_moves && !g.white_player_human)
                     ) {
-                        if (!g.is_checkmate) {
+                        if (!g.is_checkmate && !g.is_stalemate) {
                             setTimeout(function(){
                                 g.move();
                             }, 1000 );
@@ -232,7 +315,15 @@
                     g.locked = false;
                 },
                 'json'
-            );
+            ).fail(function(xhr){
+                g.locked = false;
+
+                // game session expired on server - send whole position
+                if (xhr.status == 404 && g.game_id) {
+                    g.game_id = null;
+                    g.move(move);
+                }
+            });
             return this;
         },
 
@@ -269,9 +360,25 @@
         },
 
         _prepare_post_data: function(move) {
+            if (this.game_id) {
+                // server keeps the game
+                return JSON.stringify({
+                    game_id: this.game_id,
+                    move: move,
+                    format: this.format
+                });
+            }
+
+            var game_data = this.game_data;
+            if (game_data && this.format == 'compact') {
+                // moves list is not needed by server
+                game_data = {game: game_data.game};
+            }
+
             return JSON.stringify({
-                game_data: this.game_data,
-                move: move
+                game_data: game_data,
+                move: move,
+                format: this.format
             });
         }
     }
@@ -1,12 +1,54 @@
 import json
-from flask import render_template, Response, request
-from modules.chess import game, pieces
+import time
+from flask import abort, g, render_template, Response, request, current_app
+from modules.chess import board, book, codec, game, pieces, sessions, tablebase
 from modules.chess import move_generators
+from modules.chess.move_generators import ordering, transposition
 import modules.chess.game_factory as game_factory
+from modules import profiling
+
+
+# shared by consecutive requests handled by this worker
+transposition_table = transposition.TranspositionTable()
+
+# request header asking for profile, the profile is returned in response header of the same name
+PROFILE_HEADER = 'X-Chess-Profile'
 
 
 def init(blueprint):
 
+    @blueprint.before_request
+    def start_profile():
+        if profiling_requested():
+            profile = profiling.start()
+            parse_request_data()
+            profile.addTime('parse_request_data', g.chess_parse_time)
+
+    @blueprint.after_request
+    def add_profile(response):
+        profile = profiling.stop()
+        if profile is not None:
+            response.headers[PROFILE_HEADER] = json.dumps(profile.serialize(), separators=(',', ':'))
+        return response
+
+    @blueprint.teardown_request
+    def stop_profile(exception):
+        # profile and session of failed request
+        profiling.stop()
+        release_session()
+
+    @blueprint.route('/metrics')
+    def metrics():
+        """Profiles aggregated by this worker process"""
+        if not current_app.config.get('CHESS_PROFILING'):
+            abort(404)
+
+        return Response(
+            response=json.dumps(profiling.stats.serialize(), separators=(',', ':')),
+            status=200,
+            mimetype="application/json"
+        )
+
     @blueprint.route('')
     def index():
         return render_template('chess/index.html')
@@ -16,22 +58,40 @@ def init(blueprint):
         chessgame = game.Game()
         chessgame.init_new()
 
-        return prepare_game_response(chessgame)
+        session = start_session(chessgame)
+        return prepare_game_response(chessgame, compact_requested(parse_request_data()), session)
 
     @blueprint.route('/game/move', methods=['POST'])
     def move():
-        data = parse_game_request()
+        with profiling.timer('parse_request'):
+            data = parse_game_request()
 
         chessgame = data['game']
 
         # move
-        if 'move' in data:
-            move = data['move']
-            chessgame.move(move)
-        else:
-            chessgame.move()
+        with profiling.timer('move'):
+            if 'move' in data:
+                move = data['move']
+                chessgame.move(move)
+            else:
+                chessgame.move()
+
+        session = data['session']
+        if not session:
+            # sessions may be enabled or expired since game start
+            with profiling.timer('session_store'):
+                session = start_session(chessgame)
+
+        # game of session is serialized before other request of it can move
+        with profiling.timer('response'):
+            response = prepare_game_response(chessgame, data['compact'], session, data['search_report'])
 
-        return prepare_game_response(chessgame)
+        if data['session']:
+            with profiling.timer('session_store'):
+                get_session_store().set(session)
+                g.chess_session = None
+
+        return response
 
     # Game tests
     @blueprint.route('/game/<test>', methods=['POST'])
@@ -39,27 +99,150 @@ def init(blueprint):
         test_method_name = 'make_%s' % test
         test_method = getattr(game_factory, test_method_name)
         _game = test_method()
-        return prepare_game_response(_game)
+
+        session = start_session(_game)
+        return prepare_game_response(_game, compact_requested(parse_request_data()), session)
+
+
+def parse_request_data():
+    """Request JSON, posted as form key - parsed once per request, cached in flask.g"""
+    if not hasattr(g, 'chess_request_data'):
+        start = time.time()
+        try:
+            data = json.loads(request.form.items()[0][0])
+        except IndexError:
+            data = None
+        g.chess_request_data = data
+        g.chess_parse_time = time.time() - start
+
+    return g.chess_request_data
+
+
+def profiling_requested():
+    """Client asks for request profile - by header or 'profile' key, if CHESS_PROFILING config allows it"""
+    if not current_app.config.get('CHESS_PROFILING'):
+        return False
+
+    if request.headers.get(PROFILE_HEADER):
+        return True
+
+    data = parse_request_data()
+    return bool(data) and bool(data.get('profile'))
+
+
+def compact_requested(data):
+    """Client asks for compact game encoding (see codec module)"""
+    return bool(data) and data.get('format') == codec.FORMAT
+
+
+def get_session_store():
+    """Game sessions store of app, created from config on first use - None if sessions are disabled"""
+    if 'chess_sessions' not in current_app.extensions:
+        current_app.extensions['chess_sessions'] = sessions.createStore(current_app.config)
+
+    return current_app.extensions['chess_sessions']
+
+
+def release_session():
+    """Releases session got by request which didn't store it"""
+    session = getattr(g, 'chess_session', None)
+    if session is not None:
+        g.chess_session = None
+        get_session_store().release(session)
+
+
+def start_session(chessgame):
+    """Stores new game on server, returns its session or None if sessions are disabled"""
+    store = get_session_store()
+    if store is None:
+        return None
+
+    # searched on bitboards, as games of stateless requests
+    session_game = game.Game(board.BitBoard())
+    session_game.deserialize(chessgame.serialize())
+
+    session = sessions.Session(session_game)
+    store.set(session)
+    return session
 
 
 def parse_game_request(chessgame=None):
-    try:
-        data = json.loads(request.form.items()[0][0])
-    except IndexError:
-        data = None
+    data = parse_request_data()
+
+    # game kept on server - request carries game id and move only
+    session = None
+    if not chessgame and data and data.get('game_id'):
+        store = get_session_store()
+        if store is not None:
+            session = store.get(data['game_id'])
+            # released by store set, or on teardown of failed request
+            g.chess_session = session
+        if session is None:
+            abort(404)
+        chessgame = session.game
+
+    if not chessgame or session:
+        # AI time budget in milliseconds - from request, limited by app config, or app config
+        time_budget = None
+        if data and data.get('time_budget') is not None:
+            max_budget = current_app.config.get(
+                'CHESS_AI_MAX_TIME_BUDGET', current_app.config.get('CHESS_AI_TIME_BUDGET'))
+            try:
+                time_budget = move_generators.gen_minimax.parseTimeBudget(data['time_budget'], max_budget)
+            except ValueError:
+                abort(400)
+        if not time_budget:
+            time_budget = current_app.config.get('CHESS_AI_TIME_BUDGET')
+
+        # killers and history are collected per request
+        move_ordering = ordering.MoveOrdering()
+
+        # session games have their own transposition table
+        table = session.table if session else transposition_table
+
+        # search processes for parallel generator - from app config
+        workers = current_app.config.get('CHESS_AI_WORKERS')
 
-    if not chessgame:
         # generator = move_generators.gen_rand.randomGenerator
-        generator = lambda g: move_generators.gen_minimax.minimaxGenerator(g, level=2)
+        if workers and workers > 1 and not time_budget:
+            generator = lambda g: move_generators.gen_parallel.parallelNegamaxGenerator(
+                g, level=2, workers=workers, quiescence=True)
+        elif time_budget:
+            generator = lambda g: move_generators.gen_minimax.iterativeMinimaxGenerator(
+                g, time_budget, table=table, ordering=move_ordering, quiescence=True)
+        else:
+            generator = lambda g: move_generators.gen_negamax.negamaxGenerator(
+                g, level=2, table=table, ordering=move_ordering, quiescence=True)
 
-        chessgame = game.Game(None, generator)
-        chessgame.init_new()
+        # endgame tables file - from app config, positions with few pieces are not searched
+        if current_app.config.get('CHESS_TABLEBASE'):
+            endgame_tables = tablebase.getTablebase(current_app.config['CHESS_TABLEBASE'])
+            search_generator = generator
+            generator = lambda g: tablebase.tablebaseGenerator(g, endgame_tables, search_generator)
 
-    if data and 'game_data' in data:
-        chessgame.deserialize(data['game_data']['game'])
+        # opening book file - from app config, loaded on first use in this worker
+        opening_book = None
+        if current_app.config.get('CHESS_OPENING_BOOK'):
+            opening_book = book.getBook(current_app.config['CHESS_OPENING_BOOK'])
+
+        if session:
+            chessgame.move_generator = generator
+            chessgame.opening_book = opening_book
+        else:
+            chessgame = game.Game(board.BitBoard(), generator, opening_book)
+            if not (data and 'game_data' in data):
+                chessgame.init_new()
+
+    if data and 'game_data' in data and not session:
+        with profiling.timer('deserialize'):
+            chessgame.deserialize(data['game_data']['game'])
 
     result = {
         'game': chessgame,
+        'session': session,
+        'compact': compact_requested(data),
+        # client asks for statistics of AI move search
+        'search_report': bool(data and data.get('search_report')),
     }
 
     if data and 'move' in data:
@@ -68,9 +251,10 @@ def parse_game_request(chessgame=None):
     return result
 
 
-def prepare_game_response(chessgame):
-    game_data = chessgame.serialize()
-    piece_moves = chessgame.getAllMoves()
+def prepare_game_response(chessgame, compact=False, session=None, search_report=False):
+    game_data = chessgame.serialize(compact)
+    # legal moves index is reused by next move validation in this position
+    piece_moves = chessgame.getMovesIndex().itervalues()
     piece_move_data = []
     for piece_move in piece_moves:
         start_pos = piece_move.moves[0][0]
@@ -81,14 +265,19 @@ def prepare_game_response(chessgame):
             'move': piece_move.serialize()
         })
 
+    response_data = {
+        'game': game_data,
+        'moves': piece_move_data
+    }
+    if session:
+        response_data['game_id'] = session.id
+    if search_report:
+        # None for client and opening book moves
+        report = chessgame.search_report
+        response_data['search_report'] = report.serialize() if report else None
+
     return Response(
-        response=json.dumps(
-            {
-                'game': game_data,
-                'moves': piece_move_data
-            },
-            separators=(',', ':')
-        ),
+        response=json.dumps(response_data, separators=(',', ':')),
         status=200,
         mimetype="application/json"
     )
@@ -0,0 +1,143 @@
+"""Attack maps module
+Squares attacked by each color with attackers counts, kept per position by Game.getAttackMap.
+A piece attacks squares it could capture on - squares of own pieces (defended) are included,
+sliding attacks stop at the first piece. En passant is not an attack.
+After a move only attacks of pieces on changed squares and of sliders passing through them are
+recomputed (see AttackMap.update).
+Squares are indexed as bitboards: index = y * 8 + x
+"""
+import pieces
+import tables
+
+
+POSITIONS = [(index % 8, index // 8) for index in range(64)]
+
+
+def _indexes(table):
+    return [[y * 8 + x for x, y in table[x][y]] for x, y in POSITIONS]
+
+
+def _rays(table):
+    return [[[(y * 8 + x, x, y) for x, y in ray] for ray in table[x][y]] for x, y in POSITIONS]
+
+
+KNIGHT_TARGETS = _indexes(tables.KNIGHT_TARGETS)
+KING_TARGETS = _indexes(tables.KING_TARGETS)
+
+# indexed by is_black
+PAWN_ATTACKS = [_indexes(tables.PAWN_ATTACKS[0]), _indexes(tables.PAWN_ATTACKS[1])]
+
+# ray lists per square, ray squares are tuples (index, x, y)
+RAYS_DIAGONAL = _rays(tables.RAYS_DIAGONAL)
+RAYS_ORTHOGONAL = _rays(tables.RAYS_ORTHOGONAL)
+RAYS_ALL = [RAYS_DIAGONAL[index] + RAYS_ORTHOGONAL[index] for index in range(64)]
+
+SLIDERS = {
+    pieces.TypeBishop: RAYS_DIAGONAL,
+    pieces.TypeRook: RAYS_ORTHOGONAL,
+    pieces.TypeQueen: RAYS_ALL,
+}
+
+STEPPERS = {
+    pieces.TypeKnight: KNIGHT_TARGETS,
+    pieces.TypeKing: KING_TARGETS,
+}
+
+
+def squareIndex(position):
+    """Position (x, y) -> square index"""
+    return position[1] * 8 + position[0]
+
+
+def pieceAttacks(piece, index, squares):
+    """Square indexes attacked by piece standing on square index"""
+    rays = SLIDERS.get(piece.type)
+    if rays is None:
+        if piece.type is pieces.TypePawn:
+            return PAWN_ATTACKS[piece.is_black][index]
+        return STEPPERS[piece.type][index]
+
+    targets = []
+    for ray in rays[index]:
+        for target, x, y in ray:
+            targets.append(target)
+            if squares[x][y].piece:
+                break
+
+    return targets
+
+
+class AttackMap(object):
+    """Attack maps of both colors for one board position"""
+
+    def __init__(self, board):
+        # attackers count of square, indexed by is_black
+        self.counts = [[0] * 64, [0] * 64]
+
+        # square -> (is_black, attacked squares, is slider) of piece standing on it, or None
+        self.sources = [None] * 64
+
+        # square -> set of squares with pieces attacking it
+        self.attackers = [set() for index in range(64)]
+
+        squares = board.squares
+        for index in range(64):
+            self._add(squares, index)
+
+    def isAttacked(self, position, by_black):
+        """Checks if square is attacked by color"""
+        return self.counts[by_black][position[1] * 8 + position[0]] > 0
+
+    def count(self, position, by_black):
+        """Number of pieces of color attacking square"""
+        return self.counts[by_black][position[1] * 8 + position[0]]
+
+    def mobility(self, is_black):
+        """Number of squares attacked by color"""
+        return 64 - self.counts[is_black].count(0)
+
+    def update(self, board, positions):
+        """Updates maps after pieces on positions have changed (moved, captured, promoted)"""
+        changed = set(squareIndex(p) for p in positions if p)
+
+        recompute = set(changed)
+        for index in changed:
+            for source in self.attackers[index]:
+                if self.sources[source][2]:
+                    recompute.add(source)
+
+        for index in recompute:
+            self._remove(index)
+
+        squares = board.squares
+        for index in recompute:
+            self._add(squares, index)
+
+    def _add(self, squares, index):
+        x, y = POSITIONS[index]
+        piece = squares[x][y].piece
+        if not piece:
+            return
+
+        targets = pieceAttacks(piece, index, squares)
+        self.sources[index] = (piece.is_black, targets, piece.type in SLIDERS)
+
+        counts = self.counts[piece.is_black]
+        attackers = self.attackers
+        for target in targets:
+            counts[target] += 1
+            attackers[target].add(index)
+
+    def _remove(self, index):
+        source = self.sources[index]
+        if source is None:
+            return
+
+        is_black, targets, slider = source
+        counts = self.counts[is_black]
+        attackers = self.attackers
+        for target in targets:
+            counts[target] -= 1
+            attackers[target].discard(index)
+
+        self.sources[index] = None
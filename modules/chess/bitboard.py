@@ -0,0 +1,120 @@
+"""Bitboard module
+Board positions are mapped to bits of 64-bit integers: bit index = y * 8 + x
+"""
+
+import tables
+
+DIRECTIONS_ORTHOGONAL = tables.DIRECTIONS_ORTHOGONAL
+DIRECTIONS_DIAGONAL = tables.DIRECTIONS_DIAGONAL
+
+
+def squareIndex(position):
+    """Position (x, y) -> bit index"""
+    return position[1] * 8 + position[0]
+
+
+def squarePosition(index):
+    """Bit index -> position (x, y)"""
+    return (index & 7, index >> 3)
+
+
+def squareBit(position):
+    """Position (x, y) -> single bit mask"""
+    return 1 << (position[1] * 8 + position[0])
+
+
+# bit index -> position (x, y)
+POSITIONS = [squarePosition(index) for index in range(64)]
+
+
+def bits(mask):
+    """Yields indexes of set bits, lowest first"""
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+def _masks(table):
+    """Position lists table -> list of bitboards indexed by bit index"""
+    masks = []
+    for index in range(64):
+        x, y = squarePosition(index)
+        masks.append(reduce(lambda mask, p: mask | squareBit(p), table[x][y], 0))
+
+    return masks
+
+
+KNIGHT_ATTACKS = _masks(tables.KNIGHT_TARGETS)
+KING_ATTACKS = _masks(tables.KING_TARGETS)
+
+# attacked squares for pawn standing on square, indexed by is_black
+PAWN_ATTACKS = [_masks(tables.PAWN_ATTACKS[0]), _masks(tables.PAWN_ATTACKS[1])]
+
+# ray tables: direction -> (masks per square, direction goes to higher bit indexes)
+RAYS = dict(
+    (d, (_masks(tables.RAYS[d]), d[1] > 0 or (d[1] == 0 and d[0] > 0)))
+    for d in DIRECTIONS_ORTHOGONAL + DIRECTIONS_DIAGONAL
+)
+
+
+# ray tables of directions sets, for rayAttacks
+RAYS_DIAGONAL = [RAYS[d] for d in DIRECTIONS_DIAGONAL]
+RAYS_ORTHOGONAL = [RAYS[d] for d in DIRECTIONS_ORTHOGONAL]
+RAYS_ALL = RAYS_ORTHOGONAL + RAYS_DIAGONAL
+
+
+def slidingAttacks(index, occupied, directions):
+    """Squares attacked from index along directions, stopping at first occupied square"""
+    return rayAttacks(index, occupied, [RAYS[d] for d in directions])
+
+
+def rayAttacks(index, occupied, ray_tables):
+    """slidingAttacks for ray tables of directions (RAYS_DIAGONAL, RAYS_ORTHOGONAL or RAYS_ALL)"""
+    attacks = 0
+    for rays, positive in ray_tables:
+        ray = rays[index]
+        blockers = ray & occupied
+        if blockers:
+            if positive:
+                blocker = (blockers & -blockers).bit_length() - 1
+            else:
+                blocker = blockers.bit_length() - 1
+            ray ^= rays[blocker]
+        attacks |= ray
+
+    return attacks
+
+
+class BitBoards(object):
+    """Bitboards for one board: one bitboard per piece type and color plus occupancy masks
+    Kept in sync with board squares by BoardManager
+    """
+    def __init__(self):
+        # piece type -> [white bitboard, black bitboard]
+        self.pieces = {}
+
+        # occupancy, indexed by is_black
+        self.colors = [0, 0]
+
+    def add(self, ptype, is_black, index):
+        bit = 1 << index
+        boards = self.pieces.get(ptype)
+        if boards is None:
+            boards = self.pieces[ptype] = [0, 0]
+        boards[is_black] |= bit
+        self.colors[is_black] |= bit
+
+    def remove(self, ptype, is_black, index):
+        mask = ~(1 << index)
+        self.pieces[ptype][is_black] &= mask
+        self.colors[is_black] &= mask
+
+    def get(self, ptype, is_black):
+        boards = self.pieces.get(ptype)
+        if boards is None:
+            return 0
+        return boards[is_black]
+
+    def occupied(self):
+        return self.colors[0] | self.colors[1]
@@ -1,9 +1,15 @@
 """Board module"""
 import pieces
+import bitboard
+import mailbox
+import zobrist
+import evaluation
 
 
 class Square(object):
     """Square on board"""
+    __slots__ = ('piece', 'is_black')
+
     def __init__(self, is_black, Piece=None):
         super(Square, self).__init__()
         if Piece:
@@ -21,17 +27,45 @@ class Board(object):
     """Board class
     This object will probably be frequently copied, so it's just data. Methods for managing board are in BoardManager class
     """
+
+    # optional bitboards index, see BitBoard
+    bitboards = None
+
+    # optional 10x12 array index, see MailboxBoard
+    mailbox = None
+
     def __init__(self):
         """Initialize board"""
         self.squares = [[Square(not ((i + j) % 2)) for i in range(8)] for j in range(8)]
 
-        # symmetrical board, for moving black pieces
-        self.squares_reversed = [[self.squares[7 - j][7 - i] for i in range(8)] for j in range(8)]
-
         # kings positions
         self.white_king_pos = None
         self.black_king_pos = None
 
+        # zobrist key of pieces on board, maintained by BoardManager
+        self.zobrist_key = 0
+
+        # material + piece-square score for white, maintained by BoardManager
+        self.score = 0
+
+
+class BitBoard(Board):
+    """Board with bitboards index
+    Squares are kept as in Board, move generation and king safety checks run on bitboards
+    """
+    def __init__(self):
+        super(BitBoard, self).__init__()
+        self.bitboards = bitboard.BitBoards()
+
+
+class MailboxBoard(Board):
+    """Board with 10x12 mailbox array index
+    Squares are kept as in Board, move generation and king safety checks run on the array
+    """
+    def __init__(self):
+        super(MailboxBoard, self).__init__()
+        self.mailbox = mailbox.create()
+
 
 class BoardManager(object):
     """Board manager class"""
@@ -58,7 +92,12 @@ class BoardManager(object):
 
         piece.position = pos
 
-        board.squares[pos[0]][pos[1]].piece = piece
+        square = board.squares[pos[0]][pos[1]]
+        if square.piece:
+            BoardManager._unindexPiece(board, square.piece, pos)
+        BoardManager._indexPiece(board, piece, pos)
+
+        square.piece = piece
 
         if piece.type == pieces.TypeKing:
             if piece.is_black:
@@ -84,10 +123,12 @@ class BoardManager(object):
                     # same color, invalid move!
                     raise ValueError('Invalid move, square occupied!')
 
+                BoardManager._unindexPiece(board, captured_piece, end_pos)
                 captured_piece.position = None
                 captured_pieces.append(captured_piece)
 
             # move
+            BoardManager._unindexPiece(board, piece, start_pos)
             board.squares[start_pos[0]][start_pos[1]].piece = None
             board.squares[end_pos[0]][end_pos[1]].piece = piece
             piece.position = end_pos
@@ -97,8 +138,14 @@ class BoardManager(object):
             if move_object.transformation:
                 pos, trans_piece_type = move_object.transformation
                 trans_piece = board.squares[pos[0]][pos[1]].piece
-                if trans_piece:
+                if trans_piece is piece:
                     trans_piece.type = trans_piece_type
+                elif trans_piece:
+                    BoardManager._unindexPiece(board, trans_piece, pos)
+                    trans_piece.type = trans_piece_type
+                    BoardManager._indexPiece(board, trans_piece, pos)
+
+            BoardManager._indexPiece(board, piece, end_pos)
 
             if piece.type == pieces.TypeKing:
                 if piece.is_black:
@@ -108,13 +155,55 @@ class BoardManager(object):
 
         return captured_pieces
 
+    @staticmethod
+    def unmove(board, move_object, piece_types):
+        """Reverts move made by move(). Captured pieces are not restored.
+        params:
+            piece_types: types of moved pieces before move, one per move_object.moves item
+        """
+        for move, piece_type in reversed(zip(move_object.moves, piece_types)):
+            end_pos = move[1]
+            piece = board.squares[end_pos[0]][end_pos[1]].piece
+
+            BoardManager.removePiece(board, piece)
+            piece.type = piece_type
+            piece.moves_count -= 1
+            BoardManager.initPiece(board, piece, move[0], False)
+
     @staticmethod
     def removePiece(board, piece):
         """Removes piece from board"""
         pos = piece.position
+        BoardManager._unindexPiece(board, piece, pos)
         board.squares[pos[0]][pos[1]].piece = None
         piece.position = None
 
+    @staticmethod
+    def _indexPiece(board, piece, pos):
+        """Adds piece standing on pos to board indexes (bitboards, mailbox, zobrist key, score)"""
+        board.zobrist_key ^= zobrist.pieceKey(piece, pos)
+        board.score += evaluation.pieceScore(piece, pos)
+
+        if board.bitboards is not None:
+            board.bitboards.add(piece.type, piece.is_black, bitboard.squareIndex(pos))
+
+        if board.mailbox is not None:
+            board.mailbox[mailbox.squareIndex(pos)] = piece
+
+    @staticmethod
+    def _unindexPiece(board, piece, pos):
+        """Removes piece standing on pos from board indexes
+        Piece state (type, moves count) must be the same as when it was indexed
+        """
+        board.zobrist_key ^= zobrist.pieceKey(piece, pos)
+        board.score -= evaluation.pieceScore(piece, pos)
+
+        if board.bitboards is not None:
+            board.bitboards.remove(piece.type, piece.is_black, bitboard.squareIndex(pos))
+
+        if board.mailbox is not None:
+            board.mailbox[mailbox.squareIndex(pos)] = None
+
     @staticmethod
     def onBoard(position):
         def rangeok(val):
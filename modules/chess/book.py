@@ -0,0 +1,187 @@
+"""Opening book module
+Book file: 8 bytes header (MAGIC) followed by 16-byte entries (key, move, weight, reserved),
+big-endian, sorted by key. Key is Game.zobrist_key of position before move.
+Move is encoded as: from index | to index << 6 | promotion << 12, index = y * 8 + x.
+The file is memory-mapped on first probe and binary-searched.
+
+Usage (builder):
+    python -m modules.chess.book games.pgn book.bin [--plies 20] [--min-count 1]
+"""
+import argparse
+import collections
+import mmap
+import os
+import random
+import struct
+import sys
+
+from . import board, game, pgn, pieces
+
+
+MAGIC = 'SPWCBK01'
+ENTRY = struct.Struct('>QHHI')
+
+# promotion type -> code
+PROMOTIONS = {
+    None: 0,
+    pieces.TypeQueen: 1,
+    pieces.TypeKnight: 2,
+    pieces.TypeRook: 3,
+    pieces.TypeBishop: 4,
+}
+
+# loaded books by path, one set per process
+_books = {}
+
+
+def encodeMove(move):
+    """Move -> 16-bit code. Castling is encoded by king move."""
+    start, end = move.moves[0]
+    promotion = PROMOTIONS[move.transformation[1] if move.transformation else None]
+    return (start[1] * 8 + start[0]) | (end[1] * 8 + end[0]) << 6 | promotion << 12
+
+
+def findMove(moves, code):
+    """Returns move from moves list matching code, or None"""
+    for move in moves:
+        if encodeMove(move) == code:
+            return move
+
+    return None
+
+
+def getBook(path):
+    """Returns book for path, shared in process. File is opened on first probe."""
+    book = _books.get(path)
+    if book is None:
+        book = _books[path] = OpeningBook(path)
+
+    return book
+
+
+class OpeningBook(object):
+    """Memory-mapped opening book"""
+    def __init__(self, path, rng=None):
+        self.path = path
+        self.random = rng or random.Random()
+
+        self._data = None
+        self._size = 0
+
+    def _load(self):
+        with open(self.path, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError('Invalid opening book file: ' + self.path)
+
+            length = os.fstat(f.fileno()).st_size
+            if length > len(MAGIC):
+                self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                self._data = ''
+
+        self._size = (length - len(MAGIC)) // ENTRY.size
+
+    def __len__(self):
+        if self._data is None:
+            self._load()
+        return self._size
+
+    def entries(self, key):
+        """Returns list of tuples (move code, weight) for position key"""
+        if self._data is None:
+            self._load()
+
+        # lower bound
+        low, high = 0, self._size
+        while low < high:
+            middle = (low + high) // 2
+            if self._entry(middle)[0] < key:
+                low = middle + 1
+            else:
+                high = middle
+
+        result = []
+        while low < self._size:
+            entry_key, code, weight, reserved = self._entry(low)
+            if entry_key != key:
+                break
+            result.append((code, weight))
+            low += 1
+
+        return result
+
+    def probe(self, _game):
+        """Returns list of tuples (move, weight) - legal book moves for game position"""
+        entries = self.entries(_game.zobrist_key)
+        if not entries:
+            return []
+
+        moves = _game.getAllMoves()
+        result = []
+        for code, weight in entries:
+            move = findMove(moves, code)
+            if move is not None and weight > 0:
+                result.append((move, weight))
+
+        return result
+
+    def choose(self, _game):
+        """Returns book move chosen randomly by weight, or None if position is out of book"""
+        candidates = self.probe(_game)
+        if not candidates:
+            return None
+
+        point = self.random.randint(1, sum(weight for move, weight in candidates))
+        for move, weight in candidates:
+            point -= weight
+            if point <= 0:
+                return move
+
+    def _entry(self, index):
+        return ENTRY.unpack_from(self._data, len(MAGIC) + index * ENTRY.size)
+
+
+def buildBook(lines, path, max_plies=20, min_count=1):
+    """Builds book file from PGN lines, returns number of entries
+    Each position + move pair is weighted by number of games it was played in.
+    Games are read until first move not allowed by this engine's rules.
+    """
+    counts = collections.defaultdict(int)
+    for moves in pgn.readGames(lines):
+        _game = game.Game(board.MailboxBoard()).init_new()
+        for san in moves[:max_plies]:
+            try:
+                move = pgn.parseSan(_game, san)
+            except ValueError:
+                break
+
+            counts[(_game.zobrist_key, encodeMove(move))] += 1
+            _game.make_move(move)
+
+    entries = sorted((key, code, min(count, 0xFFFF)) for (key, code), count in counts.items() if count >= min_count)
+
+    with open(path, 'wb') as f:
+        f.write(MAGIC)
+        for key, code, weight in entries:
+            f.write(ENTRY.pack(key, code, weight, 0))
+
+    return len(entries)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Builds opening book from PGN file.')
+    parser.add_argument('pgn')
+    parser.add_argument('book')
+    parser.add_argument('--plies', type=int, default=20, help='moves read from each game')
+    parser.add_argument('--min-count', type=int, default=1, help='minimal games count of book move')
+    args = parser.parse_args(argv)
+
+    with open(args.pgn) as f:
+        count = buildBook(f, args.book, args.plies, args.min_count)
+
+    sys.stdout.write('%d entries written to %s\n' % (count, args.book))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
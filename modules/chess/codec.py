@@ -0,0 +1,149 @@
+"""Position codec
+Compact game encoding for HTTP API - FEN-like string extended by piece data the engine needs:
+    <placement> <side> <state> <pieces> <captures>
+placement: FEN piece placement, rank 8 first
+side: w or b - player to move
+state: + check, # checkmate, = stalemate, - none
+pieces: comma-separated ids of pieces in placement order, with ':moves_count' if it's not 0
+captures: comma-separated captured pieces - FEN letter, id and moves count, - if there are none
+
+New game:
+    rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w - Br2,Bk2,Bb2,BQ,BK,Bb1,Bk1,Br1,Bp8,... -
+"""
+import pieces
+
+
+# request format value asking for compact encoding
+FORMAT = 'compact'
+
+# FEN letter (black) -> piece type
+TYPES = {
+    'k': pieces.TypeKing,
+    'q': pieces.TypeQueen,
+    'r': pieces.TypeRook,
+    'b': pieces.TypeBishop,
+    'n': pieces.TypeKnight,
+    'p': pieces.TypePawn,
+}
+
+LETTERS = {v: k for k, v in TYPES.items()}
+
+
+def encode(game):
+    """Game -> position string"""
+    squares = game.board.squares
+
+    ranks = []
+    ids = []
+    for y in range(7, -1, -1):
+        rank = ''
+        empty = 0
+        for x in range(8):
+            piece = squares[x][y].piece
+            if not piece:
+                empty += 1
+                continue
+
+            if empty:
+                rank += str(empty)
+                empty = 0
+            rank += _letter(piece)
+            ids.append(_pieceId(piece))
+
+        if empty:
+            rank += str(empty)
+        ranks.append(rank)
+
+    captured = game.white_captures.values() + game.black_captures.values()
+    captures = [_letter(p) + _pieceId(p) for p in sorted(captured, key=lambda p: p.id)]
+
+    state = ('+' if game.is_check else '') + ('#' if game.is_checkmate else '') + ('=' if game.is_stalemate else '')
+
+    return ' '.join((
+        '/'.join(ranks),
+        'b' if game.black_moves else 'w',
+        state or '-',
+        ','.join(ids),
+        ','.join(captures) or '-',
+    ))
+
+
+def decode(game, data):
+    """Sets game state from position string, raises ValueError for invalid data"""
+    try:
+        placement, side, state, ids, captures = data.split(' ')
+        ids = ids.split(',')
+        ranks = placement.split('/')
+    except ValueError:
+        raise ValueError('Invalid position: ' + data)
+
+    if len(ranks) != 8 or side not in ('w', 'b'):
+        raise ValueError('Invalid position: ' + data)
+
+    game.board.__init__()
+    game.white_pieces = []
+    game.black_pieces = []
+
+    for y, rank in zip(range(7, -1, -1), ranks):
+        x = 0
+        for letter in rank:
+            if letter.isdigit():
+                x += int(letter)
+                continue
+
+            if x > 7 or not ids:
+                raise ValueError('Invalid position: ' + data)
+
+            piece = _piece(letter, ids.pop(0))
+            game.board_manager.initPiece(game.board, piece, (x, y), False)
+            x += 1
+
+        if x != 8:
+            raise ValueError('Invalid position: ' + data)
+
+    if ids:
+        raise ValueError('Invalid position: ' + data)
+
+    for row in game.board.squares:
+        for square in row:
+            piece = square.piece
+            if piece:
+                (game.black_pieces if piece.is_black else game.white_pieces).append(piece)
+
+    game.white_captures = {}
+    game.black_captures = {}
+    if captures != '-':
+        for token in captures.split(','):
+            piece = _piece(token[0], token[1:])
+            if piece.is_black:
+                game.white_captures[piece.id] = piece
+            else:
+                game.black_captures[piece.id] = piece
+
+    game.black_moves = side == 'b'
+    game.is_check = '+' in state
+    game.is_checkmate = '#' in state
+    game.is_stalemate = '=' in state
+
+
+def _letter(piece):
+    letter = LETTERS[piece.type]
+    return letter if piece.is_black else letter.upper()
+
+
+def _pieceId(piece):
+    if piece.moves_count:
+        return '%s:%d' % (piece.id, piece.moves_count)
+    return piece.id
+
+
+def _piece(letter, token):
+    ptype = TYPES.get(letter.lower())
+    if not ptype or not token:
+        raise ValueError('Invalid piece: ' + letter + token)
+
+    id, _, moves_count = token.partition(':')
+    piece = pieces.Piece(ptype, letter.islower(), id)
+    piece.moves_count = int(moves_count) if moves_count else 0
+
+    return piece
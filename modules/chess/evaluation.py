@@ -0,0 +1,126 @@
+"""Evaluation module
+Position score is material + piece-square tables, in centipawns, for white.
+Boards keep the score up to date incrementally (see BoardManager._indexPiece), full recompute
+is used only by checkScore.
+
+Piece-square tables are loaded from json file: piece type key (as in pieces.types_dict) -> 8 rows
+of 8 values, from white's point of view, rank 8 first (as the board is printed).
+Tables for black are mirrored vertically.
+
+Optional attack terms (ATTACKS) are computed on attack maps kept by the game (Game.getAttackMap).
+"""
+import json
+import os
+
+import attacks
+import pieces
+from modules import profiling
+
+
+PST_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'pst.json')
+
+# set to True to compare incremental score with full recompute on every evaluation
+DEBUG = False
+
+# set to True to add mobility and king safety terms, computed on attack maps
+ATTACKS = False
+
+# score of each square attacked by a color
+MOBILITY_WEIGHT = 4
+
+# penalty of each enemy attack on king and squares around it
+KING_ATTACK_WEIGHT = 10
+
+
+def loadTables(path=PST_PATH):
+    """Loads piece-square tables file, returns dict: piece type -> rows"""
+    with open(path) as f:
+        data = json.load(f)
+
+    tables = {}
+    for key, rows in data.items():
+        if len(rows) != 8 or any(len(row) != 8 for row in rows):
+            raise ValueError('Invalid piece-square table: ' + key)
+        tables[pieces.types_dict[key]] = rows
+
+    return tables
+
+
+def makeScores(tables):
+    """Piece-square tables -> scores lookup: piece type -> [white scores, black scores], indexed by y * 8 + x
+    Material is included, black scores are negative.
+    """
+    scores = {}
+    for ptype in pieces.types_dict.values():
+        rows = tables.get(ptype, [[0] * 8] * 8)
+        material = ptype.value * 100
+
+        white = [material + rows[7 - index // 8][index % 8] for index in range(64)]
+        black = [-(material + rows[index // 8][index % 8]) for index in range(64)]
+        scores[ptype] = [white, black]
+
+    return scores
+
+
+SCORES = makeScores(loadTables())
+
+
+def useTables(tables):
+    """Replaces piece-square tables. Boards filled before the call keep outdated scores."""
+    global SCORES
+    SCORES = makeScores(tables)
+
+
+def pieceScore(piece, position):
+    """Score of piece standing on position"""
+    return SCORES[piece.type][piece.is_black][position[1] * 8 + position[0]]
+
+
+def boardScore(board):
+    """Computes board score from scratch"""
+    score = 0
+    for x, row in enumerate(board.squares):
+        for y, square in enumerate(row):
+            if square.piece:
+                score += pieceScore(square.piece, (x, y))
+
+    return score
+
+
+def gameScore(game):
+    """Game score for white - incremental, checked by full recompute in DEBUG mode"""
+    if profiling.active:
+        profiling.count('evaluations')
+
+    if DEBUG:
+        checkScore(game.board)
+
+    if ATTACKS:
+        return game.board.score + attackScore(game)
+
+    return game.board.score
+
+
+def attackScore(game):
+    """Mobility and king safety score for white, from game attack maps"""
+    attack_map = game.getAttackMap()
+    score = MOBILITY_WEIGHT * (attack_map.mobility(False) - attack_map.mobility(True))
+
+    board = game.board
+    for king_pos, is_black in ((board.white_king_pos, False), (board.black_king_pos, True)):
+        if king_pos is None:
+            continue
+
+        index = attacks.squareIndex(king_pos)
+        enemy_counts = attack_map.counts[not is_black]
+        attacked = enemy_counts[index] + sum(enemy_counts[target] for target in attacks.KING_TARGETS[index])
+        score += KING_ATTACK_WEIGHT * attacked if is_black else -KING_ATTACK_WEIGHT * attacked
+
+    return score
+
+
+def checkScore(board):
+    """Debug check - incremental score has to match full recompute"""
+    expected = boardScore(board)
+    if board.score != expected:
+        raise AssertionError('Incremental score %d differs from full recompute %d' % (board.score, expected))
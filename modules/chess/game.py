@@ -1,11 +1,32 @@
 """Game module"""
 import pieces
+import attacks
 import board
+import codec
+import zobrist
+from modules import profiling
+
+
+# game status for player to move, see Game.getStatus
+ACTIVE = 'active'
+CHECK = 'check'
+CHECKMATE = 'checkmate'
+STALEMATE = 'stalemate'
+
+
+def moveIndexKey(move):
+    """Key of move in Game.getMovesIndex: (from, to, promotion type) of first piece move
+    Castling is indexed by king move.
+    """
+    start, end = move.moves[0]
+    return (tuple(start), tuple(end), move.transformation[1] if move.transformation else None)
 
 
 class Game(object):
-    """Game class"""
-    def __init__(self, gameboard=None, move_generator=None):
+    """Game class
+    Board backend is selected by gameboard - board.Board, board.BitBoard or board.MailboxBoard
+    """
+    def __init__(self, gameboard=None, move_generator=None, opening_book=None):
         self.board_manager = board.BoardManager
         self.board = gameboard
         if not self.board:
@@ -13,6 +34,9 @@ class Game(object):
 
         self.move_generator = move_generator
 
+        # book.OpeningBook, consulted before move_generator
+        self.opening_book = opening_book
+
         # pieces in game
         self.piece_list = {}
         self.white_pieces = []
@@ -26,6 +50,34 @@ class Game(object):
         self.black_moves = False
         self.is_check = False
         self.is_checkmate = False
+        self.is_stalemate = False
+
+        # legal moves of last position they were generated for, and their index
+        self._moves = None
+        self._moves_key = None
+        self._moves_index = None
+
+        # statistics of last move search, set by move generator (move_generators.report.SearchReport)
+        self.search_report = None
+
+        # attack maps, updated by make_move and unmake_move once built
+        self._attacks = None
+        self._attacks_key = None
+
+        # position key is_check was computed for by make_move - reused by legality check
+        self._check_key = None
+
+    @property
+    def score(self):
+        """Material + piece-square score for white, in centipawns - see evaluation module"""
+        return self.board.score
+
+    @property
+    def zobrist_key(self):
+        """64-bit position key - pieces, castling rights, en passant and side to move"""
+        if self.black_moves:
+            return self.board.zobrist_key ^ zobrist.BLACK_MOVES
+        return self.board.zobrist_key
 
     def init_new(self):
         """Initialize game. self.board must be present."""
@@ -103,35 +155,84 @@ class Game(object):
 
     def move(self, move=None):
         """Validates move and executes it. Returns captured pieces."""
+        self.search_report = None
+
+        if not move and self.opening_book is not None:
+            # empty destination, try opening book first
+            with profiling.timer('book'):
+                move = self.opening_book.choose(self)
+
         if not move:
             # empty destination, run move generator
-            move = self.move_generator(self)
-
-        for move_data in move.moves:
-            piece = self.board.squares[move_data[0][0]][move_data[0][1]].piece
+            with profiling.timer('generator'):
+                move = self.move_generator(self)
+
+        try:
+            key = moveIndexKey(move)
+        except (IndexError, TypeError, ValueError):
+            raise ValueError('Invalid move')
+
+        # legal move is executed - its capture and transformation are trusted
+        with profiling.timer('validation'):
+            legal_move = self.getMovesIndex().get(key)
+        if legal_move is None:
+            start = key[0]
+            piece = self.board.squares[start[0]][start[1]].piece if self.board_manager.onBoard(start) else None
             if not piece:
                 raise ValueError('Invalid start position')
             if piece.is_black != self.black_moves:
                 raise ValueError('Invaid player')
-
-            valid_moves = piece.getMoves(self.board)
-
-            valid_destinations = []
-            for valid_move in valid_moves:
-                for m in valid_move.moves:
-                    valid_destinations.append(m[1])
-
-            if not (move_data[1][0], move_data[1][1]) in valid_destinations:
-                raise ValueError('Invalid move destination')
+            raise ValueError('Invalid move destination')
+
+        undo = self.make_move(legal_move)
+
+        with profiling.timer('status'):
+            status = self.getStatus()
+        self.is_checkmate = status == CHECKMATE
+        self.is_stalemate = status == STALEMATE
+
+        return [capture[0] for capture in undo[2]]
+
+    def make_move(self, move):
+        """Executes move in place, without validation. Checkmate and stalemate flags are not updated.
+        Returns undo record for unmake_move.
+        """
+        squares = self.board.squares
+        key = self.zobrist_key
+
+        moved_types = []
+        captured = []
+        for m in move.moves:
+            moved_types.append(squares[m[0][0]][m[0][1]].piece.type)
+
+            target = squares[m[1][0]][m[1][1]].piece
+            if target:
+                captured.append((target, m[1]))
+
+        state = (
+            self.black_moves,
+            self.is_check,
+            self.is_checkmate,
+            self.is_stalemate,
+            self.board.white_king_pos,
+            self.board.black_king_pos,
+            self._check_key
+        )
 
         # captures from piece position in oponent piece position
-        captures = self.board_manager.move(self.board, move)
-        for capture in captures:
-            self.capture(capture)
+        self.board_manager.move(self.board, move)
+        captured = [(piece, pos, self._capture(piece)) for piece, pos in captured]
 
         # other captures (en passant)
+        en_passant = None
         if move.capture:
-            self.capture(move.capture)
+            piece = move.capture
+            pos = piece.position
+            if pos:
+                board_piece = squares[pos[0]][pos[1]].piece
+                if board_piece and board_piece == piece:
+                    piece = board_piece
+            en_passant = (piece, pos, self._capture(piece))
 
         # check check
         if self.black_moves:
@@ -139,22 +240,87 @@ class Game(object):
         else:
             kingpos = self.board.black_king_pos
 
-        if pieces.TypeKing.checkSafe(kingpos, self.board.squares):
+        if pieces.TypeKing.checkSafeOnBoard(kingpos, self.board):
             self.is_check = False
         else:
             self.is_check = True
 
         # switch player
         self.black_moves = not self.black_moves
-
-        # check checkmate
-        available_moves = self.getAllMoves()
-        if len(available_moves) == 0:
-            self.is_checkmate = True
+        self._check_key = self.zobrist_key
+
+        self._updateAttacks(key, move, en_passant)
+
+        return (move, moved_types, captured, en_passant, state)
+
+    def unmake_move(self, undo):
+        """Restores game state from before make_move"""
+        move, moved_types, captured, en_passant, state = undo
+        key = self.zobrist_key
+
+        self.board_manager.unmove(self.board, move, moved_types)
+
+        if en_passant:
+            self._uncapture(*en_passant)
+        for capture in reversed(captured):
+            self._uncapture(*capture)
+
+        (
+            self.black_moves,
+            self.is_check,
+            self.is_checkmate,
+            self.is_stalemate,
+            self.board.white_king_pos,
+            self.board.black_king_pos,
+            self._check_key
+        ) = state
+
+        self._updateAttacks(key, move, en_passant)
+
+    def getAttackMap(self):
+        """Returns attack maps of current position (attacks.AttackMap)
+        Maps are built on first call, then updated incrementally by make_move and unmake_move.
+        """
+        key = self.zobrist_key
+        if self._attacks is None or self._attacks_key != key:
+            self._attacks = attacks.AttackMap(self.board)
+            self._attacks_key = key
+
+        return self._attacks
+
+    def _updateAttacks(self, key, move, en_passant):
+        """Updates attack maps built for position key after move was made or unmade"""
+        if self._attacks is None:
+            return
+
+        if self._attacks_key != key:
+            # maps are outdated - position was changed other way
+            self._attacks = None
+            return
+
+        positions = [p for m in move.moves for p in m]
+        if en_passant:
+            positions.append(en_passant[1])
+
+        self._attacks.update(self.board, positions)
+        self._attacks_key = self.zobrist_key
+
+    def _capture(self, piece):
+        """Captures piece, returns its index in pieces list"""
+        index = (self.black_pieces if piece.is_black else self.white_pieces).index(piece)
+        self.capture(piece)
+        return index
+
+    def _uncapture(self, piece, pos, index):
+        if piece.is_black:
+            del self.white_captures[piece.id]
+            self.black_pieces.insert(index, piece)
         else:
-            self.is_checkmate = False
+            del self.black_captures[piece.id]
+            self.white_pieces.insert(index, piece)
 
-        return captures
+        if pos:
+            self.board_manager.initPiece(self.board, piece, pos, False)
 
     def capture(self, piece):
         if piece.is_black:
@@ -168,19 +334,89 @@ class Game(object):
             self.board_manager.removePiece(self.board, piece)
 
     def getAllMoves(self):
-        """Returns all available moves for current player"""
+        """Returns all available moves for current player
+        Moves are cached for position (zobrist key) until other position is generated.
+        """
+        return list(self._legalMoves())
+
+    def getMovesIndex(self):
+        """Returns dict of legal moves for current player, keyed by moveIndexKey
+        Index is built from getAllMoves cache, once per position.
+        """
+        moves = self._legalMoves()
+        if self._moves_index is None:
+            index = {}
+            for move in moves:
+                index.setdefault(moveIndexKey(move), move)
+            self._moves_index = index
+
+        return self._moves_index
+
+    def _legalMoves(self):
+        """Cached legal moves list"""
+        key = self.zobrist_key
+        if self._moves_key != key:
+            if profiling.active:
+                profiling.count('move_lists')
+
+            legality = self._moveLegality()
+            self._moves = legality.filter(self.getPseudoMoves())
+            self._moves_key = key
+            self._moves_index = None
+
+        return self._moves
+
+    def hasLegalMoves(self):
+        """Checks if current player can move - generation stops on first legal move"""
+        if self._moves_key == self.zobrist_key:
+            return len(self._moves) > 0
+
+        legality = self._moveLegality()
+        for piece in (self.black_pieces if self.black_moves else self.white_pieces):
+            for move in piece.getPseudoMoves(self.board):
+                if legality.isLegal(move):
+                    return True
+
+        return False
+
+    def _moveLegality(self):
+        """Legality check of current position, on attack maps if they are kept for it"""
+        key = self.zobrist_key
+        attack_map = self._attacks if self._attacks_key == key else None
+        in_check = self.is_check if self._check_key == key else None
+        return pieces.MoveLegality(self.board, self.black_moves, attack_map, in_check)
+
+    def getStatus(self):
+        """Returns status for current player: ACTIVE, CHECK, CHECKMATE or STALEMATE"""
+        if self.hasLegalMoves():
+            return CHECK if self.is_check else ACTIVE
+
+        return CHECKMATE if self.is_check else STALEMATE
+
+    def getPseudoMoves(self, captures_only=False):
+        """Returns moves for current player without kings safety check (see pieces.MoveLegality)
+        params:
+            captures_only: only captures and promotions
+        """
+        if self.board.bitboards is not None:
+            return pieces.bitboardPseudoMoves(self.board, self.black_moves, captures_only)
+
         moves = []
         for row in self.board.squares:
             for square in row:
                 if square.piece:
                     p = square.piece
                     if p.is_black == self.black_moves:
-                        for m in p.getMoves(self.board):
+                        for m in p.getPseudoMoves(self.board, captures_only):
                             moves.append(m)
 
         return moves
 
-    def serialize(self):
+    def serialize(self, compact=False):
+        """Returns game data dict, or position string if compact (see codec module)"""
+        if compact:
+            return codec.encode(self)
+
         black_captures_data = []
         white_captures_data = []
 
@@ -196,17 +432,27 @@ class Game(object):
             'black_captures':   black_captures_data,
             'white_captures':   white_captures_data,
             'is_check':         self.is_check,
-            'is_checkmate':     self.is_checkmate
+            'is_checkmate':     self.is_checkmate,
+            'is_stalemate':     self.is_stalemate
         }
 
         return data
 
     def deserialize(self, game_data):
+        """Sets game from serialize result - data dict or position string"""
+        if isinstance(game_data, basestring):
+            codec.decode(self, game_data)
+            return
+
         self.board_manager.deserialize(self.board, game_data['board']),
 
         self.black_moves = game_data['black_moves']
         self.is_check = game_data['is_check']
         self.is_checkmate = game_data['is_checkmate']
+        self.is_stalemate = game_data.get('is_stalemate', False)
+        if 'is_stalemate' not in game_data and self.is_checkmate and not self.is_check:
+            # data from before stalemate flag - checkmate flag was set on both
+            self.is_checkmate, self.is_stalemate = False, True
 
         self.black_captures = {}
         for p in game_data['black_captures']:
@@ -69,6 +69,24 @@ def make_whites_castling_long():
     return _game
 
 
+def make_whites_castling_through_check():
+    """Makes game with whites castling possibilities, short castling passes attacked square"""
+    _board = board.Board()
+    _game = game.Game(_board)
+
+    _game.init_new()
+    _game.strip()
+
+    _game.initPiece(_game.piece_list['WK'], (4, 0))
+    _game.initPiece(_game.piece_list['Wr1'], (0, 0))
+    _game.initPiece(_game.piece_list['Wr2'], (7, 0))
+
+    _game.initPiece(_game.piece_list['BK'], (4, 7))
+    _game.initPiece(_game.piece_list['Bb1'], (2, 3))
+
+    return _game
+
+
 def make_whites_enpassant():
     """Makes game with whites en passant capture possibility"""
     _board = board.Board()
@@ -0,0 +1,54 @@
+"""Mailbox module
+10x12 board array: 8x8 board surrounded by sentinel squares (two rows on top and bottom, so knight
+jumps never leave the array). Moves along offsets stop at sentinels, no bounds checks are needed.
+Array index = (y + 2) * 10 + x + 1
+"""
+
+
+class _OffBoard(object):
+    """Sentinel square content"""
+    __slots__ = ()
+
+    def __repr__(self):
+        return 'OFFBOARD'
+
+
+OFFBOARD = _OffBoard()
+
+SIZE = 120
+
+# direction offsets
+NORTH = 10
+SOUTH = -10
+EAST = 1
+WEST = -1
+
+DIRECTIONS_ORTHOGONAL = (EAST, WEST, NORTH, SOUTH)
+DIRECTIONS_DIAGONAL = (SOUTH + WEST, NORTH + WEST, SOUTH + EAST, NORTH + EAST)
+KNIGHT_OFFSETS = (-21, -19, -12, -8, 8, 12, 19, 21)
+KING_OFFSETS = DIRECTIONS_ORTHOGONAL + DIRECTIONS_DIAGONAL
+
+# pawn move direction, indexed by is_black
+PAWN_DIRECTIONS = (NORTH, SOUTH)
+
+
+def squareIndex(position):
+    """Position (x, y) -> array index"""
+    return (position[1] + 2) * 10 + position[0] + 1
+
+
+def squarePosition(index):
+    """Array index -> position (x, y)"""
+    return POSITIONS[index]
+
+
+# array index -> position (x, y), None for sentinel squares
+POSITIONS = [None] * SIZE
+for _x in range(8):
+    for _y in range(8):
+        POSITIONS[squareIndex((_x, _y))] = (_x, _y)
+
+
+def create():
+    """Empty board array"""
+    return [None if position else OFFBOARD for position in POSITIONS]
@@ -1 +1 @@
-from . import gen_rand, gen_minimax
+from . import gen_rand, gen_minimax, gen_negamax, gen_parallel, ordering, quiescence, report, transposition
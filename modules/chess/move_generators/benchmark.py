@@ -0,0 +1,77 @@
+"""Move generators benchmark
+Times generators on perft positions and reports parallel search speedup.
+
+Usage:
+    python -m modules.chess.move_generators.benchmark [--level 3] [--workers N] [--quiescence] [position ...]
+"""
+import argparse
+import sys
+import time
+
+from .. import perft
+from . import gen_negamax, gen_parallel, transposition
+
+
+def timeGenerator(generator, name):
+    """Runs generator on named position, returns tuple (seconds, move, search report)"""
+    _game = perft.makeGame(name)
+
+    start = time.time()
+    move = generator(_game)
+    return time.time() - start, move, _game.search_report
+
+
+def run(names, level, workers=None, quiescence=False, out=sys.stdout):
+    """Compares negamax and parallel negamax, returns total speedup"""
+    serial = lambda g: gen_negamax.negamaxGenerator(g, level, quiescence=quiescence)
+    parallel = lambda g: gen_parallel.parallelNegamaxGenerator(g, level, workers, quiescence)
+
+    # start pool before timing
+    gen_parallel.getPool(workers)
+
+    serial_total = parallel_total = 0
+    for name in names:
+        serial_time, serial_move, report = timeGenerator(serial, name)
+        parallel_time, parallel_move, parallel_report = timeGenerator(parallel, name)
+        serial_total += serial_time
+        parallel_total += parallel_time
+
+        same = (serial_move is None and parallel_move is None) or (
+            serial_move is not None and parallel_move is not None and
+            transposition.moveKey(serial_move) == transposition.moveKey(parallel_move)
+        )
+        out.write('%-24s serial %.3fs, parallel %.3fs, speedup %.2f, nodes %d, ebf %.2f%s\n' % (
+            name, serial_time, parallel_time, serial_time / parallel_time if parallel_time else 0,
+            report.nodes, report.branchingFactor(), '' if same else ', DIFFERENT MOVE'
+        ))
+
+    speedup = serial_total / parallel_total if parallel_total else 0
+    out.write('total: serial %.3fs, parallel %.3fs, speedup %.2f (%s workers)\n' % (
+        serial_total, parallel_total, speedup, workers or 'cpu count'
+    ))
+
+    return speedup
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmarks move generators.')
+    parser.add_argument('positions', nargs='*', help='perft position names, all by default')
+    parser.add_argument('--level', type=int, default=3)
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--quiescence', action='store_true')
+    args = parser.parse_args(argv)
+
+    for name in args.positions:
+        if name not in perft.POSITIONS:
+            parser.error('unknown position: ' + name)
+
+    try:
+        run(args.positions or sorted(perft.POSITIONS.keys()), args.level, args.workers, args.quiescence)
+    finally:
+        gen_parallel.closePools()
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
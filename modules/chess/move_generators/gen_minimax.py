@@ -1,39 +1,213 @@
-import copy
+import time
 import types
 
+from modules import profiling
 from modules.searchtree import nodes
+from . import transposition
+from . import ordering as ordering_module
+from . import report as report_module
+from . import quiescence as quiescence_module
+from .. import evaluation
+from .. import pieces as pieces_module
 
 
-def minimaxGenerator(game, level=1):
+class SearchTimeout(Exception):
+    """Search deadline passed"""
+    pass
+
+
+def minimaxGenerator(game, level=1, table=None, ordering=None, quiescence=False):
     """Minimax move generator
+    params:
+        table: transposition.TranspositionTable, optional. May be shared between searches.
+        ordering: ordering.MoveOrdering, optional. Killers and history are updated after tree traversal.
+        quiescence: leaves are evaluated by quiescence search (see quiescence module)
+    Search report is attached to game (game.search_report).
+    """
+    report = game.search_report = report_module.SearchReport('minimax')
+
+    if table is not None:
+        table.newSearch()
+        entry = table.probe(game.zobrist_key)
+        if entry is not None and entry[1] >= level and entry[3] == transposition.EXACT:
+            move = transposition.findMove(game.getAllMoves(), entry[4])
+            if move:
+                report.pv = [move]
+                report.score = entry[2]
+                report.depth = entry[1]
+                report.finish()
+                return move
+
+    init_node = _search(game, level, table, ordering, quiescence=quiescence, report=report)
+    _reportResult(report, init_node, level)
+
+    return init_node.data
+
+
+def parseTimeBudget(value, max_budget):
+    """Client time budget in milliseconds, clamped to (0, max_budget]
+    Raises ValueError for values which aren't positive numbers.
+    Returns None if max_budget is not set - search length isn't chosen by client then.
+    """
+    try:
+        budget = int(value)
+    except (TypeError, ValueError, OverflowError):
+        raise ValueError('Invalid time budget: %r' % (value,))
+
+    if budget <= 0:
+        raise ValueError('Invalid time budget: %r' % (value,))
+
+    if not max_budget:
+        return None
+
+    return min(budget, max_budget)
+
+
+def iterativeMinimaxGenerator(game, time_budget, max_level=10, table=None, ordering=None, quiescence=False):
+    """Iterative deepening minimax move generator
+    Searches levels 1, 2, 3 ... until time budget expires, returns best move of last completed level.
+    Principal variation of previous level is searched first.
+    params:
+        time_budget: milliseconds. Level 1 is always completed.
+        table: transposition.TranspositionTable, optional
+        ordering: ordering.MoveOrdering, optional
+        quiescence: leaves are evaluated by quiescence search
+    Search report is attached to game (game.search_report), with counts of all searched levels
+    and nodes of each completed level.
+    """
+    report = game.search_report = report_module.SearchReport('iterative_minimax')
+    deadline = time.time() + time_budget / 1000.0
+
+    # levels of one move search are one table generation
+    if table is not None:
+        table.newSearch()
+
+    init_node = _search(game, 1, table, ordering, quiescence=quiescence, report=report)
+    best_move = init_node.data
+    _reportResult(report, init_node, 1)
+    report.level_nodes.append(report.nodes)
+
+    for level in range(2, max_level + 1):
+        if time.time() >= deadline:
+            break
+
+        nodes = report.nodes
+        try:
+            init_node = _search(game, level, table, ordering, _principalVariation(init_node), deadline, quiescence,
+                                report)
+        except SearchTimeout:
+            break
+
+        best_move = init_node.data
+        _reportResult(report, init_node, level)
+        report.level_nodes.append(report.nodes - nodes)
+
+    report.finish()
+    return best_move
+
+
+def _search(game, level, table=None, ordering=None, pv=None, deadline=None, quiescence=False, report=None):
+    """Builds and traverses search tree, returns root node
+    Nodes, leaves and cut-offs are added to report, if given.
     """
     if game.black_moves:
         init_node = nodes.MinABNode()
     else:
         init_node = nodes.MaxABNode()
 
-    _genTreeLevel(init_node, game, level)
+    with profiling.timer('tree_build'):
+        _genTreeLevel(init_node, game, level, table=table, ordering=ordering, pv=pv, deadline=deadline,
+                      quiescence=quiescence, report=report)
 
-    init_node.traverse()
+    with profiling.timer('traverse'):
+        init_node.traverse()
 
-    return init_node.data
+    if report is not None or profiling.active:
+        cutoffs = []
+        _countCutoffs(init_node, cutoffs)
+        if report is not None:
+            report.addCutoffs(cutoffs)
+        if profiling.active:
+            profiling.count('tree_evaluations', init_node.evaluations)
+            profiling.count('cutoffs', sum(cutoffs))
+
+    if table is not None:
+        _storeTree(init_node, table)
+
+    if ordering is not None:
+        _updateOrdering(init_node, ordering)
+
+    return init_node
+
+
+def _principalVariation(node):
+    """Returns list of move keys of best line in searched tree"""
+    return [transposition.moveKey(move) for move in _principalLine(node)]
+
+
+def _principalLine(node):
+    """Returns list of moves of best line in searched tree"""
+    line = []
+    while node.nodes:
+        for child in node.nodes:
+            if child.evaluations and child.value == node.value:
+                break
+        else:
+            break
+
+        line.append(child.last_move)
+        node = child
+
+    return line
+
+
+def _reportResult(report, init_node, level):
+    """Sets result of completed search level"""
+    report.depth = level
+    report.score = init_node.value
+    report.pv = _principalLine(init_node)
+    report.finish()
 
 
-def _make_evaluation_function(game):
+def _make_evaluation_function(value):
     """Node doEvaluate method factory
+    Game is searched in place, so position value is computed while generating the tree
     """
     def evf(self):
-        self.value = _evaluateGame(game)
+        self.value = value
 
     return evf
 
 
-def _genTreeLevel(node, game, stoplevel, first_call=True):
+def _genTreeLevel(node, game, stoplevel, first_call=True, table=None, ordering=None, pv=None, deadline=None, ply=0,
+                  quiescence=False, report=None):
     if stoplevel <= 0:
         return node
 
+    if deadline is not None and time.time() >= deadline:
+        raise SearchTimeout
+
+    entry = None
+    if table is not None:
+        node.key = game.zobrist_key
+        entry = table.probe(node.key)
+
+        if entry is not None and not first_call and entry[1] >= stoplevel and entry[3] == transposition.EXACT:
+            # value is known - don't expand node
+            if report is not None:
+                report.leaves += 1
+            node.data = node.move
+            node.doEvaluate = types.MethodType(
+                _make_evaluation_function(entry[2]),
+                node
+            )
+            return node
+
+    # remaining depth, nodes with depth are stored in transposition table
+    node.depth = stoplevel
+
     node.doEvaluate = types.MethodType(
-        _make_evaluation_function(game),
+        _make_evaluation_function(_evaluateGame(game)),
         node
     )
 
@@ -42,50 +216,160 @@ def _genTreeLevel(node, game, stoplevel, first_call=True):
     else:
         pieces = game.white_pieces
 
+    # generate before searching - lists are changed by captures while searching
+    moves = [move for piece in pieces for move in piece.getPseudoMoves(game.board)]
+    moves = pieces_module.MoveLegality(game.board, game.black_moves).filter(moves)
+    if ordering is not None:
+        moves = ordering.order(moves, game.board, ply)
+
+    # search principal variation move or best move from transposition table first
+    best_move = None
+    if pv:
+        best_move = transposition.findMove(moves, pv[0])
+    if best_move is None and entry is not None:
+        best_move = transposition.findMove(moves, entry[4])
+    if best_move is not None:
+        moves.remove(best_move)
+        moves.insert(0, best_move)
+
     if isinstance(node, nodes.MinABNode):
         node_class = nodes.MaxABNode
     else:
         node_class = nodes.MinABNode
 
-    for piece in pieces:
-        for move in piece.getMoves(game.board):
-            new_game = copy.deepcopy(game)
-            new_game.move(move)
+    if profiling.active:
+        profiling.count('nodes', len(moves))
 
-            new_node = node_class()
-            node.addNode(new_node)
+    if report is not None:
+        report.nodes += len(moves)
+        if not moves:
+            report.leaves += 1
+        elif stoplevel == 1:
+            report.leaves += len(moves)
 
-            if first_call:
-                # store move to check
-                new_node.move = move
-            else:
-                # propagate move to the bottom of the tree
-                new_node.move = node.move
-
-            if stoplevel == 1:
-                # at the bottom - data is the move from first level
-                new_node.data = new_node.move
-                new_node.doEvaluate = types.MethodType(
-                    _make_evaluation_function(new_game),
-                    new_node
-                )
+    for move in moves:
+        new_node = node_class()
+        new_node.last_move = move
+        node.addNode(new_node)
+
+        if ordering is not None and ordering.isQuiet(move, game.board):
+            new_node.quiet_key = ordering_module.historyKey(move)
+
+        undo = game.make_move(move)
+
+        if first_call:
+            # store move to check
+            new_node.move = move
+        else:
+            # propagate move to the bottom of the tree
+            new_node.move = node.move
+
+        if stoplevel == 1:
+            # at the bottom - data is the move from first level
+            new_node.data = new_node.move
+            if quiescence:
+                value = quiescence_module.quiescenceScore(game, report)
             else:
-                # gen next tree level
+                value = _evaluateGame(game)
+
+            new_node.doEvaluate = types.MethodType(
+                _make_evaluation_function(value),
+                new_node
+            )
+            game.unmake_move(undo)
+        else:
+            # gen next tree level
+            try:
                 _genTreeLevel(
                     new_node,
-                    new_game,
+                    game,
                     stoplevel - 1,
-                    first_call=False
+                    first_call=False,
+                    table=table,
+                    ordering=ordering,
+                    pv=pv[1:] if pv and move is best_move else None,
+                    deadline=deadline,
+                    ply=ply + 1,
+                    quiescence=quiescence,
+                    report=report
                 )
+            finally:
+                game.unmake_move(undo)
 
 
-def _evaluateGame(game):
-    """Evaluates score - for white player
+def _storeTree(node, table):
+    """Stores values of searched nodes in transposition table
+    Bound type comes from node's alpha-beta window
     """
-    def red_func(value, piece):
-        return value + piece.type.value
+    if not hasattr(node, 'depth') or node.evaluations == 0 or node.value is None:
+        return
+
+    best_move_key = None
+    for child in node.nodes:
+        _storeTree(child, table)
 
-    value = reduce(red_func, game.white_pieces, 0)
-    value -= reduce(red_func, game.black_pieces, 0)
+        if best_move_key is None and child.evaluations and child.value == node.value:
+            best_move_key = transposition.moveKey(child.last_move)
+
+    alpha, beta = node.window
+    if node.value >= beta:
+        flag = transposition.LOWER
+    elif node.value <= alpha:
+        flag = transposition.UPPER
+    else:
+        flag = transposition.EXACT
 
-    return value
+    table.store(node.key, node.depth, node.value, flag, best_move_key)
+
+
+def _updateOrdering(node, ordering, ply=0):
+    """Registers quiet moves which caused cut-offs in searched tree"""
+    if not hasattr(node, 'depth') or node.value is None:
+        return
+
+    alpha, beta = node.window
+    if isinstance(node, nodes.MaxABNode):
+        cutoff = node.value >= beta
+    else:
+        cutoff = node.value <= alpha
+
+    last = None
+    for child in node.nodes:
+        if not child.evaluations:
+            break
+        last = child
+        _updateOrdering(child, ordering, ply + 1)
+
+    if cutoff and last is not None and hasattr(last, 'quiet_key'):
+        ordering.quietCutoff(last.quiet_key, ply, node.depth)
+
+
+def _countCutoffs(node, cutoffs, ply=0):
+    """Counts searched nodes failed out of their alpha-beta window, per ply - into cutoffs list"""
+    if not hasattr(node, 'depth') or not node.evaluations:
+        return
+
+    # min node value is None if its children were cut off (None is lower than any number)
+    alpha, beta = node.window
+    if node.value is None:
+        cutoff = True
+    elif isinstance(node, nodes.MaxABNode):
+        cutoff = node.value >= beta
+    else:
+        cutoff = node.value <= alpha
+
+    if cutoff:
+        while len(cutoffs) <= ply:
+            cutoffs.append(0)
+        cutoffs[ply] += 1
+
+    for child in node.nodes:
+        if child.evaluations:
+            _countCutoffs(child, cutoffs, ply + 1)
+
+
+def _evaluateGame(game):
+    """Evaluates score - for white player
+    Score is maintained incrementally by board, see evaluation module
+    """
+    return evaluation.gameScore(game)
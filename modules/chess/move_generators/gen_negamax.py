@@ -0,0 +1,210 @@
+from modules import profiling
+from . import quiescence as quiescence_module
+from . import report as report_module
+from . import transposition
+from .gen_minimax import _evaluateGame
+from .. import pieces
+
+
+INFINITY = float('inf')
+
+
+def negamaxGenerator(game, level=1, table=None, ordering=None, quiescence=False):
+    """Negamax move generator with alpha-beta prunning
+    Search is depth-first on one game (make/unmake), no search tree is built.
+    Moves are generated pseudo-legal, legality is checked only for moves which are searched.
+    params:
+        table: transposition.TranspositionTable, optional. May be shared between searches.
+        ordering: ordering.MoveOrdering, optional
+        quiescence: search captures and promotions at the horizon (see quiescence module)
+    Search report is attached to game (game.search_report).
+    """
+    if table is not None:
+        table.newSearch()
+
+    search = NegamaxSearch(game, table, ordering, quiescence)
+    move = search.search(level)[1]
+    game.search_report = search.report
+
+    return move
+
+
+class NegamaxSearch(object):
+    """Negamax search state
+    Scores are for side to move. Transposition table entries are stored for white (as in gen_minimax),
+    so one table may be shared by both generators.
+    Statistics of the last search are kept in report (report.SearchReport).
+    """
+    def __init__(self, game, table=None, ordering=None, quiescence=False):
+        self.game = game
+        self.table = table
+        self.ordering = ordering
+        self.quiescence = quiescence
+        self.report = report_module.SearchReport('negamax')
+
+        # ply -> principal variation from ply, collected while searching
+        self._pv = {}
+
+    def search(self, level):
+        """Searches game to level, returns tuple (score, best move)"""
+        self.report = report_module.SearchReport('negamax')
+        self._pv = {}
+
+        score, move = self._negamax(level, -INFINITY, INFINITY)
+
+        report = self.report
+        report.depth = level
+        report.score = -score if self.game.black_moves else score
+        report.pv = self._pv.get(0, [])
+        report.finish()
+
+        return score, move
+
+    def rootMoves(self):
+        """Legal moves of side to move, in search order"""
+        legality = pieces.MoveLegality(self.game.board, self.game.black_moves)
+        return [move for move in self._moves() if legality.isLegal(move)]
+
+    def _negamax(self, depth, alpha, beta, ply=0):
+        game = self.game
+        report = self.report
+        pv = self._pv
+        pv[ply] = []
+
+        if depth <= 0:
+            report.leaves += 1
+            if self.quiescence:
+                return quiescence_module.quiescence(game, alpha, beta, report), None
+            return self._evaluate(), None
+
+        key = game.zobrist_key
+        best_move_key = None
+
+        if self.table is not None:
+            entry = self.table.probe(key)
+            if entry is not None:
+                best_move_key = entry[4]
+
+                if entry[1] >= depth and ply > 0:
+                    score, flag = self._fromTable(entry[2], entry[3])
+                    if flag == transposition.EXACT:
+                        return score, None
+                    elif flag == transposition.LOWER:
+                        alpha = max(alpha, score)
+                    else:
+                        beta = min(beta, score)
+
+                    if alpha >= beta:
+                        return score, None
+
+        # window searched by children - narrowed by table bound, if any. Score outside of it
+        # is proven only as a bound.
+        alpha_window, beta_window = alpha, beta
+
+        best_score = None
+        best_move = None
+        legality = pieces.MoveLegality(game.board, game.black_moves)
+        for move in self._moves(best_move_key, ply):
+            if not legality.isLegal(move):
+                continue
+
+            if profiling.active:
+                profiling.count('nodes')
+            report.nodes += 1
+
+            undo = game.make_move(move)
+            try:
+                score = -self._negamax(depth - 1, -beta, -alpha, ply + 1)[0]
+            finally:
+                game.unmake_move(undo)
+
+            if best_score is None or score > best_score:
+                best_score = score
+                best_move = move
+
+                if score > alpha:
+                    alpha = score
+                    pv[ply] = [move] + pv.get(ply + 1, [])
+                    if alpha >= beta:
+                        # cut-off
+                        report.cutoff(ply)
+                        if profiling.active:
+                            profiling.count('cutoffs')
+                        if self.ordering is not None:
+                            self.ordering.cutoff(move, game.board, ply, depth)
+                        break
+
+        if best_move is None:
+            # no moves available
+            report.leaves += 1
+            return self._evaluate(), None
+
+        if self.table is not None:
+            if best_score <= alpha_window:
+                flag = transposition.UPPER
+            elif best_score >= beta_window:
+                flag = transposition.LOWER
+            else:
+                flag = transposition.EXACT
+
+            score, flag = self._fromTable(best_score, flag)
+            self.table.store(key, depth, score, flag, transposition.moveKey(best_move))
+
+        return best_score, best_move
+
+    def _moves(self, first_move_key=None, ply=0):
+        """Yields pseudo-legal moves for side to move, piece by piece - moves of remaining pieces
+        are not generated if search is cut off.
+        With move ordering all moves are generated and ordered first.
+        """
+        game = self.game
+        board = game.board
+
+        if self.ordering is not None:
+            moves = [move for piece in self._pieces() for move in piece.getPseudoMoves(board)]
+            moves = self.ordering.order(moves, board, ply)
+
+            first_move = transposition.findMove(moves, first_move_key)
+            if first_move is not None:
+                moves.remove(first_move)
+                moves.insert(0, first_move)
+
+            for move in moves:
+                yield move
+
+            return
+
+        first_move = None
+        if first_move_key is not None:
+            start = first_move_key[0][0][0]
+            piece = board.squares[start[0]][start[1]].piece
+            if piece and piece.is_black == game.black_moves:
+                first_move = transposition.findMove(piece.getPseudoMoves(board), first_move_key)
+                if first_move is not None:
+                    yield first_move
+
+        for piece in self._pieces():
+            for move in piece.getPseudoMoves(board):
+                if first_move is not None and transposition.moveKey(move) == first_move_key:
+                    continue
+                yield move
+
+    def _pieces(self):
+        # copy - lists are changed by captures while searching
+        return list(self.game.black_pieces if self.game.black_moves else self.game.white_pieces)
+
+    def _evaluate(self):
+        value = _evaluateGame(self.game)
+        return -value if self.game.black_moves else value
+
+    def _fromTable(self, score, flag):
+        """Converts between white score (table) and side to move score. Works both ways."""
+        if not self.game.black_moves:
+            return score, flag
+
+        if flag == transposition.LOWER:
+            flag = transposition.UPPER
+        elif flag == transposition.UPPER:
+            flag = transposition.LOWER
+
+        return -score, flag
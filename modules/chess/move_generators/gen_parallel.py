@@ -0,0 +1,147 @@
+"""Root-parallel negamax move generator
+Root moves are searched in a multiprocessing pool, each by a full-window negamax search.
+Workers receive a compact position tuple (see packGame) instead of pickled Game objects.
+"""
+import multiprocessing
+
+from .. import board, game, pieces
+from . import transposition
+from .gen_negamax import NegamaxSearch
+from .report import SearchReport
+
+
+# worker count -> pool, reused between searches
+_pools = {}
+
+
+def parallelNegamaxGenerator(game, level=2, workers=None, quiescence=False):
+    """Parallel negamax move generator
+    Returns the same move as negamaxGenerator - best score, first root move on equal scores.
+    params:
+        workers: process count, defaults to cpu count
+        quiescence: search captures and promotions at the horizon
+    Search report is attached to game (game.search_report), with counts summed over root moves.
+    """
+    report = game.search_report = SearchReport('parallel_negamax')
+    return searchRoot(game, level, workers, quiescence, report)[1]
+
+
+def searchRoot(_game, level, workers=None, quiescence=False, report=None):
+    """Searches root moves in parallel, returns tuple (score for side to move, best move)
+    params:
+        report: report.SearchReport, optional - filled with merged reports of root moves
+    """
+    moves = rootMoves(_game)
+    if not moves:
+        if report is not None:
+            report.finish()
+        return None, None
+
+    if level <= 1 or len(moves) == 1 or workers == 1:
+        results = [_searchMove(_game, move, level, quiescence) for move in moves]
+    else:
+        position = packGame(_game)
+        jobs = [(position, transposition.moveKey(move), level, quiescence) for move in moves]
+        results = getPool(workers).map(_searchJob, jobs, chunksize=1)
+
+    scores = [score for score, move_report in results]
+
+    # deterministic merge - first best in root moves order
+    best = 0
+    for i, score in enumerate(scores):
+        if score > scores[best]:
+            best = i
+
+    if report is not None:
+        report.nodes += len(moves)
+        for score, move_report in results:
+            report.merge(move_report, 1)
+
+        report.depth = level
+        report.score = -scores[best] if _game.black_moves else scores[best]
+        report.pv = [moves[best]] + results[best][1].pv
+        report.finish()
+
+    return scores[best], moves[best]
+
+
+def rootMoves(_game):
+    """Legal moves in negamax search order"""
+    return NegamaxSearch(_game).rootMoves()
+
+
+def getPool(workers=None):
+    """Returns process pool of given size, created on first use"""
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+
+    pool = _pools.get(workers)
+    if pool is None:
+        pool = _pools[workers] = multiprocessing.Pool(workers)
+
+    return pool
+
+
+def closePools():
+    for pool in _pools.values():
+        pool.terminate()
+        pool.join()
+    _pools.clear()
+
+
+def packGame(_game):
+    """Compact, picklable position: (black_moves, is_check, pieces)
+    pieces: tuple of (id, type key, is_black, x, y, moves_count), in board order
+    """
+    reverse_types_dict = {v: k for k, v in pieces.types_dict.items()}
+
+    packed = []
+    for x, row in enumerate(_game.board.squares):
+        for y, square in enumerate(row):
+            p = square.piece
+            if p:
+                packed.append((p.id, reverse_types_dict[p.type], p.is_black, x, y, p.moves_count))
+
+    return (_game.black_moves, _game.is_check, tuple(packed))
+
+
+def unpackGame(data, gameboard=None):
+    """Creates game from packGame data, on bitboard backend by default"""
+    black_moves, is_check, packed = data
+
+    _game = game.Game(gameboard or board.BitBoard())
+    for id, type_key, is_black, x, y, moves_count in packed:
+        piece = pieces.Piece(pieces.types_dict[type_key], is_black, id)
+        piece.moves_count = moves_count
+        _game.board_manager.initPiece(_game.board, piece, (x, y), False)
+        _game.piece_list[id] = piece
+
+        if is_black:
+            _game.black_pieces.append(piece)
+        else:
+            _game.white_pieces.append(piece)
+
+    _game.black_moves = black_moves
+    _game.is_check = is_check
+
+    return _game
+
+
+def _searchMove(_game, move, level, quiescence):
+    """Returns tuple (score of root move for side to move, search report of position after move)"""
+    undo = _game.make_move(move)
+    try:
+        search = NegamaxSearch(_game, quiescence=quiescence)
+        return -search.search(level - 1)[0], search.report
+    finally:
+        _game.unmake_move(undo)
+
+
+def _searchJob(job):
+    """Pool worker entry point"""
+    position, move_key, level, quiescence = job
+
+    _game = unpackGame(position)
+    move = transposition.findMove(_game.getAllMoves(), move_key)
+
+    return _searchMove(_game, move, level, quiescence)
@@ -1,9 +1,14 @@
 import random
 
+from .report import SearchReport
+
 
 def randomGenerator(game):
     """Random move generator
+    Search report is attached to game (game.search_report).
     """
+    report = game.search_report = SearchReport('random')
+
     def getRandomPieceMoves():
         if game.black_moves:
             piece = random.choice(game.black_pieces)
@@ -17,6 +22,10 @@ def randomGenerator(game):
         moves = getRandomPieceMoves()
 
     if len(moves) > 0:
-        return random.choice(moves)
+        move = random.choice(moves)
+        report.pv = [move]
+        report.finish()
+        return move
 
+    report.finish()
     return None
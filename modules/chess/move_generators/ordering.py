@@ -0,0 +1,118 @@
+"""Move ordering module
+Orders generated moves before search, so alpha-beta cut-offs come earlier.
+"""
+
+CAPTURES = 'captures'
+KILLERS = 'killers'
+HISTORY = 'history'
+
+DEFAULT_POLICY = (CAPTURES, KILLERS, HISTORY)
+
+# score ranges of ordering stages
+_CAPTURE_SCORE = 10 ** 6
+_KILLER_SCORE = 10 ** 5
+
+
+def moveVictim(move, board):
+    """Returns piece captured by move or None"""
+    end_pos = move.moves[0][1]
+    victim = board.squares[end_pos[0]][end_pos[1]].piece
+    if victim:
+        return victim
+
+    return move.capture
+
+
+def historyKey(move):
+    return (tuple(move.moves[0][0]), tuple(move.moves[0][1]))
+
+
+class MoveOrdering(object):
+    """Move ordering
+    Policy is a tuple of enabled stages. Moves are ranked by stage:
+        captures: captures and promotions by most valuable victim / least valuable attacker
+        killers: quiet moves which caused cut-off on the same ply
+        history: quiet moves which caused cut-offs anywhere, weighted by depth
+    Moves with equal score keep generation order.
+    """
+    def __init__(self, policy=DEFAULT_POLICY, killers_per_ply=2):
+        for stage in policy:
+            if stage not in DEFAULT_POLICY:
+                raise ValueError('Invalid move ordering stage: ' + str(stage))
+
+        self.policy = policy
+        self.killers_per_ply = killers_per_ply
+
+        # ply -> list of move keys, latest first
+        self.killers = {}
+
+        # (from, to) -> score
+        self.history = {}
+
+    def order(self, moves, board, ply=0):
+        """Returns new, ordered moves list"""
+        if not self.policy:
+            return list(moves)
+
+        return sorted(moves, key=lambda m: -self.score(m, board, ply))
+
+    def score(self, move, board, ply=0):
+        if CAPTURES in self.policy:
+            score = self._captureScore(move, board)
+            if score:
+                return score
+
+        if KILLERS in self.policy:
+            killers = self.killers.get(ply)
+            if killers:
+                key = historyKey(move)
+                if key in killers:
+                    return _KILLER_SCORE + self.killers_per_ply - killers.index(key)
+
+        if HISTORY in self.policy:
+            return min(self.history.get(historyKey(move), 0), _KILLER_SCORE - 1)
+
+        return 0
+
+    def isQuiet(self, move, board):
+        """Quiet moves (no capture, no promotion) are ordered by killers and history.
+        Board must be in position before move.
+        """
+        return not self._captureScore(move, board)
+
+    def cutoff(self, move, board, ply, depth):
+        """Registers move which caused cut-off. Board must be in position before move."""
+        if self.isQuiet(move, board):
+            self.quietCutoff(historyKey(move), ply, depth)
+
+    def quietCutoff(self, key, ply, depth):
+        """Registers quiet move (by historyKey) which caused cut-off"""
+        if KILLERS in self.policy:
+            killers = self.killers.setdefault(ply, [])
+            if key in killers:
+                killers.remove(key)
+            killers.insert(0, key)
+            del killers[self.killers_per_ply:]
+
+        if HISTORY in self.policy:
+            self.history[key] = self.history.get(key, 0) + depth * depth
+
+    def clear(self):
+        self.killers = {}
+        self.history = {}
+
+    def _captureScore(self, move, board):
+        victim = moveVictim(move, board)
+        if not victim and not move.transformation:
+            return 0
+
+        start_pos = move.moves[0][0]
+        attacker = board.squares[start_pos[0]][start_pos[1]].piece
+
+        score = _CAPTURE_SCORE - attacker.type.value
+        if victim:
+            score += victim.type.value * 1000
+        if move.transformation:
+            score += move.transformation[1].value * 1000
+
+        return score
@@ -0,0 +1,89 @@
+"""Quiescence search module
+At the search horizon only captures and promotions are searched, until the position is quiet,
+so the evaluation is not taken in the middle of an exchange.
+"""
+from modules import profiling
+from .. import evaluation
+from .. import pieces
+from . import ordering as ordering_module
+
+
+# delta pruning safety margin, centipawns
+DELTA_MARGIN = 200
+
+# captures are searched by most valuable victim / least valuable attacker
+_capture_ordering = ordering_module.MoveOrdering((ordering_module.CAPTURES,))
+
+
+def quiescence(game, alpha, beta, report=None):
+    """Searches captures and promotions with alpha-beta, returns score for side to move
+    Side to move may always stand pat - decline all captures and keep static evaluation.
+    Checks are not resolved.
+    params:
+        report: report.SearchReport, optional - searched captures are added to its quiescence nodes
+    """
+    stand_pat = evaluation.gameScore(game)
+    if game.black_moves:
+        stand_pat = -stand_pat
+
+    if stand_pat >= beta:
+        return stand_pat
+    if stand_pat > alpha:
+        alpha = stand_pat
+
+    board = game.board
+    moves = _capture_ordering.order(game.getPseudoMoves(captures_only=True), board)
+
+    best_score = stand_pat
+    legality = None
+    for move in moves:
+        # delta pruning - even winning captured piece doesn't reach alpha
+        if stand_pat + materialGain(move, board) + DELTA_MARGIN <= alpha:
+            continue
+
+        if legality is None:
+            legality = pieces.MoveLegality(board, game.black_moves)
+        if not legality.isLegal(move):
+            continue
+
+        if profiling.active:
+            profiling.count('quiescence_nodes')
+        if report is not None:
+            report.quiescence_nodes += 1
+
+        undo = game.make_move(move)
+        try:
+            score = -quiescence(game, -beta, -alpha, report)
+        finally:
+            game.unmake_move(undo)
+
+        if score > best_score:
+            best_score = score
+            if score > alpha:
+                alpha = score
+                if alpha >= beta:
+                    if profiling.active:
+                        profiling.count('cutoffs')
+                    break
+
+    return best_score
+
+
+def quiescenceScore(game, report=None):
+    """Quiescence search with full window, returns score for white"""
+    score = quiescence(game, -float('inf'), float('inf'), report)
+    return -score if game.black_moves else score
+
+
+def materialGain(move, board):
+    """Material won by capture or promotion, centipawns. Board must be in position before move."""
+    gain = 0
+
+    victim = ordering_module.moveVictim(move, board)
+    if victim:
+        gain += victim.type.value * 100
+
+    if move.transformation:
+        gain += (move.transformation[1].value - pieces.TypePawn.value) * 100
+
+    return gain
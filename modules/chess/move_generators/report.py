@@ -0,0 +1,88 @@
+"""Search report module
+Statistics of one move search. Generators attach report of their last search to the game
+(Game.search_report), opening book moves have no report.
+"""
+import time
+
+
+class SearchReport(object):
+    """Statistics of one search
+    nodes: positions searched below root (moves made), without quiescence search
+    leaves: positions evaluated at search horizon, or without moves
+    quiescence_nodes: captures made by quiescence search
+    cutoffs: alpha-beta cut-offs per ply, root is ply 0
+    pv: principal variation - list of moves
+    score: score of principal variation for white, centipawns
+    depth: depth of last completed search
+    level_nodes: nodes of each completed level of iterative deepening search, empty for other searches
+    elapsed: seconds
+    """
+    def __init__(self, generator):
+        self.generator = generator
+        self.nodes = 0
+        self.leaves = 0
+        self.quiescence_nodes = 0
+        self.cutoffs = []
+        self.pv = []
+        self.score = None
+        self.depth = 0
+        self.level_nodes = []
+        self.elapsed = 0.0
+
+        self._started = time.time()
+
+    def cutoff(self, ply):
+        """Registers cut-off at ply"""
+        while len(self.cutoffs) <= ply:
+            self.cutoffs.append(0)
+        self.cutoffs[ply] += 1
+
+    def addCutoffs(self, cutoffs, ply=0):
+        """Adds cut-offs per ply of search started at ply"""
+        while len(self.cutoffs) < ply + len(cutoffs):
+            self.cutoffs.append(0)
+        for i, count in enumerate(cutoffs):
+            self.cutoffs[ply + i] += count
+
+    def merge(self, report, ply=0):
+        """Adds counts of search started at ply, e.g. of root move searched by other process"""
+        self.nodes += report.nodes
+        self.leaves += report.leaves
+        self.quiescence_nodes += report.quiescence_nodes
+        self.addCutoffs(report.cutoffs, ply)
+
+    def finish(self):
+        """Stops search time, returns self"""
+        self.elapsed = time.time() - self._started
+        return self
+
+    def branchingFactor(self):
+        """Effective branching factor
+        Iterative deepening: nodes of last completed level / nodes of the level before.
+        Other searches: depth-th root of searched nodes.
+        """
+        if len(self.level_nodes) >= 2:
+            if not self.level_nodes[-2]:
+                return 0.0
+            return float(self.level_nodes[-1]) / self.level_nodes[-2]
+
+        if not self.depth or not self.nodes:
+            return 0.0
+
+        return self.nodes ** (1.0 / self.depth)
+
+    def serialize(self):
+        """Report -> dict, elapsed time in milliseconds"""
+        return {
+            'generator': self.generator,
+            'nodes': self.nodes,
+            'leaves': self.leaves,
+            'quiescence_nodes': self.quiescence_nodes,
+            'cutoffs': list(self.cutoffs),
+            'ebf': round(self.branchingFactor(), 3),
+            'pv': [move.serialize() for move in self.pv],
+            'score': self.score,
+            'depth': self.depth,
+            'level_nodes': list(self.level_nodes),
+            'elapsed': round(self.elapsed * 1000.0, 3),
+        }
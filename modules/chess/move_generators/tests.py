@@ -1,7 +1,12 @@
+import json
+import pickle
+import StringIO
 import unittest
 
-from . import gen_minimax
-from .. import board, game
+from . import benchmark, gen_minimax, gen_negamax, gen_parallel, gen_rand, ordering, quiescence, transposition
+from .report import SearchReport
+from .gen_negamax import NegamaxSearch
+from .. import board, evaluation, game, game_factory, pieces
 
 
 class MinimaxMoveGeneratorTests(unittest.TestCase):
@@ -34,3 +39,448 @@ class MinimaxMoveGeneratorTests(unittest.TestCase):
 
         move = self.generator(self.game, 2)
         self.assertNotEquals(move.moves[0][1], (4, 4))
+
+    def test_game_unchanged(self):
+        self.game.initPiece(self.game.piece_list['WK'], (4, 0))
+        self.game.initPiece(self.game.piece_list['BK'], (4, 7))
+
+        self.game.initPiece(self.game.piece_list['WQ'], (3, 3))
+        self.game.initPiece(self.game.piece_list['Bp1'], (4, 4))
+        self.game.initPiece(self.game.piece_list['Bp2'], (5, 5))
+
+        before = self.game.serialize()
+        self.generator(self.game, 3)
+        self.assertEqual(self.game.serialize(), before)
+
+
+class NegamaxMoveGeneratorTests(MinimaxMoveGeneratorTests):
+    def setUp(self):
+        super(NegamaxMoveGeneratorTests, self).setUp()
+        self.generator = gen_negamax.negamaxGenerator
+
+    def test_same_as_minimax(self):
+        for name in dir(game_factory):
+            if not name.startswith('make_'):
+                continue
+
+            for level in (1, 2, 3):
+                _game = getattr(game_factory, name)()
+                expected = gen_minimax.minimaxGenerator(_game, level)
+                move = self.generator(_game, level)
+
+                if expected is None:
+                    self.assertIsNone(move, name)
+                else:
+                    self.assertEqual(transposition.moveKey(move), transposition.moveKey(expected), name + ' ' + str(level))
+
+    def test_table(self):
+        table = transposition.TranspositionTable(2 ** 12)
+        for make in (game_factory.make_whites_check1, game_factory.make_blacks_promotion, game_factory.make_whites_promotion):
+            _game = make()
+            expected = NegamaxSearch(_game).search(3)
+            self.assertEqual(NegamaxSearch(_game, table).search(3)[0], expected[0])
+            self.assertEqual(NegamaxSearch(_game, table).search(3)[0], expected[0])
+
+            # shared with minimax
+            move = gen_minimax.minimaxGenerator(_game, 3, table)
+            self.assertEqual(transposition.moveKey(move), transposition.moveKey(gen_minimax.minimaxGenerator(_game, 3)))
+
+    def test_incremental_score(self):
+        evaluation.DEBUG = True
+        try:
+            for make in (game_factory.make_whites_promotion, game_factory.make_blacks_enpassant, game_factory.make_whites_castling_long):
+                gen_minimax.minimaxGenerator(make(), 2)
+                self.generator(make(), 3)
+        finally:
+            evaluation.DEBUG = False
+
+
+class IterativeMinimaxGeneratorTests(unittest.TestCase):
+    def setUp(self):
+        self.game = game_factory.make_whites_check1()
+
+    def test_levels(self):
+        move = gen_minimax.iterativeMinimaxGenerator(self.game, 0)
+        expected = gen_minimax.minimaxGenerator(self.game, 1)
+        self.assertEqual(transposition.moveKey(move), transposition.moveKey(expected))
+
+        move = gen_minimax.iterativeMinimaxGenerator(self.game, 60000, max_level=3)
+        expected = gen_minimax.minimaxGenerator(self.game, 3)
+        self.assertEqual(transposition.moveKey(move), transposition.moveKey(expected))
+
+    def test_timeout(self):
+        _game = game.Game().init_new()
+        before = _game.serialize()
+        key = _game.zobrist_key
+
+        move = gen_minimax.iterativeMinimaxGenerator(_game, 50, max_level=10)
+        self.assertIn(transposition.moveKey(move), [transposition.moveKey(m) for m in _game.getAllMoves()])
+
+        self.assertEqual(_game.serialize(), before)
+        self.assertEqual(_game.zobrist_key, key)
+
+    def test_time_budget(self):
+        self.assertEqual(gen_minimax.parseTimeBudget('500', 2000), 500)
+        self.assertEqual(gen_minimax.parseTimeBudget(10 ** 9, 2000), 2000)
+        self.assertEqual(gen_minimax.parseTimeBudget(1.5, 2000), 1)
+        self.assertIsNone(gen_minimax.parseTimeBudget(500, None))
+
+        for value in ('abc', '', [], {}, -100, 0, float('inf')):
+            self.assertRaises(ValueError, gen_minimax.parseTimeBudget, value, 2000)
+
+
+class TranspositionTableTests(unittest.TestCase):
+    def test_store(self):
+        table = transposition.TranspositionTable(8)
+        self.assertTrue(table.store(3, 2, 10, transposition.EXACT, 'm1'))
+        self.assertEqual(table.probe(3), (3, 2, 10, transposition.EXACT, 'm1', 0))
+        self.assertIsNone(table.probe(11))
+
+        # depth-preferred - shallower entry doesn't replace deeper one
+        self.assertFalse(table.store(11, 1, 5, transposition.LOWER))
+        self.assertIsNotNone(table.probe(3))
+        self.assertTrue(table.store(11, 2, 5, transposition.LOWER))
+        self.assertIsNone(table.probe(3))
+
+        # best move is kept for same position
+        table.store(11, 3, 7, transposition.UPPER)
+        self.assertEqual(table.probe(11)[4], None)
+        table.store(11, 3, 7, transposition.UPPER, 'm2')
+        table.store(11, 4, 8, transposition.EXACT)
+        self.assertEqual(table.probe(11), (11, 4, 8, transposition.EXACT, 'm2', 0))
+
+        self.assertEqual(len(table), 1)
+        table.clear()
+        self.assertEqual(len(table), 0)
+
+    def test_generations(self):
+        table = transposition.TranspositionTable(8)
+        table.store(3, 6, 10, transposition.EXACT, 'm1')
+        self.assertFalse(table.store(11, 1, 5, transposition.LOWER))
+
+        # deep entry of finished search doesn't block new positions
+        table.newSearch()
+        self.assertTrue(table.store(11, 1, 5, transposition.LOWER))
+        self.assertIsNone(table.probe(3))
+        self.assertEqual(table.probe(11), (11, 1, 5, transposition.LOWER, None, 1))
+
+        # depth-preferred within current generation
+        self.assertFalse(table.store(3, 0, 10, transposition.EXACT))
+
+        # generators advance generation of table
+        _game = game.Game(board.BitBoard()).init_new()
+        gen_negamax.negamaxGenerator(_game, level=1, table=table)
+        self.assertEqual(table.generation, 2)
+
+    def test_always_replace(self):
+        table = transposition.TranspositionTable(8, transposition.REPLACE_ALWAYS)
+        table.store(3, 5, 10, transposition.EXACT)
+        table.store(11, 1, 5, transposition.EXACT)
+        self.assertIsNone(table.probe(3))
+        self.assertEqual(table.probe(11)[2], 5)
+
+        self.assertRaises(ValueError, transposition.TranspositionTable, 8, 'never')
+
+    def test_minimax(self):
+        table = transposition.TranspositionTable(2 ** 12)
+        for make in (game_factory.make_whites_check1, game_factory.make_whites_promotion, game_factory.make_blacks_enpassant):
+            _game = make()
+            expected = gen_minimax.minimaxGenerator(_game, 3)
+
+            move = gen_minimax.minimaxGenerator(_game, 3, table)
+            self.assertEqual(transposition.moveKey(move), transposition.moveKey(expected))
+
+            # root position is known
+            entry = table.probe(_game.zobrist_key)
+            self.assertEqual(entry[1], 3)
+            self.assertEqual(entry[3], transposition.EXACT)
+            self.assertEqual(entry[4], transposition.moveKey(expected))
+
+            move = gen_minimax.minimaxGenerator(_game, 3, table)
+            self.assertEqual(transposition.moveKey(move), transposition.moveKey(expected))
+
+    def test_negamax_narrowed_window(self):
+        """Score failing out of window narrowed by probed bound is stored as bound"""
+        _game = game.Game(board.BitBoard()).init_new()
+        key = _game.zobrist_key
+
+        # lower bound above real score narrows alpha, search fails low
+        table = transposition.TranspositionTable(2 ** 12)
+        table.store(key, 2, 10000, transposition.LOWER)
+        score = NegamaxSearch(_game, table)._negamax(2, -gen_negamax.INFINITY, gen_negamax.INFINITY, ply=1)[0]
+        self.assertTrue(score < 10000)
+        self.assertEqual(table.probe(key)[3], transposition.UPPER)
+
+        # upper bound below real score narrows beta, search fails high
+        table = transposition.TranspositionTable(2 ** 12)
+        table.store(key, 2, -10000, transposition.UPPER)
+        score = NegamaxSearch(_game, table)._negamax(2, -gen_negamax.INFINITY, gen_negamax.INFINITY, ply=1)[0]
+        self.assertTrue(score > -10000)
+        self.assertEqual(table.probe(key)[3], transposition.LOWER)
+
+
+class MoveOrderingTests(unittest.TestCase):
+    def setUp(self):
+        self.game = game.Game(board.BitBoard())
+        self.game.init_new()
+        self.game.strip()
+
+        self.game.initPiece(self.game.piece_list['WK'], (4, 0))
+        self.game.initPiece(self.game.piece_list['BK'], (4, 7))
+        self.game.initPiece(self.game.piece_list['WQ'], (3, 3))
+        self.game.initPiece(self.game.piece_list['Wp1'], (2, 3))
+        self.game.initPiece(self.game.piece_list['Bp1'], (3, 4))
+        self.game.initPiece(self.game.piece_list['BQ'], (1, 4))
+
+    def test_invalid_policy(self):
+        self.assertRaises(ValueError, ordering.MoveOrdering, ('captures', 'foo'))
+
+    def test_captures(self):
+        moves = self.game.getAllMoves()
+        ordered = ordering.MoveOrdering().order(moves, self.game.board)
+        ends = [(m.moves[0][0], m.moves[0][1]) for m in ordered[:3]]
+
+        # queen captured by pawn, then pawn captured by pawn, then by queen
+        self.assertEqual(ends, [((2, 3), (1, 4)), ((2, 3), (3, 4)), ((3, 3), (3, 4))])
+        self.assertEqual(sorted(ordered), sorted(moves))
+
+    def test_killers_history(self):
+        move_ordering = ordering.MoveOrdering(killers_per_ply=2)
+        moves = [m for m in self.game.getAllMoves() if move_ordering.isQuiet(m, self.game.board)]
+
+        for move in moves[:3]:
+            move_ordering.cutoff(move, self.game.board, 1, 2)
+        move_ordering.cutoff(moves[5], self.game.board, 2, 3)
+
+        keys = [ordering.historyKey(m) for m in moves]
+        self.assertEqual(move_ordering.killers[1], [keys[2], keys[1]])
+        self.assertEqual(move_ordering.history[keys[0]], 4)
+        self.assertEqual(move_ordering.history[keys[5]], 9)
+
+        ordered = move_ordering.order(moves, self.game.board, 1)
+        self.assertEqual(ordered[:3], [moves[2], moves[1], moves[5]])
+
+        # captures are not registered
+        capture = ordering.MoveOrdering().order(self.game.getAllMoves(), self.game.board)[0]
+        move_ordering.clear()
+        move_ordering.cutoff(capture, self.game.board, 1, 2)
+        self.assertEqual(move_ordering.history, {})
+
+    def test_search(self):
+        for make in (game_factory.make_whites_check1, game_factory.make_blacks_promotion, game_factory.make_whites_promotion):
+            _game = make()
+            expected = NegamaxSearch(_game).search(3)[0]
+            self.assertEqual(NegamaxSearch(_game, ordering=ordering.MoveOrdering()).search(3)[0], expected)
+
+            for level in (1, 2, 3):
+                self.assertEqual(
+                    gen_minimax._search(_game, level, ordering=ordering.MoveOrdering()).value,
+                    gen_minimax._search(_game, level).value
+                )
+
+    def test_fewer_nodes(self):
+        class CountingSearch(NegamaxSearch):
+            leaves = 0
+
+            def _evaluate(self):
+                self.leaves += 1
+                return NegamaxSearch._evaluate(self)
+
+        for make in (game_factory.make_whites_check1, game_factory.make_whites_promotion):
+            plain = CountingSearch(make())
+            plain.search(3)
+            ordered = CountingSearch(make(), ordering=ordering.MoveOrdering())
+            ordered.search(3)
+            self.assertLess(ordered.leaves, plain.leaves)
+
+
+class QuiescenceTests(unittest.TestCase):
+    def setUp(self):
+        self.game = game.Game(board.BitBoard())
+        self.game.init_new()
+        self.game.strip()
+
+        self.game.initPiece(self.game.piece_list['WK'], (4, 0))
+        self.game.initPiece(self.game.piece_list['BK'], (4, 7))
+
+    def test_stand_pat(self):
+        self.game.initPiece(self.game.piece_list['WQ'], (0, 2))
+        self.assertEqual(quiescence.quiescenceScore(self.game), self.game.score)
+
+    def test_exchange(self):
+        # pawn is defended - queen would be lost
+        self.game.initPiece(self.game.piece_list['WQ'], (3, 3))
+        self.game.initPiece(self.game.piece_list['Bp1'], (4, 4))
+        self.game.initPiece(self.game.piece_list['Bp2'], (5, 5))
+
+        self.assertEqual(quiescence.quiescenceScore(self.game), self.game.score)
+
+        move = gen_minimax.minimaxGenerator(self.game, 1)
+        self.assertEqual(move.moves[0][1], (4, 4))
+
+        for generator in (gen_minimax.minimaxGenerator, gen_negamax.negamaxGenerator):
+            move = generator(self.game, 1, quiescence=True)
+            self.assertNotEqual(move.moves[0][1], (4, 4))
+
+    def test_capture(self):
+        # free pawn
+        self.game.initPiece(self.game.piece_list['WQ'], (3, 3))
+        self.game.initPiece(self.game.piece_list['Bp1'], (4, 4))
+
+        before = self.game.serialize()
+        self.assertTrue(quiescence.quiescenceScore(self.game) > self.game.score)
+        self.assertEqual(self.game.serialize(), before)
+
+    def test_same_as_minimax(self):
+        for make in (game_factory.make_whites_check1, game_factory.make_blacks_promotion, game_factory.make_whites_promotion,
+                     game_factory.make_whites_enpassant):
+            _game = make()
+            for level in (1, 2):
+                expected = gen_minimax._search(_game, level, quiescence=True).value
+                score = NegamaxSearch(_game, quiescence=True).search(level)[0]
+                self.assertEqual(-score if _game.black_moves else score, expected)
+
+
+class ParallelGeneratorTests(unittest.TestCase):
+    def tearDown(self):
+        gen_parallel.closePools()
+
+    def test_pack(self):
+        for make in (game_factory.make_whites_castling_long, game_factory.make_blacks_enpassant):
+            _game = make()
+            data = gen_parallel.packGame(_game)
+            self.assertEqual(pickle.loads(pickle.dumps(data, 2)), data)
+
+            unpacked = gen_parallel.unpackGame(data)
+            self.assertEqual(unpacked.serialize()['board'], _game.serialize()['board'])
+            self.assertEqual(unpacked.black_moves, _game.black_moves)
+            self.assertEqual(unpacked.zobrist_key, _game.zobrist_key)
+            self.assertEqual(unpacked.score, _game.score)
+
+    def test_same_as_negamax(self):
+        for make in (game_factory.make_whites_check1, game_factory.make_blacks_promotion, game_factory.make_whites_enpassant):
+            for level in (1, 2, 3):
+                _game = make()
+                expected = gen_negamax.negamaxGenerator(_game, level)
+                move = gen_parallel.parallelNegamaxGenerator(_game, level, workers=2)
+                self.assertEqual(transposition.moveKey(move), transposition.moveKey(expected))
+
+    def test_root_moves(self):
+        for make in (game_factory.make_whites_check1, game_factory.make_whites_castling_long):
+            _game = make()
+            expected = sorted(transposition.moveKey(m) for m in _game.getAllMoves())
+            self.assertEqual(sorted(transposition.moveKey(m) for m in gen_parallel.rootMoves(_game)), expected)
+
+    def test_no_moves(self):
+        self.assertIsNone(gen_parallel.parallelNegamaxGenerator(game_factory.make_whites_checkmate1(), 2, workers=2))
+
+    def test_benchmark(self):
+        out = StringIO.StringIO()
+        self.assertTrue(benchmark.run(['kings_fight'], 2, workers=2, out=out) > 0)
+        self.assertIn('speedup', out.getvalue())
+        self.assertNotIn('DIFFERENT', out.getvalue())
+
+
+class SearchReportTests(unittest.TestCase):
+    def tearDown(self):
+        gen_parallel.closePools()
+
+    def check_report(self, _game, move, name, depth):
+        report = _game.search_report
+        self.assertEqual(report.generator, name)
+        self.assertEqual(report.depth, depth)
+        self.assertTrue(report.nodes >= len(_game.getAllMoves()))
+        self.assertTrue(report.leaves > 0)
+        self.assertTrue(report.branchingFactor() > 1)
+        self.assertTrue(report.elapsed > 0)
+        self.assertEqual(len(report.pv), depth)
+        self.assertEqual(transposition.moveKey(report.pv[0]), transposition.moveKey(move))
+
+        # principal variation is legal
+        undos = []
+        for pv_move in report.pv:
+            keys = [transposition.moveKey(m) for m in _game.getAllMoves()]
+            self.assertIn(transposition.moveKey(pv_move), keys)
+            undos.append(_game.make_move(pv_move))
+        for undo in reversed(undos):
+            _game.unmake_move(undo)
+
+        data = json.loads(json.dumps(report.serialize()))
+        self.assertEqual(data['nodes'], report.nodes)
+        self.assertEqual(len(data['pv']), depth)
+
+        return report
+
+    def test_generators(self):
+        _game = game.Game(board.BitBoard()).init_new()
+        _game.move(pieces.PieceMove(((4, 1), (4, 3))))
+
+        generators = (
+            ('minimax', lambda g: gen_minimax.minimaxGenerator(g, 3, quiescence=True)),
+            ('negamax', lambda g: gen_negamax.negamaxGenerator(g, 3, quiescence=True)),
+            ('parallel_negamax', lambda g: gen_parallel.parallelNegamaxGenerator(g, 3, workers=2, quiescence=True)),
+        )
+
+        reports = []
+        for name, generator in generators:
+            move = generator(_game)
+            reports.append(self.check_report(_game, move, name, 3))
+
+        # the same search - score for white
+        self.assertEqual(len(set(r.score for r in reports)), 1)
+        self.assertTrue(all(r.quiescence_nodes > 0 for r in reports))
+
+        # cut-offs of alpha-beta searches, minimax builds the whole tree
+        minimax, negamax, parallel = reports
+        self.assertEqual(minimax.cutoffs, negamax.cutoffs)
+        self.assertTrue(minimax.nodes > negamax.nodes)
+
+    def test_parallel_merge(self):
+        _game = game_factory.make_whites_check1()
+        gen_parallel.parallelNegamaxGenerator(_game, 2, workers=1)
+        report = _game.search_report
+
+        moves = _game.getAllMoves()
+        expected = len(moves)
+        for move in moves:
+            undo = _game.make_move(move)
+            search = NegamaxSearch(_game)
+            search.search(1)
+            expected += search.report.nodes
+            _game.unmake_move(undo)
+
+        self.assertEqual(report.nodes, expected)
+
+    def test_iterative(self):
+        _game = game_factory.make_kings_fight()
+        move = gen_minimax.iterativeMinimaxGenerator(_game, 1, max_level=1)
+        self.check_report(_game, move, 'iterative_minimax', 1)
+
+    def test_iterative_branching_factor(self):
+        """Branching factor of iterative search is ratio of last two levels, not of summed nodes"""
+        _game = game_factory.make_kings_fight()
+        move = gen_minimax.iterativeMinimaxGenerator(_game, 60000, max_level=2)
+        report = self.check_report(_game, move, 'iterative_minimax', 2)
+
+        level1, level2 = report.level_nodes
+        self.assertEqual(level1, len(_game.getAllMoves()))
+        self.assertEqual(report.nodes, level1 + level2)
+        self.assertAlmostEqual(report.branchingFactor(), float(level2) / level1)
+        self.assertTrue(report.branchingFactor() < report.nodes ** 0.5 + 1)
+
+    def test_game_move(self):
+        _game = game.Game(board.BitBoard(), gen_rand.randomGenerator).init_new()
+        _game.move()
+        report = _game.search_report
+        self.assertEqual(report.generator, 'random')
+        self.assertEqual(len(report.pv), 1)
+
+        # client moves have no report
+        _game.move(_game.getAllMoves()[0])
+        self.assertIsNone(_game.search_report)
+
+    def test_cutoffs(self):
+        report = SearchReport('test')
+        report.cutoff(2)
+        report.addCutoffs([1, 2], 1)
+        self.assertEqual(report.cutoffs, [0, 1, 3])
@@ -0,0 +1,80 @@
+"""Transposition table module"""
+
+# entry bound types
+EXACT = 0
+LOWER = 1
+UPPER = 2
+
+# replacement policies
+REPLACE_DEPTH = 'depth'
+REPLACE_ALWAYS = 'always'
+
+
+def moveKey(move):
+    """Compact, piece independent move representation, stored in table entries"""
+    transformation = move.transformation[1] if move.transformation else None
+    return (tuple(tuple(tuple(p) for p in m) for m in move.moves), transformation)
+
+
+def findMove(moves, move_key):
+    """Returns move from moves list matching move_key, or None"""
+    if move_key is None:
+        return None
+
+    for move in moves:
+        if moveKey(move) == move_key:
+            return move
+
+    return None
+
+
+class TranspositionTable(object):
+    """Fixed size transposition table keyed by position hash (Game.zobrist_key)
+    Entries are tuples: (key, depth, score, flag, move_key, generation)
+    Memory is bounded by size - one entry per slot, slot is chosen by key.
+    Generation is advanced by each root search (newSearch). Depth-preferred replacement keeps
+    deeper entries of current generation only - entries of older searches are always replaced.
+    """
+    def __init__(self, size=2 ** 16, replacement=REPLACE_DEPTH):
+        if replacement not in (REPLACE_DEPTH, REPLACE_ALWAYS):
+            raise ValueError('Invalid replacement policy: ' + str(replacement))
+
+        self.size = size
+        self.replacement = replacement
+        self.entries = [None] * size
+        self.generation = 0
+
+    def probe(self, key):
+        """Returns entry for key or None"""
+        entry = self.entries[key % self.size]
+        if entry is not None and entry[0] == key:
+            return entry
+
+        return None
+
+    def store(self, key, depth, score, flag, move_key=None):
+        """Stores entry, returns False if replacement policy kept the old one"""
+        index = key % self.size
+        old = self.entries[index]
+
+        if (old is not None and self.replacement == REPLACE_DEPTH and old[1] > depth
+                and old[5] == self.generation):
+            return False
+
+        if move_key is None and old is not None and old[0] == key:
+            # keep known best move
+            move_key = old[4]
+
+        self.entries[index] = (key, depth, score, flag, move_key, self.generation)
+        return True
+
+    def newSearch(self):
+        """Starts new generation, called by generators before root search"""
+        self.generation += 1
+
+    def clear(self):
+        self.entries = [None] * self.size
+        self.generation = 0
+
+    def __len__(self):
+        return len(self.entries) - self.entries.count(None)
@@ -0,0 +1,157 @@
+"""Perft module - move generation correctness check and benchmark
+Counts leaf nodes of the legal move tree to a given depth.
+
+Usage:
+    python -m modules.chess.perft [--divide] [--board squares|bitboard|mailbox] [position] [depth]
+    python -m modules.chess.perft --check max_depth
+"""
+import argparse
+import sys
+import time
+
+from . import board, game, game_factory, pieces
+
+
+# backends by name
+BOARDS = {
+    'squares': board.Board,
+    'bitboard': board.BitBoard,
+    'mailbox': board.MailboxBoard,
+}
+
+# promotion type -> move name suffix
+PROMOTIONS = {
+    pieces.TypeQueen: 'q',
+    pieces.TypeRook: 'r',
+    pieces.TypeBishop: 'b',
+    pieces.TypeKnight: 'n',
+}
+
+
+def _new_game():
+    return game.Game().init_new()
+
+
+# position name -> (game constructor, expected leaf counts by depth)
+# Counts follow this engine's rules: promotions to queen and knight only, king can't castle
+# out of or through check, en passant is allowed while the enemy pawn has made only its first move.
+POSITIONS = {
+    'new': (_new_game, {1: 20, 2: 400, 3: 8902, 4: 197281}),
+    'whites_check1': (game_factory.make_whites_check1, {1: 2, 2: 74, 3: 1605, 4: 57589}),
+    'whites_checkmate1': (game_factory.make_whites_checkmate1, {1: 0, 2: 0}),
+    'whites_castling_short': (game_factory.make_whites_castling_short, {1: 15, 2: 66, 3: 1197, 4: 7059}),
+    'whites_castling_long': (game_factory.make_whites_castling_long, {1: 16, 2: 71, 3: 1287, 4: 7626}),
+    'whites_castling_through_check': (game_factory.make_whites_castling_through_check, {1: 23, 2: 331, 3: 8560, 4: 108759}),
+    'whites_enpassant': (game_factory.make_whites_enpassant, {1: 6, 2: 46, 3: 292, 4: 2596}),
+    'blacks_enpassant': (game_factory.make_blacks_enpassant, {1: 6, 2: 46, 3: 315, 4: 2790}),
+    'whites_promotion': (game_factory.make_whites_promotion, {1: 11, 2: 73, 3: 980, 4: 6972}),
+    'blacks_promotion': (game_factory.make_blacks_promotion, {1: 10, 2: 65, 3: 684, 4: 6255}),
+    'kings_fight': (game_factory.make_kings_fight, {1: 8, 2: 63, 3: 494, 4: 3852}),
+    'stalemate': (game_factory.make_stalemate, {1: 27, 2: 45, 3: 1097, 4: 2560}),
+}
+
+
+def makeGame(name, board_name='bitboard'):
+    """Builds position from POSITIONS on selected board backend"""
+    source = POSITIONS[name][0]()
+
+    _game = game.Game(BOARDS[board_name]())
+    _game.deserialize(source.serialize())
+    return _game
+
+
+def perft(_game, depth):
+    """Counts leaf nodes at depth, game is unchanged after call"""
+    moves = _game.getAllMoves()
+    if depth <= 1:
+        return len(moves) if depth == 1 else 1
+
+    nodes = 0
+    for move in moves:
+        undo = _game.make_move(move)
+        try:
+            nodes += perft(_game, depth - 1)
+        finally:
+            _game.unmake_move(undo)
+
+    return nodes
+
+
+def divide(_game, depth):
+    """Returns list of tuples (move, leaf nodes) - perft split by root moves"""
+    result = []
+    for move in _game.getAllMoves():
+        undo = _game.make_move(move)
+        try:
+            result.append((move, perft(_game, depth - 1)))
+        finally:
+            _game.unmake_move(undo)
+
+    return result
+
+
+def moveName(move):
+    """Coordinate notation of move, ie. e2e4, e7e8q"""
+    start, end = move.moves[0]
+    name = '%s%d%s%d' % ('abcdefgh'[start[0]], start[1] + 1, 'abcdefgh'[end[0]], end[1] + 1)
+    if move.transformation:
+        name += PROMOTIONS[move.transformation[1]]
+
+    return name
+
+
+def run(name, depth, show_divide=False, board_name='bitboard', out=sys.stdout):
+    """Runs perft on named position and prints result, returns leaf nodes count"""
+    _game = makeGame(name, board_name)
+
+    start = time.time()
+    if show_divide:
+        result = sorted((moveName(move), count) for move, count in divide(_game, depth))
+        for move_name, count in result:
+            out.write('%s: %d\n' % (move_name, count))
+        nodes = sum(count for move_name, count in result)
+    else:
+        nodes = perft(_game, depth)
+    elapsed = time.time() - start
+
+    out.write('%s depth %d: %d nodes, %.3fs, %d nodes/s\n' % (
+        name, depth, nodes, elapsed, nodes / elapsed if elapsed else 0
+    ))
+
+    return nodes
+
+
+def check(max_depth=None, board_name='bitboard', out=sys.stdout):
+    """Compares all positions with expected counts, returns list of failures (name, depth, expected, result)"""
+    failures = []
+    for name in sorted(POSITIONS.keys()):
+        for depth, expected in sorted(POSITIONS[name][1].items()):
+            if max_depth is not None and depth > max_depth:
+                continue
+
+            result = run(name, depth, board_name=board_name, out=out)
+            if result != expected:
+                out.write('  FAILED, expected %d\n' % expected)
+                failures.append((name, depth, expected, result))
+
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Counts move tree leaf nodes.')
+    parser.add_argument('position', nargs='?', default='new', choices=sorted(POSITIONS.keys()))
+    parser.add_argument('depth', nargs='?', type=int, default=3)
+    parser.add_argument('--divide', action='store_true', help='print counts per root move')
+    parser.add_argument('--board', default='bitboard', choices=sorted(BOARDS.keys()))
+    parser.add_argument('--check', type=int, metavar='MAX_DEPTH', help='compare all positions with expected counts')
+    args = parser.parse_args(argv)
+
+    if args.check is not None:
+        return 1 if check(args.check, args.board) else 0
+
+    run(args.position, args.depth, args.divide, args.board)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,97 @@
+"""PGN module
+Reads games from PGN files and resolves SAN moves to engine moves.
+"""
+import re
+
+import pieces
+
+
+SAN_PIECES = {
+    'K': pieces.TypeKing,
+    'Q': pieces.TypeQueen,
+    'R': pieces.TypeRook,
+    'B': pieces.TypeBishop,
+    'N': pieces.TypeKnight,
+}
+
+RESULTS = ('1-0', '0-1', '1/2-1/2', '*')
+
+_SAN = re.compile(r'^([KQRBN])?([a-h])?([1-8])?x?([a-h][1-8])(?:=?([QRBN]))?$')
+_CASTLING = {'O-O': 6, 'O-O-O': 2, '0-0': 6, '0-0-0': 2}
+_MOVE_NUMBER = re.compile(r'^\d+\.+')
+
+
+def readGames(lines):
+    """Yields games from PGN lines, game is list of SAN moves
+    Tags, comments, variations, NAGs and move numbers are skipped.
+    """
+    moves = []
+    depth = 0
+    for line in lines:
+        line = line.strip()
+        if depth == 0 and line.startswith('['):
+            # tag pair - game without result ends here
+            if moves:
+                yield moves
+                moves = []
+            continue
+
+        # rest of line comment
+        line = line.split(';', 1)[0]
+
+        for token in re.findall(r'[{}()]|[^\s{}()]+', line):
+            if token in ('{', '('):
+                depth += 1
+            elif token in ('}', ')'):
+                depth -= 1
+            elif depth > 0 or token.startswith('$'):
+                continue
+            elif token in RESULTS:
+                if moves:
+                    yield moves
+                moves = []
+            else:
+                token = _MOVE_NUMBER.sub('', token)
+                if token:
+                    moves.append(token)
+
+    if moves:
+        yield moves
+
+
+def parseSan(game, san):
+    """Returns legal move of game matching SAN move, raises ValueError if there is none or more"""
+    san = san.rstrip('+#!?')
+
+    moves = game.getAllMoves()
+    if san in _CASTLING:
+        found = [m for m in moves if len(m.moves) == 2 and m.moves[0][1][0] == _CASTLING[san]]
+    else:
+        match = _SAN.match(san)
+        if not match:
+            raise ValueError('Invalid SAN move: ' + san)
+
+        piece_key, from_file, from_rank, target, promotion = match.groups()
+        ptype = SAN_PIECES[piece_key] if piece_key else pieces.TypePawn
+        target = (ord(target[0]) - ord('a'), int(target[1]) - 1)
+        promotion = SAN_PIECES[promotion] if promotion else None
+
+        found = []
+        for m in moves:
+            start, end = m.moves[0]
+            if len(m.moves) != 1 or tuple(end) != target:
+                continue
+            if game.board.squares[start[0]][start[1]].piece.type is not ptype:
+                continue
+            if from_file and start[0] != ord(from_file) - ord('a'):
+                continue
+            if from_rank and start[1] != int(from_rank) - 1:
+                continue
+            if (m.transformation[1] if m.transformation else None) is not promotion:
+                continue
+            found.append(m)
+
+    if len(found) != 1:
+        raise ValueError('%s move: %s' % ('Ambiguous' if found else 'Illegal', san))
+
+    return found[0]
@@ -2,6 +2,10 @@
 
 from collections import OrderedDict
 from modules.utils import LazyDict
+from modules import profiling
+import bitboard
+import mailbox
+import tables
 
 
 # piece types dictionary
@@ -19,6 +23,9 @@ class PieceMove(object):
     One move can be 1 or 2 piece moves (castling) + one transformation (pawn at the end of the board)
     Move positions are absolute
     """
+    # many moves are generated while searching - no per instance dict
+    __slots__ = ('moves', 'transformation', 'capture')
+
     def __init__(self, *vargs):
         # move = ((from_x, from_y), (to_x, to_y))
         if vargs:
@@ -35,14 +42,6 @@ class PieceMove(object):
         # piece to capture
         self.capture = None
 
-    def rotate(self):
-        """Transforms coordinates to other player"""
-        self.moves = map(lambda m: ((7 - m[0][0], 7 - m[0][1]), (7 - m[1][0], 7 - m[1][1])), self.moves)
-        if self.transformation:
-            pos = self.transformation[0]
-            pos = (7 - pos[0], 7 - pos[1])
-            self.transformation = (pos, self.transformation[1])
-
     def serialize(self):
         reverse_types_dict = {v: k for k, v in types_dict.items()}
 
@@ -76,8 +75,81 @@ class PieceMove(object):
         return "moves: {m}, trans: {t}, cap: {c}".format(m=self.moves, t=self.transformation, c=self.capture)
 
 
+class FrozenPieceMove(PieceMove):
+    """Move without capture or transformation, shared by generated move lists - can't be changed"""
+    __slots__ = ()
+
+    def __init__(self, *vargs):
+        object.__setattr__(self, 'moves', vargs)
+        object.__setattr__(self, 'transformation', None)
+        object.__setattr__(self, 'capture', None)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('Shared move can\'t be changed')
+
+    def __delattr__(self, name):
+        raise AttributeError('Shared move can\'t be changed')
+
+    def __reduce__(self):
+        return (FrozenPieceMove, tuple(self.moves))
+
+
+# bitboard moves without capture or transformation data: [from index][to index] -> move
+BITBOARD_MOVES = [
+    [FrozenPieceMove((bitboard.POSITIONS[start], bitboard.POSITIONS[end])) for end in range(64)]
+    for start in range(64)
+]
+
+
+def bitboardMoves(index, targets):
+    """Shared moves from square index to set bits of targets, lowest bit first"""
+    row = BITBOARD_MOVES[index]
+    moves = []
+    while targets:
+        low = targets & -targets
+        moves.append(row[low.bit_length() - 1])
+        targets ^= low
+
+    return moves
+
+
+def bitboardPseudoMoves(board, is_black, captures_only=False):
+    """Moves of all pieces of color on bitboards, pieces in bit index order
+    Occupancy masks are computed once for all pieces.
+    """
+    bitboards = board.bitboards
+    squares = board.squares
+    occupied = bitboards.colors[0] | bitboards.colors[1]
+    own = bitboards.colors[is_black]
+    if captures_only:
+        targets_mask = bitboards.colors[not is_black]
+    else:
+        targets_mask = ~own
+
+    moves = []
+    while own:
+        low = own & -own
+        own ^= low
+        index = low.bit_length() - 1
+
+        x, y = bitboard.POSITIONS[index]
+        piece = squares[x][y].piece
+        ptype = piece.type
+        if ptype is TypeKnight:
+            moves.extend(bitboardMoves(index, bitboard.KNIGHT_ATTACKS[index] & targets_mask))
+        elif ptype in RAY_TABLES:
+            targets = bitboard.rayAttacks(index, occupied, RAY_TABLES[ptype])
+            moves.extend(bitboardMoves(index, targets & targets_mask))
+        else:
+            moves.extend(ptype.getBitboardMoves(piece, board, captures_only))
+
+    return moves
+
+
 class Piece(object):
     """Base piece class"""
+    __slots__ = ('id', 'type', 'is_black', 'moves_count', 'position')
+
     def __init__(self, type, is_black, id=None):
         super(Piece, self).__init__()
 
@@ -91,17 +163,33 @@ class Piece(object):
         """Returns available moves offsets
         Returned moves are absolute
         """
+        # filter by kings safety
+        return filter(
+            lambda m: TypeKing.checkSafeAfterMoveOnBoard(m, board) and (
+                len(m.moves) == 1 or TypeKing.checkSafeCastling(m, board)),
+            self.getPseudoMoves(board)
+        )
+
+    def getPseudoMoves(self, board, captures_only=False):
+        """Returns moves without kings safety check (see MoveLegality)
+        Returned moves are absolute
+        params:
+            captures_only: only captures and promotions (quiescence search)
+        """
         if self.position is None:
             return []
 
-        if self.is_black:
-            moves = self.type.getMoves(self, (7 - self.position[0], 7 - self.position[1]), board.squares_reversed)
-            map(lambda m: m.rotate(), moves)
-        else:
-            moves = self.type.getMoves(self, self.position, board.squares)
+        if board.bitboards is not None:
+            return self.type.getBitboardMoves(self, board, captures_only)
+
+        if board.mailbox is not None:
+            return self.type.getMailboxMoves(self, board, captures_only)
+
+        moves = self.type.getMoves(self, self.position, board.squares)
+
+        if captures_only:
+            moves = filter(lambda m: m.capture or m.transformation or board.squares[m.moves[0][1][0]][m.moves[0][1][1]].piece, moves)
 
-        # filter by kings safety
-        moves = filter(lambda m: TypeKing.checkSafeAfterMove(m, board), moves)
         return moves
 
     def serialize(self):
@@ -148,26 +236,84 @@ class TypeBishop(object):
     @staticmethod
     def getMoves(piece, position, squares):
         """One+ square in each diagonal direction"""
+        return [PieceMove((position, p)) for p in TypeBishop.getRayTargets(piece, tables.RAYS_DIAGONAL[position[0]][position[1]], squares)]
+
+    @staticmethod
+    def getRayTargets(piece, rays, squares):
+        """Squares reachable along rays (from tables module)"""
         position_list = []
-        for i in range(-1, 2, 2):
-            for j in range(-1, 2, 2):
-                for d in range(1, 8):
-                    x, y = position[0] + i * d, position[1] + j * d
+        for ray in rays:
+            for x, y in ray:
+                o = squares[x][y].piece
+                if o:
+                    if o.is_black != piece.is_black:
+                        position_list.append((x, y))
+                    break
 
-                    if max(x, y) > 7 or min(x, y) < 0:
-                        break
+                position_list.append((x, y))
 
-                    o = squares[x][y].piece
-                    if o:
-                        if o.is_black == piece.is_black:
-                            break
-                        else:
-                            position_list.append((x, y))
-                            break
+        return position_list
 
-                    position_list.append((x, y))
+    @staticmethod
+    def targetsMask(piece, bitboards, captures_only=False):
+        """Squares piece may move to: opponent pieces only or all but own pieces"""
+        if captures_only:
+            return bitboards.colors[not piece.is_black]
+        return ~bitboards.colors[piece.is_black]
 
-        return [PieceMove((position, p)) for p in position_list]
+    @staticmethod
+    def getBitboardMoves(piece, board, captures_only=False):
+        bitboards = board.bitboards
+        index = bitboard.squareIndex(piece.position)
+        targets = bitboard.rayAttacks(index, bitboards.colors[0] | bitboards.colors[1], bitboard.RAYS_DIAGONAL)
+
+        return bitboardMoves(index, targets & TypeBishop.targetsMask(piece, bitboards, captures_only))
+
+    @staticmethod
+    def getMailboxRayMoves(piece, board, directions, captures_only=False):
+        """Moves along mailbox offsets, stopping at first piece or sentinel"""
+        position = piece.position
+        mb = board.mailbox
+        start = mailbox.squareIndex(position)
+        positions = mailbox.POSITIONS
+
+        moves = []
+        for direction in directions:
+            i = start + direction
+            o = mb[i]
+            while o is None:
+                if not captures_only:
+                    moves.append(PieceMove((position, positions[i])))
+                i += direction
+                o = mb[i]
+
+            if o is not mailbox.OFFBOARD and o.is_black != piece.is_black:
+                moves.append(PieceMove((position, positions[i])))
+
+        return moves
+
+    @staticmethod
+    def getMailboxStepMoves(piece, board, offsets, captures_only=False):
+        """Moves by single mailbox offsets (knight, king)"""
+        position = piece.position
+        mb = board.mailbox
+        start = mailbox.squareIndex(position)
+        positions = mailbox.POSITIONS
+
+        moves = []
+        for offset in offsets:
+            o = mb[start + offset]
+            if o is None:
+                if not captures_only:
+                    moves.append(PieceMove((position, positions[start + offset])))
+            elif o is not mailbox.OFFBOARD and o.is_black != piece.is_black:
+                moves.append(PieceMove((position, positions[start + offset])))
+
+        return moves
+
+    @staticmethod
+    def getMailboxMoves(piece, board, captures_only=False):
+        return TypeBishop.getMailboxRayMoves(piece, board, mailbox.DIRECTIONS_DIAGONAL, captures_only)
 
 
 class TypeRook(object):
@@ -178,32 +324,19 @@ class TypeRook(object):
     @staticmethod
     def getMoves(piece, position, squares):
         """Horizontal + vertical moves"""
-        position_list = []
-        for i in range(4):
-            for d in range(1, 8):
-                if i == 0:
-                    x, y = position[0] + d, position[1]
-                elif i == 1:
-                    x, y = position[0] - d, position[1]
-                elif i == 2:
-                    x, y = position[0], position[1] + d
-                else:
-                    x, y = position[0], position[1] - d
-
-                if max(x, y) > 7 or min(x, y) < 0:
-                    break
+        return [PieceMove((position, p)) for p in TypeBishop.getRayTargets(piece, tables.RAYS_ORTHOGONAL[position[0]][position[1]], squares)]
 
-                o = squares[x][y].piece
-                if o:
-                    if o.is_black == piece.is_black:
-                        break
-                    else:
-                        position_list.append((x, y))
-                        break
+    @staticmethod
+    def getBitboardMoves(piece, board, captures_only=False):
+        bitboards = board.bitboards
+        index = bitboard.squareIndex(piece.position)
+        targets = bitboard.rayAttacks(index, bitboards.colors[0] | bitboards.colors[1], bitboard.RAYS_ORTHOGONAL)
 
-                position_list.append((x, y))
+        return bitboardMoves(index, targets & TypeBishop.targetsMask(piece, bitboards, captures_only))
 
-        return [PieceMove((position, p)) for p in position_list]
+    @staticmethod
+    def getMailboxMoves(piece, board, captures_only=False):
+        return TypeBishop.getMailboxRayMoves(piece, board, mailbox.DIRECTIONS_ORTHOGONAL, captures_only)
 
 
 class TypeQueen(object):
@@ -215,6 +348,20 @@ class TypeQueen(object):
     def getMoves(piece, position, squares):
         return TypeRook.getMoves(piece, position, squares) + TypeBishop.getMoves(piece, position, squares)
 
+    @staticmethod
+    def getBitboardMoves(piece, board, captures_only=False):
+        bitboards = board.bitboards
+        index = bitboard.squareIndex(piece.position)
+        targets = bitboard.rayAttacks(index, bitboards.colors[0] | bitboards.colors[1], bitboard.RAYS_ALL)
+
+        return bitboardMoves(index, targets & TypeBishop.targetsMask(piece, bitboards, captures_only))
+
+    @staticmethod
+    def getMailboxMoves(piece, board, captures_only=False):
+        return TypeBishop.getMailboxRayMoves(
+            piece, board, mailbox.DIRECTIONS_ORTHOGONAL + mailbox.DIRECTIONS_DIAGONAL, captures_only
+        )
+
 
 class TypeKnight(object):
     """Knight"""
@@ -225,24 +372,23 @@ class TypeKnight(object):
     def getMoves(piece, position, squares):
         """L moves"""
         position_list = []
-        offsets = [(1, 2), (2, 1), (2, -1), (1, -2), (-1, -2), (-2, -1), (-2, 1), (-1, 2)]
-        for offset in offsets:
-            x, y = position[0] + offset[0], position[1] + offset[1]
+        for x, y in tables.KNIGHT_TARGETS[position[0]][position[1]]:
+            o = squares[x][y].piece
+            if not o or o.is_black != piece.is_black:
+                position_list.append((x, y))
 
-            if max(x, y) > 7 or min(x, y) < 0:
-                continue
+        return [PieceMove((position, p)) for p in position_list]
 
-            o = squares[x][y].piece
-            if o:
-                if o.is_black == piece.is_black:
-                    continue
-                else:
-                    position_list.append((x, y))
-                    continue
+    @staticmethod
+    def getBitboardMoves(piece, board, captures_only=False):
+        index = bitboard.squareIndex(piece.position)
+        targets = bitboard.KNIGHT_ATTACKS[index] & TypeBishop.targetsMask(piece, board.bitboards, captures_only)
 
-            position_list.append((x, y))
+        return bitboardMoves(index, targets)
 
-        return [PieceMove((position, p)) for p in position_list]
+    @staticmethod
+    def getMailboxMoves(piece, board, captures_only=False):
+        return TypeBishop.getMailboxStepMoves(piece, board, mailbox.KNIGHT_OFFSETS, captures_only)
 
 
 class TypePawn(object):
@@ -252,86 +398,167 @@ class TypePawn(object):
 
     @staticmethod
     def getMoves(piece, position, squares):
+        """Moves forward (up for white, down for black), captures diagonally forward"""
+        x, y = position
+        if piece.is_black:
+            direction, rank = -1, 7 - y
+        else:
+            direction, rank = 1, y
+
         moves = []
-        offsets = [(0, 1)]
-        # if first move - may be 2 squares
-        if piece.moves_count == 0 and position[1] == 1:
-            offsets.append((0, 2))
 
-        for offset in offsets:
-            x, y = position[0] + offset[0], position[1] + offset[1]
+        def add(target):
+            if rank == 6:
+                # promotion
+                for t in (TypeQueen, TypeKnight):
+                    move = PieceMove((position, target))
+                    move.transformation = (target, t)
+                    moves.append(move)
+            else:
+                moves.append(PieceMove((position, target)))
 
-            if max(x, y) > 7 or min(x, y) < 0:
-                continue
+        # one square, if first move - may be 2 squares
+        pushes = tables.PAWN_PUSHES[piece.is_black][x][y]
+        if piece.moves_count != 0:
+            pushes = pushes[:1]
 
+        for tx, ty in pushes:
             # if first offset is blocked - stop
-            if squares[x][y].piece:
+            if squares[tx][ty].piece:
                 break
-
-            if position[1] == 6:
-                # promotion
-                types = (TypeQueen, TypeKnight)
-                for t in types:
-                    move = PieceMove((position, (x, y)))
-                    move.transformation = ((x, y), t)
-                    moves.append(move)
-            else:
-                moves.append(PieceMove((position, (x, y))))
+            add((tx, ty))
 
         # check attacks
-        attacks = [(1, 1), (-1, 1)]
-        for attack in attacks:
-            x, y = position[0] + attack[0], position[1] + attack[1]
+        for tx, ty in tables.PAWN_ATTACKS[piece.is_black][x][y]:
+            o = squares[tx][ty].piece
+            if o and o.is_black != piece.is_black:
+                add((tx, ty))
+
+        # en passant
+        if rank == 4:
+            for ox, oy in tables.NEIGHBOURS_HORIZONTAL[x][y]:
+                o = squares[ox][oy].piece
+                if not o or o.is_black == piece.is_black:
+                    continue
+                if o.type != TypePawn or o.moves_count != 1:
+                    continue
 
-            if max(x, y) > 7 or min(x, y) < 0:
-                continue
+                move = PieceMove((position, (ox, oy + direction)))
+                move.capture = o
+                moves.append(move)
 
-            o = squares[x][y].piece
-            if not o or o.is_black == piece.is_black:
-                continue
+        return moves
 
-            if position[1] == 6:
-                # promotion
-                types = (TypeQueen, TypeKnight)
-                for t in types:
-                    move = PieceMove((position, (x, y)))
-                    move.transformation = ((x, y), t)
+    @staticmethod
+    def getBitboardMoves(piece, board, captures_only=False):
+        """Same rules as getMoves, on bitboards"""
+        bitboards = board.bitboards
+        x, y = piece.position
+        if piece.is_black:
+            direction, rank = -1, 7 - y
+        else:
+            direction, rank = 1, y
+
+        occupied = bitboards.colors[0] | bitboards.colors[1]
+        position = piece.position
+        index = y * 8 + x
+        moves = []
+
+        # one square, if first move - may be 2 squares
+        pushes = tables.PAWN_PUSHES[piece.is_black][x][y]
+        if piece.moves_count != 0:
+            pushes = pushes[:1]
+        if captures_only and rank != 6:
+            # only promotions
+            pushes = []
+
+        # target indexes - pushes, then attacks
+        targets = []
+        for tx, ty in pushes:
+            target = ty * 8 + tx
+            if occupied & (1 << target):
+                break
+            targets.append(target)
+
+        targets.extend(bitboard.bits(bitboard.PAWN_ATTACKS[piece.is_black][index] & bitboards.colors[not piece.is_black]))
+
+        if rank == 6:
+            # promotion
+            for i in targets:
+                target = bitboard.POSITIONS[i]
+                for t in (TypeQueen, TypeKnight):
+                    move = PieceMove((position, target))
+                    move.transformation = (target, t)
                     moves.append(move)
-            else:
-                moves.append(PieceMove((position, (x, y))))
+        else:
+            row = BITBOARD_MOVES[index]
+            moves = [row[i] for i in targets]
 
         # en passant
-        if position[1] == 4:
-            opponent_positions = [(1, 0), (-1, 0)]
-            for op in opponent_positions:
-                x, y = position[0] + op[0], position[1] + op[1]
-
-                if max(x, y) > 7 or min(x, y) < 0:
+        if rank == 4:
+            opponent_pawns = bitboards.get(TypePawn, not piece.is_black)
+            for ox, oy in tables.NEIGHBOURS_HORIZONTAL[x][y]:
+                if not opponent_pawns & bitboard.squareBit((ox, oy)):
                     continue
 
-                o = squares[x][y].piece
-                if not o or o.is_black == piece.is_black:
-                    continue
-                if o.type != TypePawn or o.moves_count != 1:
+                o = board.squares[ox][oy].piece
+                if o.moves_count != 1:
                     continue
 
-                move = PieceMove((position, (x, y + 1)))
+                move = PieceMove((position, (ox, oy + direction)))
                 move.capture = o
                 moves.append(move)
 
-        # promotion
-        # if position[1] == 6:
-        #     x, y = position[0], position[1] + 1
+        return moves
 
-        #     if max(x, y) <= 7 and min(x, y) >= 0:
-        #         o = squares[x][y].piece
-        #         if not o:
-        #             # promotion available
-        #             types = (TypeQueen, TypeKnight)
-        #             for t in types:
-        #                 move = PieceMove((position, (x, y)))
-        #                 move.transformation = ((x, y), t)
-        #                 moves.append(move)
+    @staticmethod
+    def getMailboxMoves(piece, board, captures_only=False):
+        """Same rules as getMoves, on mailbox"""
+        mb = board.mailbox
+        positions = mailbox.POSITIONS
+        position = piece.position
+        start = mailbox.squareIndex(position)
+        direction = mailbox.PAWN_DIRECTIONS[piece.is_black]
+        rank = 7 - position[1] if piece.is_black else position[1]
+        moves = []
+
+        def add(i):
+            target = positions[i]
+            if rank == 6:
+                # promotion
+                for t in (TypeQueen, TypeKnight):
+                    move = PieceMove((position, target))
+                    move.transformation = (target, t)
+                    moves.append(move)
+            else:
+                moves.append(PieceMove((position, target)))
+
+        # one square, if first move - may be 2 squares
+        if not captures_only or rank == 6:
+            i = start + direction
+            if mb[i] is None:
+                add(i)
+                if rank == 1 and piece.moves_count == 0 and mb[i + direction] is None:
+                    add(i + direction)
+
+        # attacks
+        for i in (start + direction - 1, start + direction + 1):
+            o = mb[i]
+            if o is not None and o is not mailbox.OFFBOARD and o.is_black != piece.is_black:
+                add(i)
+
+        # en passant
+        if rank == 4:
+            for i in (start + mailbox.WEST, start + mailbox.EAST):
+                o = mb[i]
+                if o is None or o is mailbox.OFFBOARD or o.is_black == piece.is_black:
+                    continue
+                if o.type is not TypePawn or o.moves_count != 1:
+                    continue
+
+                move = PieceMove((position, positions[i + direction]))
+                move.capture = o
+                moves.append(move)
 
         return moves
 
@@ -347,53 +574,109 @@ class TypeKing(object):
     def getMoves(piece, position, squares):
         """One square in each direction"""
         position_list = []
-        for i in range(-1, 2):
-            for j in range(-1, 2):
-                if i == j == 0:
-                    continue
-
-                x, y = position[0] + i, position[1] + j
-                if max(x, y) > 7 or min(x, y) < 0:
-                    continue
-
-                o = squares[x][y].piece
-                if o and o.is_black != piece.is_black:
-                    position_list.append((x, y))
-                elif not o:
-                    position_list.append((x, y))
+        for x, y in tables.KING_TARGETS[position[0]][position[1]]:
+            o = squares[x][y].piece
+            if not o or o.is_black != piece.is_black:
+                position_list.append((x, y))
 
         moves = [PieceMove((position, p)) for p in position_list]
 
-        # castling
+        # castling - squares are mirrored for black, so black short castling is on queen's side
         if piece.moves_count == 0:
+            if piece.is_black:
+                rel = lambda x: (7 - x, 7)
+            else:
+                rel = lambda x: (x, 0)
+            at = lambda x: squares[rel(x)[0]][rel(x)[1]].piece
+
             # castling - short
-            rook = squares[7][0].piece
+            rook = at(7)
             if rook and rook.type == TypeRook and rook.moves_count == 0:
-                free_pass = True
-                for i in [5, 6]:
-                    if squares[i][0].piece:
-                        free_pass = False
-                        break
+                if not at(5) and not at(6):
+                    moves.append(PieceMove(
+                        (position, rel(6)),
+                        (rel(7), rel(5))
+                    ))
+
+            # castling - long
+            rook = at(0)
+            if rook and rook.type == TypeRook and rook.moves_count == 0:
+                if not at(1) and not at(2) and not at(3):
+                    moves.append(PieceMove(
+                        (position, rel(2)),
+                        (rel(0), rel(3))
+                    ))
+
+        return moves
+
+    @staticmethod
+    def getBitboardMoves(piece, board, captures_only=False):
+        """Same rules as getMoves, on bitboards"""
+        position = piece.position
+        index = bitboard.squareIndex(position)
+        moves = bitboardMoves(index, bitboard.KING_ATTACKS[index] & TypeBishop.targetsMask(piece, board.bitboards, captures_only))
+
+        # castling
+        if piece.moves_count == 0 and not captures_only:
+            if piece.is_black:
+                rel = lambda x: (7 - x, 7)
+            else:
+                rel = lambda x: (x, 0)
+
+            squares = board.squares
+            occupied = board.bitboards.colors[0] | board.bitboards.colors[1]
 
-                if free_pass:
+            # castling - short
+            rook = squares[rel(7)[0]][rel(7)[1]].piece
+            if rook and rook.type == TypeRook and rook.moves_count == 0:
+                if not occupied & (bitboard.squareBit(rel(5)) | bitboard.squareBit(rel(6))):
                     moves.append(PieceMove(
-                        (position, (6, 0)),
-                        ((7, 0), (5, 0))
+                        (position, rel(6)),
+                        (rel(7), rel(5))
                     ))
 
             # castling - long
-            rook = squares[0][0].piece
+            rook = squares[rel(0)[0]][rel(0)[1]].piece
             if rook and rook.type == TypeRook and rook.moves_count == 0:
-                free_pass = True
-                for i in range(1, 4):
-                    if squares[i][0].piece:
-                        free_pass = False
-                        break
+                if not occupied & (bitboard.squareBit(rel(1)) | bitboard.squareBit(rel(2)) | bitboard.squareBit(rel(3))):
+                    moves.append(PieceMove(
+                        (position, rel(2)),
+                        (rel(0), rel(3))
+                    ))
+
+        return moves
+
+    @staticmethod
+    def getMailboxMoves(piece, board, captures_only=False):
+        """Same rules as getMoves, on mailbox"""
+        position = piece.position
+        moves = TypeBishop.getMailboxStepMoves(piece, board, mailbox.KING_OFFSETS, captures_only)
+
+        # castling
+        if piece.moves_count == 0 and not captures_only:
+            mb = board.mailbox
+            if piece.is_black:
+                rel = lambda x: (7 - x, 7)
+            else:
+                rel = lambda x: (x, 0)
+            at = lambda x: mb[mailbox.squareIndex(rel(x))]
 
-                if free_pass:
+            # castling - short
+            rook = at(7)
+            if rook and rook.type == TypeRook and rook.moves_count == 0:
+                if at(5) is None and at(6) is None:
+                    moves.append(PieceMove(
+                        (position, rel(6)),
+                        (rel(7), rel(5))
+                    ))
+
+            # castling - long
+            rook = at(0)
+            if rook and rook.type == TypeRook and rook.moves_count == 0:
+                if at(1) is None and at(2) is None and at(3) is None:
                     moves.append(PieceMove(
-                        (position, (2, 0)),
-                        ((0, 0), (3, 0))
+                        (position, rel(2)),
+                        (rel(0), rel(3))
                     ))
 
         return moves
@@ -408,56 +691,34 @@ class TypeKing(object):
         king_is_black = king.is_black
 
         # check diagonals + orthogonals
-        for i in range(-1, 2):
-            for j in range(-1, 2):
-                for d in range(1, 8):
-                    x, y = position[0] + i * d, position[1] + j * d
-
-                    # stay on board
-                    if max(x, y) > 7 or min(x, y) < 0:
-                        break
-
+        for rays, threats in (
+            (tables.RAYS_DIAGONAL[position[0]][position[1]], TypeKing.threats_diagonal),
+            (tables.RAYS_ORTHOGONAL[position[0]][position[1]], TypeKing.threats_orthogonal)
+        ):
+            for ray in rays:
+                for x, y in ray:
                     o = squares[x][y].piece
                     if o:
-                        if o.is_black == king_is_black:
-                            # friendly piece, no threat from this direction
-                            break
-                        elif d == 1 and o.type == TypeKing:
+                        if o.is_black != king_is_black and o.type in threats:
                             return False
-                        elif o.type in TypeKing.threats_diagonal and abs(i) == abs(j):
-                            return False
-                        elif o.type in TypeKing.threats_orthogonal and abs(i) != abs(j):
-                            return False
-                        else:
-                            # non threatening foe
-                            break
 
-        # check knights
-        knight_offsets = [(1, 2), (2, 1), (2, -1), (1, -2), (-1, -2), (-2, -1), (-2, 1), (-1, 2)]
-        for offset in knight_offsets:
-            x, y = position[0] + offset[0], position[1] + offset[1]
+                        # friendly piece or non threatening foe
+                        break
 
-            # stay on board
-            if max(x, y) > 7 or min(x, y) < 0:
-                continue
+        # check king
+        for x, y in tables.KING_TARGETS[position[0]][position[1]]:
+            o = squares[x][y].piece
+            if o and o.type == TypeKing and o.is_black != king_is_black:
+                return False
 
+        # check knights
+        for x, y in tables.KNIGHT_TARGETS[position[0]][position[1]]:
             o = squares[x][y].piece
             if o and o.type == TypeKnight and o.is_black != king_is_black:
                 return False
 
         # check pawns
-        if king_is_black:
-            pawns_offsets = [(1, -1), (-1, -1)]
-        else:
-            pawns_offsets = [(1, 1), (-1, 1)]
-
-        for offset in pawns_offsets:
-            x, y = position[0] + offset[0], position[1] + offset[1]
-
-            # stay on board
-            if max(x, y) > 7 or min(x, y) < 0:
-                continue
-
+        for x, y in tables.PAWN_ATTACKS[king_is_black][position[0]][position[1]]:
             o = squares[x][y].piece
             if o and o.type == TypePawn and o.is_black != king_is_black:
                 return False
@@ -518,5 +779,326 @@ class TypeKing(object):
         # done
         return result
 
+    @staticmethod
+    def checkSafeAfterMoveOnBoard(move, board):
+        """Checks king safety after move using board's bitboards if available"""
+        if board.bitboards is not None:
+            return TypeKing.checkSafeAfterMoveBitboard(move, board)
+
+        if board.mailbox is not None:
+            return TypeKing.checkSafeAfterMoveMailbox(move, board)
+
+        return TypeKing.checkSafeAfterMove(move, board)
+
+    @staticmethod
+    def checkSafeCastling(move, board):
+        """Castling rule: king may not castle out of check or pass through attacked square
+        King target square is tested by checkSafeAfterMove.
+        """
+        start, end = move.moves[0]
+        if not TypeKing.checkSafeOnBoard(start, board):
+            return False
+
+        step = 1 if end[0] > start[0] else -1
+        for x in range(start[0] + step, end[0], step):
+            if not TypeKing.checkSafeAfterMoveOnBoard(PieceMove((start, (x, start[1]))), board):
+                return False
+
+        return True
+
+    @staticmethod
+    def getPins(position, squares):
+        """Finds pieces pinned to king standing on position
+        Returns dict: pinned piece position -> set of positions it may move to (ray to pinning piece)
+        """
+        king_is_black = squares[position[0]][position[1]].piece.is_black
+
+        pins = {}
+        for rays, threats in (
+            (tables.RAYS_DIAGONAL[position[0]][position[1]], TypeKing.threats_diagonal),
+            (tables.RAYS_ORTHOGONAL[position[0]][position[1]], TypeKing.threats_orthogonal)
+        ):
+            for ray in rays:
+                blocker = None
+                for i, (x, y) in enumerate(ray):
+                    o = squares[x][y].piece
+                    if not o:
+                        continue
+
+                    if blocker is None and o.is_black == king_is_black:
+                        blocker = (x, y)
+                        continue
+
+                    if blocker is not None and o.is_black != king_is_black and o.type in threats:
+                        pins[blocker] = frozenset(ray[:i + 1])
+
+                    break
+
+        return pins
+
+    @staticmethod
+    def checkSafeOnBoard(position, board):
+        """Checks king safety using board's bitboards or mailbox if available"""
+        if board.bitboards is None and board.mailbox is None:
+            return TypeKing.checkSafe(position, board.squares)
+
+        king = board.squares[position[0]][position[1]].piece
+        if not king or king.type is not TypeKing:
+            raise ValueError('Invalid king position')
+
+        if board.mailbox is not None:
+            return TypeKing.checkSafeMailbox(position, king.is_black, board.mailbox)
+
+        return TypeKing.checkSafeBitboard(position, king.is_black, board.bitboards, board.bitboards.occupied())
+
+    @staticmethod
+    def checkSafeBitboard(position, king_is_black, bitboards, occupied, captured=0):
+        """Checks if square is not attacked by opponent of king_is_black
+        params:
+            occupied: occupancy mask to use for sliding attacks
+            captured: mask of squares on which opponent pieces are considered captured
+        """
+        index = bitboard.squareIndex(position)
+        opponent = not king_is_black
+        keep = ~captured
+
+        if bitboard.KNIGHT_ATTACKS[index] & bitboards.get(TypeKnight, opponent) & keep:
+            return False
+        if bitboard.KING_ATTACKS[index] & bitboards.get(TypeKing, opponent) & keep:
+            return False
+        if bitboard.PAWN_ATTACKS[king_is_black][index] & bitboards.get(TypePawn, opponent) & keep:
+            return False
+
+        queens = bitboards.get(TypeQueen, opponent)
+        diagonal = (bitboards.get(TypeBishop, opponent) | queens) & keep
+        if diagonal and bitboard.rayAttacks(index, occupied, bitboard.RAYS_DIAGONAL) & diagonal:
+            return False
+
+        orthogonal = (bitboards.get(TypeRook, opponent) | queens) & keep
+        if orthogonal and bitboard.rayAttacks(index, occupied, bitboard.RAYS_ORTHOGONAL) & orthogonal:
+            return False
+
+        return True
+
+    @staticmethod
+    def checkSafeAfterMoveBitboard(move, board):
+        """checkSafeAfterMove on bitboards - move is applied on occupancy masks only"""
+        start_pos = move.moves[0][0]
+        piece = board.squares[start_pos[0]][start_pos[1]].piece
+
+        # init king color and position
+        if piece.type is TypeKing:
+            kingpos = move.moves[0][1]
+        elif piece.is_black:
+            kingpos = board.black_king_pos
+        else:
+            kingpos = board.white_king_pos
+
+        # no king on board
+        if kingpos is None:
+            return True
+
+        # fake move
+        vacated = 0
+        filled = 0
+        for m in move.moves:
+            vacated |= bitboard.squareBit(m[0])
+            filled |= bitboard.squareBit(m[1])
+
+        occupied = (board.bitboards.occupied() & ~vacated) | filled
+
+        return TypeKing.checkSafeBitboard(kingpos, piece.is_black, board.bitboards, occupied, filled)
+
+    @staticmethod
+    def checkSafeMailbox(position, king_is_black, mb):
+        """Checks if square is not attacked by opponent of king_is_black, on mailbox array"""
+        start = mailbox.squareIndex(position)
+        offboard = mailbox.OFFBOARD
+
+        # check diagonals + orthogonals
+        for directions, threats in (
+            (mailbox.DIRECTIONS_DIAGONAL, TypeKing.threats_diagonal),
+            (mailbox.DIRECTIONS_ORTHOGONAL, TypeKing.threats_orthogonal)
+        ):
+            for direction in directions:
+                i = start + direction
+                o = mb[i]
+                while o is None:
+                    i += direction
+                    o = mb[i]
+
+                if o is not offboard and o.is_black != king_is_black and o.type in threats:
+                    return False
+
+        # check kings and knights
+        for offsets, threat in ((mailbox.KING_OFFSETS, TypeKing), (mailbox.KNIGHT_OFFSETS, TypeKnight)):
+            for offset in offsets:
+                o = mb[start + offset]
+                if o is not None and o is not offboard and o.type is threat and o.is_black != king_is_black:
+                    return False
+
+        # check pawns
+        forward = start + mailbox.PAWN_DIRECTIONS[king_is_black]
+        for i in (forward - 1, forward + 1):
+            o = mb[i]
+            if o is not None and o is not offboard and o.type is TypePawn and o.is_black != king_is_black:
+                return False
+
+        return True
+
+    @staticmethod
+    def checkSafeAfterMoveMailbox(move, board):
+        """checkSafeAfterMove on mailbox - move is applied on the array only"""
+        start_pos = move.moves[0][0]
+        piece = board.squares[start_pos[0]][start_pos[1]].piece
+
+        # init king color and position
+        if piece.type is TypeKing:
+            kingpos = move.moves[0][1]
+        elif piece.is_black:
+            kingpos = board.black_king_pos
+        else:
+            kingpos = board.white_king_pos
+
+        # no king on board
+        if kingpos is None:
+            return True
+
+        # fake move
+        mb = board.mailbox
+        backup = []
+        for _from, _to in move.moves:
+            _from = mailbox.squareIndex(_from)
+            _to = mailbox.squareIndex(_to)
+            backup.append((_to, mb[_to]))
+            backup.append((_from, mb[_from]))
+
+            mb[_to] = mb[_from]
+            mb[_from] = None
+
+        result = TypeKing.checkSafeMailbox(kingpos, piece.is_black, mb)
+
+        # revert move
+        for i, o in reversed(backup):
+            mb[i] = o
+
+        return result
+
+
+class MoveLegality(object):
+    """Lazy legality check of pseudo-legal moves for one side, valid while position is unchanged
+    Check and pins are computed once per position, full king safety test is used only
+    for king moves, pinned pieces (moves leaving the pin ray) and positions in check.
+    With attack maps of the position (attacks.AttackMap) check and king moves are tested on maps.
+    in_check: check state of the position if it's known (e.g. computed by Game.make_move)
+    """
+    def __init__(self, board, is_black, attack_map=None, in_check=None):
+        self.board = board
+        self.is_black = is_black
+        self.attack_map = attack_map
+        self.king_pos = board.black_king_pos if is_black else board.white_king_pos
+        self.in_check = False
+        self.pins = {}
+
+        if self.king_pos is not None:
+            self.king_pos = tuple(self.king_pos)
+            king = board.squares[self.king_pos[0]][self.king_pos[1]].piece
+            if not king or king.type is not TypeKing:
+                # outdated king position - full test for every move, as in Piece.getMoves
+                self.in_check = True
+                self.attack_map = None
+            elif in_check is not None:
+                self.in_check = in_check
+            elif attack_map is not None:
+                self.in_check = attack_map.isAttacked(self.king_pos, not is_black)
+            else:
+                self.in_check = not TypeKing.checkSafeOnBoard(self.king_pos, board)
+
+            if not self.in_check:
+                self.pins = TypeKing.getPins(self.king_pos, board.squares)
+
+    def isLegal(self, move):
+        """Checks if pseudo-legal move leaves own king safe"""
+        if profiling.active:
+            profiling.count('legality_checks')
+
+        if self.king_pos is None:
+            return True
+
+        start_pos = tuple(move.moves[0][0])
+        if start_pos == self.king_pos:
+            if len(move.moves) > 1:
+                return self._isCastlingLegal(move)
+
+            if self.attack_map is not None and not self.in_check:
+                # king is not on any attack ray - attacks on target are not changed by the move
+                return not self.attack_map.isAttacked(move.moves[0][1], not self.is_black)
+
+            return TypeKing.checkSafeAfterMoveOnBoard(move, self.board)
+
+        if self.in_check:
+            return TypeKing.checkSafeAfterMoveOnBoard(move, self.board)
+
+        ray = self.pins.get(start_pos)
+        if ray is None:
+            return True
+
+        return tuple(move.moves[0][1]) in ray
+
+    def _isCastlingLegal(self, move):
+        if self.in_check:
+            return False
+
+        if self.attack_map is None:
+            return TypeKing.checkSafeCastling(move, self.board) and TypeKing.checkSafeAfterMoveOnBoard(move, self.board)
+
+        start, end = move.moves[0]
+        step = 1 if end[0] > start[0] else -1
+        for x in range(start[0] + step, end[0] + step, step):
+            if self.attack_map.isAttacked((x, start[1]), not self.is_black):
+                return False
+
+        return True
+
+    def filter(self, moves):
+        """Returns legal moves from pseudo-legal moves list
+        Out of check only king moves and moves of pinned pieces are tested.
+        """
+        if self.king_pos is None or self.in_check:
+            return [move for move in moves if self.isLegal(move)]
+
+        if profiling.active:
+            profiling.count('legality_checks', len(moves))
+
+        king_x, king_y = self.king_pos
+        pins = self.pins
+        legal = []
+        for move in moves:
+            start = move.moves[0][0]
+            if start[0] == king_x and start[1] == king_y:
+                if len(move.moves) > 1:
+                    if not self._isCastlingLegal(move):
+                        continue
+                elif self.attack_map is not None:
+                    if self.attack_map.isAttacked(move.moves[0][1], not self.is_black):
+                        continue
+                elif not TypeKing.checkSafeAfterMoveOnBoard(move, self.board):
+                    continue
+            elif pins:
+                ray = pins.get(tuple(start))
+                if ray is not None and tuple(move.moves[0][1]) not in ray:
+                    continue
+
+            legal.append(move)
+
+        return legal
+
+
+# sliding piece type -> bitboard ray tables
+RAY_TABLES = {
+    TypeBishop: bitboard.RAYS_DIAGONAL,
+    TypeRook: bitboard.RAYS_ORTHOGONAL,
+    TypeQueen: bitboard.RAYS_ALL,
+}
 
 types_dict.load()
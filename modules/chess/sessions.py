@@ -0,0 +1,228 @@
+"""Game sessions module
+Server-side store of games between requests, keyed by game id.
+Stores implement SessionStore: MemoryStore keeps live games in process (LRU, TTL and size cap),
+FileStore pickles them into a directory shared by workers on one host.
+"""
+import collections
+import copy
+import cPickle as pickle
+import os
+import re
+import tempfile
+import threading
+import time
+import uuid
+
+from modules import profiling
+from .move_generators import transposition
+
+
+# transposition table size of one session
+TABLE_SIZE = 2 ** 12
+
+_ID = re.compile(r'^[0-9a-f]{32}$')
+
+
+def createStore(config):
+    """Returns store configured by app config, or None if sessions are disabled
+    config keys:
+        CHESS_SESSIONS: enables sessions
+        CHESS_SESSIONS_DIR: FileStore directory, MemoryStore is used if not set
+        CHESS_SESSIONS_SIZE: most sessions kept
+        CHESS_SESSIONS_TTL: seconds from last request to expiry
+    """
+    if not config.get('CHESS_SESSIONS'):
+        return None
+
+    size = config.get('CHESS_SESSIONS_SIZE', 1000)
+    ttl = config.get('CHESS_SESSIONS_TTL', 3600)
+    if config.get('CHESS_SESSIONS_DIR'):
+        return FileStore(config['CHESS_SESSIONS_DIR'], size, ttl)
+
+    return MemoryStore(size, ttl)
+
+
+class Session(object):
+    """Game kept between requests, with its search caches"""
+    def __init__(self, game, id=None):
+        self.id = id or uuid.uuid4().hex
+        self.game = game
+        self.table = transposition.TranspositionTable(TABLE_SIZE)
+
+        # held by request between MemoryStore get and set
+        self.lock = threading.Lock()
+
+    def __getstate__(self):
+        # move generator and opening book are set by request handler, caches are rebuilt
+        profiling.count('game_copies')
+        game = copy.copy(self.game)
+        game.move_generator = None
+        game.opening_book = None
+        game.search_report = None
+
+        return {'id': self.id, 'game': game}
+
+    def __setstate__(self, state):
+        self.__init__(state['game'], state['id'])
+
+
+class SessionStore(object):
+    """Sessions backend interface"""
+
+    def get(self, id):
+        """Returns session for game id, None if it doesn't exist or has expired"""
+        raise NotImplementedError()
+
+    def set(self, session):
+        """Stores session, called after each request changing its game"""
+        raise NotImplementedError()
+
+    def release(self, session):
+        """Gives up session got by failed request, without storing it"""
+        pass
+
+    def delete(self, id):
+        raise NotImplementedError()
+
+
+class MemoryStore(SessionStore):
+    """In-process store of live sessions
+    Sessions expire ttl seconds after last use, least recently used are evicted above max_size.
+    Requests of one game are serialized - get waits for session lock, set or release frees it.
+    """
+    def __init__(self, max_size=1000, ttl=3600, clock=time.time):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.clock = clock
+
+        # id -> (session, expiry time), least recently used first
+        self._sessions = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def get(self, id):
+        with self._lock:
+            item = self._sessions.pop(id, None)
+            if item is None:
+                return None
+
+            session, expires = item
+            now = self.clock()
+            if expires <= now:
+                return None
+
+            self._sessions[id] = (session, now + self.ttl)
+
+        # waits for other request of this game, outside of store lock
+        session.lock.acquire()
+        return session
+
+    def set(self, session):
+        # new session isn't locked, nobody else can get it before it's stored
+        locked = session.lock.locked()
+
+        with self._lock:
+            now = self.clock()
+            self._sessions.pop(session.id, None)
+            self._sessions[session.id] = (session, now + self.ttl)
+
+            # expired sessions are the least recently used ones
+            while self._sessions:
+                id, (oldest, expires) = next(self._sessions.iteritems())
+                if expires > now and len(self._sessions) <= self.max_size:
+                    break
+                del self._sessions[id]
+
+        if locked:
+            session.lock.release()
+
+    def release(self, session):
+        session.lock.release()
+
+    def delete(self, id):
+        with self._lock:
+            self._sessions.pop(id, None)
+
+
+class FileStore(SessionStore):
+    """Store of pickled sessions in directory, may be shared by worker processes
+    Sessions expire ttl seconds after last write, oldest are removed above max_size.
+    Search caches are not stored.
+    """
+    def __init__(self, directory, max_size=1000, ttl=3600, clock=time.time):
+        self.directory = directory
+        self.max_size = max_size
+        self.ttl = ttl
+        self.clock = clock
+
+        self._purged = None
+
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def get(self, id):
+        path = self._path(id)
+        if path is None:
+            return None
+
+        try:
+            if os.path.getmtime(path) + self.ttl <= self.clock():
+                self.delete(id)
+                return None
+
+            with open(path, 'rb') as f:
+                return pickle.load(f)
+        except (IOError, OSError, EOFError, pickle.UnpicklingError):
+            return None
+
+    def set(self, session):
+        path = self._path(session.id)
+        if path is None:
+            raise ValueError('Invalid session id: ' + str(session.id))
+
+        # written to temporary file first - readers never see partial data
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(session, f, 2)
+        os.rename(temp_path, path)
+
+        now = self.clock()
+        os.utime(path, (now, now))
+        if self._purged is None or now - self._purged > self.ttl / 10.0:
+            self._purged = now
+            self.purge()
+
+    def delete(self, id):
+        path = self._path(id)
+        if path is not None and os.path.exists(path):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def purge(self):
+        """Removes expired sessions, and the oldest ones above max_size"""
+        files = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.session'):
+                path = os.path.join(self.directory, name)
+                try:
+                    files.append((os.path.getmtime(path), path))
+                except OSError:
+                    pass
+
+        files.sort(reverse=True)
+        expired = self.clock() - self.ttl
+        for i, (mtime, path) in enumerate(files):
+            if mtime <= expired or i >= self.max_size:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def _path(self, id):
+        if not isinstance(id, basestring) or not _ID.match(id):
+            return None
+        return os.path.join(self.directory, id + '.session')
@@ -0,0 +1,456 @@
+"""Endgame tablebase module
+Distance to mate tables for KQK, KRK and KPK, built by retrograde analysis.
+Tables are stored with the strong side as white; positions with black strong side are probed
+with colors swapped and board flipped on y. Castling rights are not part of tables.
+
+Table entry is one byte per position: 0 - draw (or invalid position), n > 0 - mate in n - 1 plies,
+won for side to move if n - 1 is odd, lost if it's even.
+Tables file: MAGIC, then for each table - header (name, size, compressed size) and zlib compressed entries.
+
+Usage (builder):
+    python -m modules.chess.tablebase tablebase.bin
+"""
+import argparse
+import collections
+import struct
+import sys
+import zlib
+
+from . import pieces, tables
+from .move_generators.report import SearchReport
+
+
+MAGIC = 'SPWCTB01'
+HEADER = struct.Struct('>4sII')
+
+# most pieces (kings included) in position covered by tables
+MAX_PIECES = 3
+
+# piece type of strong side -> table name
+NAMES = {
+    pieces.TypeQueen: 'KQK',
+    pieces.TypeRook: 'KRK',
+    pieces.TypePawn: 'KPK',
+}
+
+# piece types which can't mate alone
+DRAWN_TYPES = (pieces.TypeBishop, pieces.TypeKnight)
+
+# probe results
+WIN = 1
+DRAW = 0
+LOSS = -1
+
+# loaded tablebases by path, one set per process
+_tablebases = {}
+
+
+def _squares(positions):
+    return [y * 8 + x for x, y in positions]
+
+
+KING_TARGETS = [_squares(tables.KING_TARGETS[sq % 8][sq // 8]) for sq in range(64)]
+PAWN_ATTACKS = [_squares(tables.PAWN_ATTACKS[False][sq % 8][sq // 8]) for sq in range(64)]
+RAYS = {
+    'Q': [[_squares(ray) for ray in tables.RAYS_ORTHOGONAL[sq % 8][sq // 8] + tables.RAYS_DIAGONAL[sq % 8][sq // 8]]
+          for sq in range(64)],
+    'R': [[_squares(ray) for ray in tables.RAYS_ORTHOGONAL[sq % 8][sq // 8]] for sq in range(64)],
+}
+
+ADJACENT = [[False] * 64 for _sq in range(64)]
+for _sq in range(64):
+    for _target in KING_TARGETS[_sq]:
+        ADJACENT[_sq][_target] = True
+
+# board symmetries: square -> square
+SYMMETRIES = []
+for _transpose in (False, True):
+    for _flip_x in (False, True):
+        for _flip_y in (False, True):
+            _symmetry = []
+            for _sq in range(64):
+                _x, _y = _sq % 8, _sq // 8
+                if _transpose:
+                    _x, _y = _y, _x
+                if _flip_x:
+                    _x = 7 - _x
+                if _flip_y:
+                    _y = 7 - _y
+                _symmetry.append(_y * 8 + _x)
+            SYMMETRIES.append(_symmetry)
+
+# white king squares in pawnless tables: a1-d1-d4 triangle
+TRIANGLE = [0, 1, 2, 3, 9, 10, 11, 18, 19, 27]
+
+# square -> tuples (triangle index, symmetry) for symmetries moving it into triangle
+TRIANGLE_SYMMETRIES = [[(TRIANGLE.index(s[_sq]), s) for s in SYMMETRIES if s[_sq] in TRIANGLE] for _sq in range(64)]
+
+MIRROR_X = SYMMETRIES[2]
+
+
+def squareIndex(position, flip=False):
+    """Position (x, y) -> square index, optionally flipped on y"""
+    x, y = position
+    if flip:
+        y = 7 - y
+    return y * 8 + x
+
+
+class Table(object):
+    """Positions indexing and moves for one material set
+    Position is tuple (white king, black king, white piece, black to move) of square indexes.
+    """
+    def __init__(self, name):
+        self.name = name
+        self.piece = name[1]
+
+        if self.piece == 'P':
+            self.size = 24 * 64 * 64 * 2
+        else:
+            self.size = len(TRIANGLE) * 64 * 64 * 2
+            self.between = self._between()
+
+    def index(self, wk, bk, sq, btm):
+        """Position -> table index, positions equal by symmetry share index"""
+        if self.piece == 'P':
+            if sq % 8 > 3:
+                wk, bk, sq = MIRROR_X[wk], MIRROR_X[bk], MIRROR_X[sq]
+            return (((sq // 8 - 1) * 4 + sq % 8) * 4096 + wk * 64 + bk) * 2 + btm
+
+        return min(((king * 64 + s[bk]) * 64 + s[sq]) * 2 + btm for king, s in TRIANGLE_SYMMETRIES[wk])
+
+    def position(self, index):
+        """Table index -> position"""
+        index, btm = divmod(index, 2)
+        if self.piece == 'P':
+            pawn, wk, bk = index // 4096, index // 64 % 64, index % 64
+            return wk, bk, (pawn // 4 + 1) * 8 + pawn % 4, btm
+
+        king, bk, sq = index // 4096, index // 64 % 64, index % 64
+        return TRIANGLE[king], bk, sq, btm
+
+    def positions(self):
+        """Yields tuples (index, position) of valid positions, one per index"""
+        for index in xrange(self.size):
+            wk, bk, sq, btm = position = self.position(index)
+            if self.isValid(wk, bk, sq, btm) and self.index(wk, bk, sq, btm) == index:
+                yield index, position
+
+    def isValid(self, wk, bk, sq, btm):
+        if wk == bk or wk == sq or bk == sq or ADJACENT[wk][bk]:
+            return False
+        if self.piece == 'P' and not 8 <= sq < 56:
+            return False
+        # side which moved can't be in check
+        return btm or not self.attacked(bk, wk, sq)
+
+    def attacked(self, target, wk, sq):
+        """Is target attacked by white - black king is not a blocker"""
+        if ADJACENT[wk][target]:
+            return True
+        if target == sq:
+            return False
+        if self.piece == 'P':
+            return target in PAWN_ATTACKS[sq]
+
+        between = self.between[sq][target]
+        return between is not None and wk not in between
+
+    def blackMoves(self, wk, bk, sq):
+        """Yields black king targets, None for capture of white piece"""
+        for target in KING_TARGETS[bk]:
+            if ADJACENT[wk][target]:
+                continue
+            if target == sq:
+                yield None
+            elif not self.attacked(target, wk, sq):
+                yield target
+
+    def whiteMoves(self, wk, bk, sq):
+        """Yields white piece targets, without promotions"""
+        if self.piece == 'P':
+            if sq + 8 not in (wk, bk) and sq < 48:
+                yield sq + 8
+                if sq < 16 and sq + 16 not in (wk, bk):
+                    yield sq + 16
+            return
+
+        for ray in RAYS[self.piece][sq]:
+            for target in ray:
+                if target == wk or target == bk:
+                    break
+                yield target
+
+    def predecessors(self, index):
+        """Yields indexes of positions from which position at index is reached by one move"""
+        wk, bk, sq, btm = self.position(index)
+
+        if not btm:
+            # black king moved
+            for source in KING_TARGETS[bk]:
+                if source != wk and source != sq and not ADJACENT[wk][source]:
+                    yield self.index(wk, source, sq, True)
+            return
+
+        # white king moved
+        for source in KING_TARGETS[wk]:
+            if source != bk and source != sq and not ADJACENT[bk][source] and not self.attacked(bk, source, sq):
+                yield self.index(source, bk, sq, False)
+
+        # white piece moved
+        if self.piece == 'P':
+            sources = []
+            if sq >= 16 and sq - 8 not in (wk, bk):
+                sources.append(sq - 8)
+                if 24 <= sq < 32 and sq - 16 not in (wk, bk):
+                    sources.append(sq - 16)
+        else:
+            sources = self.whiteMoves(wk, bk, sq)
+
+        for source in sources:
+            if not self.attacked(bk, wk, source):
+                yield self.index(wk, bk, source, False)
+
+    def _between(self):
+        """[from][to] -> set of squares between, None if squares are not on piece ray"""
+        between = [[None] * 64 for _sq in range(64)]
+        for sq in range(64):
+            for ray in RAYS[self.piece][sq]:
+                for i, target in enumerate(ray):
+                    between[sq][target] = frozenset(ray[:i])
+
+        return between
+
+
+def buildTable(name, solved=None):
+    """Solves table by retrograde analysis, returns entries bytearray
+    params:
+        solved: dict name -> entries of tables already built, KQK is needed for KPK promotions
+    """
+    table = Table(name)
+    values = bytearray(table.size)
+
+    # positions to settle, by ply
+    plies = collections.defaultdict(list)
+
+    queens = Table('KQK')
+    for index, (wk, bk, sq, btm) in table.positions():
+        if btm:
+            if not any(True for target in table.blackMoves(wk, bk, sq)) and table.attacked(bk, wk, sq):
+                # checkmate
+                plies[0].append(index)
+        elif table.piece == 'P' and sq >= 48 and sq + 8 not in (wk, bk):
+            # promotion to queen, mates are seeded from KQK
+            value = solved['KQK'][queens.index(wk, bk, sq + 8, True)]
+            if value and (value - 1) % 2 == 0:
+                plies[value].append(index)
+
+    ply = 0
+    while plies:
+        for index in plies.pop(ply, ()):
+            if values[index]:
+                continue
+            values[index] = ply + 1
+
+            for previous in table.predecessors(index):
+                if values[previous]:
+                    continue
+
+                if index % 2:
+                    # black lost - white wins by any move here
+                    plies[ply + 1].append(previous)
+                elif _blackLost(table, values, previous):
+                    plies[ply + 1].append(previous)
+
+        ply += 1
+
+    return values
+
+
+def _blackLost(table, values, index):
+    """Are all black moves in position at index lost"""
+    wk, bk, sq, btm = table.position(index)
+    for target in table.blackMoves(wk, bk, sq):
+        if target is None or not values[table.index(wk, target, sq, False)]:
+            return False
+
+    return True
+
+
+def buildTables(path):
+    """Builds all tables into file, returns dict name -> entries"""
+    solved = {}
+    for name in ('KQK', 'KRK', 'KPK'):
+        solved[name] = buildTable(name, solved)
+
+    with open(path, 'wb') as f:
+        f.write(MAGIC)
+        for name in ('KQK', 'KRK', 'KPK'):
+            data = zlib.compress(str(solved[name]), 9)
+            f.write(HEADER.pack(name, len(solved[name]), len(data)))
+            f.write(data)
+
+    return solved
+
+
+def getTablebase(path):
+    """Returns tablebase for path, shared in process. File is read on first probe."""
+    tablebase = _tablebases.get(path)
+    if tablebase is None:
+        tablebase = _tablebases[path] = Tablebase(path)
+
+    return tablebase
+
+
+def tablebaseGenerator(game, tablebase, generator, max_pieces=MAX_PIECES):
+    """Move generator playing tablebase moves in positions with at most max_pieces pieces
+    Other positions are searched by generator, which attaches its search report.
+    """
+    if len(game.white_pieces) + len(game.black_pieces) <= max_pieces:
+        report = SearchReport('tablebase')
+        move = tablebase.bestMove(game)
+        if move is not None:
+            # all moves are probed one ply deep
+            report.nodes = report.leaves = len(game.getAllMoves())
+            report.depth = 1
+            report.pv = [move]
+            game.search_report = report.finish()
+            return move
+
+    return generator(game)
+
+
+class Tablebase(object):
+    """Tables file reader"""
+    def __init__(self, path):
+        self.path = path
+        self._tables = None
+        self._entries = None
+
+    def _load(self):
+        entries = {}
+        with open(self.path, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError('Invalid tablebase file: ' + self.path)
+
+            while True:
+                header = f.read(HEADER.size)
+                if not header:
+                    break
+
+                name, size, length = HEADER.unpack(header)
+                data = zlib.decompress(f.read(length))
+                if len(data) != size:
+                    raise ValueError('Invalid tablebase file: ' + self.path)
+                entries[name.rstrip('\0')] = data
+
+        self._tables = {name: Table(name) for name in entries}
+        self._entries = entries
+
+    def probe(self, game):
+        """Returns tuple (result, plies to mate) for side to move, or None if position is not covered
+        result is WIN, DRAW or LOSS, plies to mate is None for draws.
+        """
+        if self._entries is None:
+            self._load()
+
+        position = _gamePosition(game)
+        if position is None:
+            return None
+
+        name, wk, bk, sq, btm = position
+        if name is None:
+            return DRAW, None
+        if name not in self._entries:
+            return None
+
+        table = self._tables[name]
+        value = ord(self._entries[name][table.index(wk, bk, sq, btm)])
+        if not value:
+            return DRAW, None
+
+        plies = value - 1
+        return (WIN if plies % 2 else LOSS), plies
+
+    def bestMove(self, game):
+        """Returns fastest winning (or slowest losing) move, None if position is not covered
+        On equal results first legal move is returned.
+        """
+        best, best_rank = None, None
+        for move in game.getAllMoves():
+            undo = game.make_move(move)
+            try:
+                result = self.probe(game)
+            finally:
+                game.unmake_move(undo)
+
+            if result is None:
+                return None
+
+            # results are for opponent
+            if result[0] == LOSS:
+                rank = (2, -result[1])
+            elif result[0] == DRAW:
+                rank = (1, 0)
+            else:
+                rank = (0, result[1])
+
+            if best_rank is None or rank > best_rank:
+                best, best_rank = move, rank
+
+        return best
+
+
+def _gamePosition(game):
+    """Returns tuple (table name, white king, black king, piece, black to move), strong side as white
+    Table name is None for positions without mating material. None is returned for other positions,
+    including ones without exactly one king per side and a lone king on weak side.
+    """
+    white, black = game.white_pieces, game.black_pieces
+    if len(white) + len(black) > MAX_PIECES or not white or not black:
+        return None
+
+    flip = len(black) > len(white)
+    strong, weak = (black, white) if flip else (white, black)
+    if len(weak) != 1 or weak[0].type is not pieces.TypeKing:
+        return None
+
+    kings = [p for p in strong if p.type is pieces.TypeKing]
+    if len(kings) != 1:
+        return None
+
+    king = kings[0]
+    piece = None
+    for p in strong:
+        if p is not king:
+            piece = p
+
+    if piece is None:
+        return None, None, None, None, None
+    if piece.type in DRAWN_TYPES:
+        return None, None, None, None, None
+
+    return (
+        NAMES[piece.type],
+        squareIndex(king.position, flip),
+        squareIndex(weak[0].position, flip),
+        squareIndex(piece.position, flip),
+        game.black_moves != flip
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Builds endgame tablebase file (KQK, KRK, KPK).')
+    parser.add_argument('path')
+    args = parser.parse_args(argv)
+
+    solved = buildTables(args.path)
+    for name in ('KQK', 'KRK', 'KPK'):
+        longest = max(solved[name]) - 1
+        sys.stdout.write('%s: longest mate in %d plies\n' % (name, longest))
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
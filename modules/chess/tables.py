@@ -0,0 +1,73 @@
+"""Precomputed move tables
+Tables are built once at import and indexed by square: table[x][y]
+Targets outside the board are never included, so move generators don't need bounds checks.
+"""
+
+DIRECTIONS_ORTHOGONAL = ((1, 0), (-1, 0), (0, 1), (0, -1))
+DIRECTIONS_DIAGONAL = ((-1, -1), (-1, 1), (1, -1), (1, 1))
+
+KNIGHT_OFFSETS = ((1, 2), (2, 1), (2, -1), (1, -2), (-1, -2), (-2, -1), (-2, 1), (-1, 2))
+KING_OFFSETS = ((-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1))
+
+
+def onBoard(x, y):
+    return 0 <= x <= 7 and 0 <= y <= 7
+
+
+def _squareTable(function):
+    return [[function(x, y) for y in range(8)] for x in range(8)]
+
+
+def _targets(offsets):
+    return _squareTable(lambda x, y: [(x + dx, y + dy) for dx, dy in offsets if onBoard(x + dx, y + dy)])
+
+
+def _ray(x, y, direction):
+    ray = []
+    for d in range(1, 8):
+        tx, ty = x + direction[0] * d, y + direction[1] * d
+        if not onBoard(tx, ty):
+            break
+        ray.append((tx, ty))
+
+    return ray
+
+
+def _pawnPushes(is_black):
+    direction, start_rank = (-1, 6) if is_black else (1, 1)
+
+    def pushes(x, y):
+        result = []
+        if onBoard(x, y + direction):
+            result.append((x, y + direction))
+            if y == start_rank:
+                result.append((x, y + 2 * direction))
+        return result
+
+    return _squareTable(pushes)
+
+
+KNIGHT_TARGETS = _targets(KNIGHT_OFFSETS)
+KING_TARGETS = _targets(KING_OFFSETS)
+
+# squares attacked by pawn standing on square, indexed by is_black
+PAWN_ATTACKS = [
+    _targets(((1, 1), (-1, 1))),
+    _targets(((1, -1), (-1, -1))),
+]
+
+# one or two squares forward, indexed by is_black
+PAWN_PUSHES = [_pawnPushes(False), _pawnPushes(True)]
+
+# left and right neighbour squares (en passant)
+NEIGHBOURS_HORIZONTAL = _targets(((1, 0), (-1, 0)))
+
+# ordered squares in each direction: RAYS[direction][x][y]
+RAYS = dict(
+    (direction, _squareTable(lambda x, y, direction=direction: _ray(x, y, direction)))
+    for direction in DIRECTIONS_ORTHOGONAL + DIRECTIONS_DIAGONAL
+)
+
+# rays grouped by piece movement: table[x][y] -> list of rays
+RAYS_ORTHOGONAL = _squareTable(lambda x, y: [RAYS[d][x][y] for d in DIRECTIONS_ORTHOGONAL])
+RAYS_DIAGONAL = _squareTable(lambda x, y: [RAYS[d][x][y] for d in DIRECTIONS_DIAGONAL])
@@ -2,16 +2,37 @@
 import unittest
 import operator
 import json
+import os
+import pickle
+import shutil
+import tempfile
+import threading
 
 from . import board
+from . import bitboard
+from . import mailbox
 from . import pieces
+from . import tables
 from . import game
+from . import game_factory
+from . import perft
+from . import evaluation
+from . import attacks
+from . import book
+from . import pgn
+from . import tablebase
+from . import sessions
+from . import zobrist
+from .move_generators import gen_minimax, gen_negamax
+from modules import profiling
 
 
 class BoardTests(unittest.TestCase):
     """Board testing class"""
+    board_class = board.Board
+
     def setUp(self):
-        self.board = board.Board()
+        self.board = self.board_class()
 
     def test_board(self):
         # board size, check squares
@@ -24,8 +45,7 @@ class BoardTests(unittest.TestCase):
         self.assertFalse(self.board.squares[7][0].is_black)
         self.assertFalse(self.board.squares[4][3].is_black)
 
-        self.assertEqual(self.board.squares[0][0], self.board.squares_reversed[7][7])
-        self.assertEqual(self.board.squares[1][1], self.board.squares_reversed[6][6])
+        self.assertFalse(hasattr(self.board, 'squares_reversed'))
 
         for i in range(7):
             self.assertEqual(len(self.board.squares[i]), 8)
@@ -39,8 +59,6 @@ class BoardTests(unittest.TestCase):
                     self.assertFalse(self.board.squares[i][j].is_black)
                 else:
                     self.assertTrue(self.board.squares[i][j].is_black)
-                # check reversed
-                self.assertEqual(self.board.squares[i][j], self.board.squares_reversed[7-i][7-j], str(i) + ', ' + str(j))
 
     def test_piece_actions(self):
         board_manager = board.BoardManager
@@ -71,9 +89,7 @@ class BoardTests(unittest.TestCase):
 
         # test board squares
         self.assertEqual(self.board.squares[4][3].piece, TestPiece1)
-        self.assertEqual(self.board.squares_reversed[3][4].piece, TestPiece1)
         self.assertEqual(self.board.squares[4][5].piece, TestPiece2)
-        self.assertEqual(self.board.squares_reversed[3][2].piece, TestPiece2)
 
         # test remove
         board_manager.removePiece(self.board, TestPiece2)
@@ -82,8 +98,10 @@ class BoardTests(unittest.TestCase):
 
 class PawnTests(unittest.TestCase):
     """Pawn testing class"""
+    board_class = board.Board
+
     def setUp(self):
-        self.board = board.Board()
+        self.board = self.board_class()
         self.board_manager = board.BoardManager
 
     def test_moves(self):
@@ -164,8 +182,10 @@ class PawnTests(unittest.TestCase):
 
 class KingTests(unittest.TestCase):
     """King testing class"""
+    board_class = board.Board
+
     def setUp(self):
-        self.board = board.Board()
+        self.board = self.board_class()
         self.board_manager = board.BoardManager
 
     def test_moves(self):
@@ -193,11 +213,54 @@ class KingTests(unittest.TestCase):
         movelists = TestPiece.getMoves(self.board)
         self.assertEqual(len(movelists), 0)
 
+    def test_castling(self):
+        """Castling squares are mirrored for black - short castling on queen's side, no long castling"""
+        for is_black, y in ((False, 0), (True, 7)):
+            King = pieces.Piece(pieces.TypeKing, is_black)
+            self.board_manager.initPiece(self.board, King, (4, y))
+            for x in (0, 7):
+                self.board_manager.initPiece(self.board, pieces.Piece(pieces.TypeRook, is_black), (x, y))
+
+        castlings = lambda king: sorted(tuple(m.moves) for m in king.getMoves(self.board) if len(m.moves) == 2)
+
+        self.assertEqual(castlings(self.board.squares[4][0].piece), [
+            (((4, 0), (2, 0)), ((0, 0), (3, 0))),
+            (((4, 0), (6, 0)), ((7, 0), (5, 0))),
+        ])
+        self.assertEqual(castlings(self.board.squares[4][7].piece), [
+            (((4, 7), (1, 7)), ((0, 7), (2, 7))),
+        ])
+
+    def test_castling_through_check(self):
+        """King can't castle out of check or through attacked square"""
+        King = pieces.Piece(pieces.TypeKing, False)
+        self.board_manager.initPiece(self.board, King, (4, 0))
+        for x in (0, 7):
+            self.board_manager.initPiece(self.board, pieces.Piece(pieces.TypeRook, False), (x, 0))
+        Rook = pieces.Piece(pieces.TypeRook, True)
+
+        castlings = lambda: sorted(m.moves[0][1] for m in King.getMoves(self.board) if len(m.moves) == 2)
+
+        self.board_manager.initPiece(self.board, Rook, (5, 4))
+        self.assertEqual(castlings(), [(2, 0)])
+
+        self.board_manager.move(self.board, pieces.PieceMove(((5, 4), (3, 4))))
+        self.assertEqual(castlings(), [(6, 0)])
+
+        # rook square may be attacked, king doesn't pass it
+        self.board_manager.move(self.board, pieces.PieceMove(((3, 4), (1, 4))))
+        self.assertEqual(castlings(), [(2, 0), (6, 0)])
+
+        self.board_manager.move(self.board, pieces.PieceMove(((1, 4), (4, 4))))
+        self.assertEqual(castlings(), [])
+
 
 class QueenTests(unittest.TestCase):
     """Queen testing class"""
+    board_class = board.Board
+
     def setUp(self):
-        self.board = board.Board()
+        self.board = self.board_class()
         self.board_manager = board.BoardManager
 
     def test_moves(self):
@@ -241,8 +304,10 @@ class QueenTests(unittest.TestCase):
 
 class BishopTests(unittest.TestCase):
     """Bishop testing class"""
+    board_class = board.Board
+
     def setUp(self):
-        self.board = board.Board()
+        self.board = self.board_class()
         self.board_manager = board.BoardManager
 
     def test_moves(self):
@@ -274,8 +339,10 @@ class BishopTests(unittest.TestCase):
 
 class KnightTests(unittest.TestCase):
     """Knight testing class"""
+    board_class = board.Board
+
     def setUp(self):
-        self.board = board.Board()
+        self.board = self.board_class()
         self.board_manager = board.BoardManager
 
     def test_moves(self):
@@ -307,8 +374,10 @@ class KnightTests(unittest.TestCase):
 
 class KingSafetyTests(unittest.TestCase):
     """King safety testing class"""
+    board_class = board.Board
+
     def setUp(self):
-        self.board = board.Board()
+        self.board = self.board_class()
         self.board_manager = board.BoardManager
 
     def test_1(self):
@@ -342,8 +411,10 @@ class KingSafetyTests(unittest.TestCase):
 
 class GameTests(unittest.TestCase):
     """Game testing class"""
+    board_class = board.Board
+
     def setUp(self):
-        self.board = board.Board()
+        self.board = self.board_class()
         self.board_manager = board.BoardManager
         self.game = game.Game(self.board)
 
@@ -391,7 +462,7 @@ class GameTests(unittest.TestCase):
         serialized = json.dumps(serialized, separators=(',', ':'))
 
         data = json.loads(serialized)
-        newboard = board.Board()
+        newboard = self.board_class()
         self.board_manager.deserialize(newboard, data)
 
         self.assertEqual(newboard.squares, self.board.squares)
@@ -718,3 +789,1368 @@ class GameTests(unittest.TestCase):
             self.assertEqual(self.game.board.squares[black_king_pos[0]][black_king_pos[1]].piece.position, black_king_pos)
         if checkmate:
             self.assertEqual(len(self.game.getAllMoves()), 0)
+
+
+class BitBoardBoardTests(BoardTests):
+    board_class = board.BitBoard
+
+
+class MailboxBoardTests(BoardTests):
+    board_class = board.MailboxBoard
+
+
+class BitBoardPawnTests(PawnTests):
+    board_class = board.BitBoard
+
+
+class MailboxPawnTests(PawnTests):
+    board_class = board.MailboxBoard
+
+
+class BitBoardKingTests(KingTests):
+    board_class = board.BitBoard
+
+
+class MailboxKingTests(KingTests):
+    board_class = board.MailboxBoard
+
+
+class BitBoardQueenTests(QueenTests):
+    board_class = board.BitBoard
+
+
+class MailboxQueenTests(QueenTests):
+    board_class = board.MailboxBoard
+
+
+class BitBoardBishopTests(BishopTests):
+    board_class = board.BitBoard
+
+
+class MailboxBishopTests(BishopTests):
+    board_class = board.MailboxBoard
+
+
+class BitBoardKnightTests(KnightTests):
+    board_class = board.BitBoard
+
+
+class MailboxKnightTests(KnightTests):
+    board_class = board.MailboxBoard
+
+
+class BitBoardKingSafetyTests(KingSafetyTests):
+    board_class = board.BitBoard
+
+
+class MailboxKingSafetyTests(KingSafetyTests):
+    board_class = board.MailboxBoard
+
+
+class BitBoardGameTests(GameTests):
+    board_class = board.BitBoard
+
+
+class MailboxGameTests(GameTests):
+    board_class = board.MailboxBoard
+
+
+class TablesTests(unittest.TestCase):
+    """Precomputed tables testing class"""
+    def test_targets(self):
+        self.assertEqual(sorted(tables.KNIGHT_TARGETS[0][0]), [(1, 2), (2, 1)])
+        self.assertEqual(len(tables.KNIGHT_TARGETS[4][4]), 8)
+        self.assertEqual(len(tables.KING_TARGETS[0][7]), 3)
+        self.assertEqual(tables.PAWN_ATTACKS[False][0][1], [(1, 2)])
+        self.assertEqual(tables.PAWN_ATTACKS[True][4][6], [(5, 5), (3, 5)])
+        self.assertEqual(tables.PAWN_PUSHES[False][3][1], [(3, 2), (3, 3)])
+        self.assertEqual(tables.PAWN_PUSHES[True][3][6], [(3, 5), (3, 4)])
+        self.assertEqual(tables.PAWN_PUSHES[False][3][7], [])
+
+    def test_rays(self):
+        self.assertEqual(tables.RAYS[(1, 1)][0][0], [(i, i) for i in range(1, 8)])
+        self.assertEqual(tables.RAYS[(-1, 0)][3][5], [(2, 5), (1, 5), (0, 5)])
+        self.assertEqual(map(len, tables.RAYS_ORTHOGONAL[0][0]), [7, 0, 7, 0])
+        self.assertEqual(sum(map(len, tables.RAYS_DIAGONAL[3][3])), 13)
+
+
+class BitBoardTests(unittest.TestCase):
+    """Bitboard backend testing class"""
+
+    def moves_set(self, _game):
+        result = set()
+        for move in _game.getAllMoves():
+            result.add((
+                tuple(tuple(map(tuple, m)) for m in move.moves),
+                move.transformation[1] if move.transformation else None,
+                move.capture.id if move.capture else None,
+            ))
+        return result
+
+    def to_bitboard(self, _game):
+        bb_game = game.Game(board.BitBoard())
+        bb_game.deserialize(_game.serialize())
+        return bb_game
+
+    def check_bitboards(self, _board):
+        expected = bitboard.BitBoards()
+        for x in range(8):
+            for y in range(8):
+                p = _board.squares[x][y].piece
+                if p:
+                    expected.add(p.type, p.is_black, bitboard.squareIndex((x, y)))
+
+        self.assertEqual(_board.bitboards.colors, expected.colors)
+        for ptype in pieces.types_dict.values():
+            for is_black in (False, True):
+                self.assertEqual(_board.bitboards.get(ptype, is_black), expected.get(ptype, is_black))
+
+    def test_tables(self):
+        self.assertEqual(bin(bitboard.KNIGHT_ATTACKS[0]).count('1'), 2)
+        self.assertEqual(bin(bitboard.KING_ATTACKS[bitboard.squareIndex((4, 4))]).count('1'), 8)
+        self.assertEqual(
+            bitboard.slidingAttacks(0, bitboard.squareBit((0, 3)), bitboard.DIRECTIONS_ORTHOGONAL),
+            bitboard.squareBit((0, 1)) | bitboard.squareBit((0, 2)) | bitboard.squareBit((0, 3)) | (0xFE)
+        )
+        self.assertEqual(list(bitboard.bits(0x81)), [0, 7])
+
+    def test_pseudo_moves(self):
+        """Moves of all pieces at once are the moves of each piece, simple moves are shared"""
+        for name in dir(game_factory):
+            if not name.startswith('make_'):
+                continue
+
+            bb_game = self.to_bitboard(getattr(game_factory, name)())
+            for captures_only in (False, True):
+                expected = []
+                for p in bb_game.black_pieces if bb_game.black_moves else bb_game.white_pieces:
+                    expected.extend(p.getPseudoMoves(bb_game.board, captures_only))
+
+                moves = pieces.bitboardPseudoMoves(bb_game.board, bb_game.black_moves, captures_only)
+                key = lambda m: (m.moves, m.transformation, m.capture.id if m.capture else None)
+                self.assertEqual(sorted(map(key, moves)), sorted(map(key, expected)), name)
+
+        _game = game.Game(board.BitBoard()).init_new()
+        move = [m for m in _game.getPseudoMoves() if m.moves == (((6, 0), (5, 2)),)][0]
+        self.assertIs(move, pieces.BITBOARD_MOVES[6][bitboard.squareIndex((5, 2))])
+
+        # shared moves can't be changed, copies stay shared-safe
+        self.assertRaises(AttributeError, setattr, move, 'capture', _game.black_pieces[0])
+        self.assertRaises(AttributeError, setattr, move, 'transformation', ((5, 2), pieces.TypeQueen))
+        self.assertIsNone(move.capture)
+        copied = pickle.loads(pickle.dumps(move, 2))
+        self.assertEqual(copied.moves, move.moves)
+        self.assertRaises(AttributeError, setattr, copied, 'capture', None)
+
+    def test_factory_positions(self):
+        for name in dir(game_factory):
+            if not name.startswith('make_'):
+                continue
+
+            _game = getattr(game_factory, name)()
+            bb_game = self.to_bitboard(_game)
+
+            self.check_bitboards(bb_game.board)
+            self.assertEqual(self.moves_set(_game), self.moves_set(bb_game), name)
+
+    def test_game(self):
+        """Plays same moves on both backends"""
+        _game = game.Game(board.Board()).init_new()
+        bb_game = game.Game(board.BitBoard()).init_new()
+
+        for i in range(40):
+            moves = sorted(_game.getAllMoves(), key=lambda m: (m.moves, m.transformation))
+            if not moves:
+                break
+
+            self.assertEqual(self.moves_set(_game), self.moves_set(bb_game))
+
+            move = moves[(i * 7) % len(moves)]
+            _game.move(move)
+            bb_move = pieces.PieceMove(*move.moves)
+            bb_move.transformation = move.transformation
+            bb_move.capture = move.capture
+            bb_game.move(bb_move)
+
+            self.check_bitboards(bb_game.board)
+            self.assertEqual(_game.is_check, bb_game.is_check)
+            self.assertEqual(_game.is_checkmate, bb_game.is_checkmate)
+
+
+class MailboxTests(unittest.TestCase):
+    """Mailbox backend testing class"""
+
+    def moves_set(self, _game):
+        return set((tuple(tuple(map(tuple, m)) for m in move.moves), move.transformation) for move in _game.getAllMoves())
+
+    def check_mailbox(self, _board):
+        for index, o in enumerate(_board.mailbox):
+            position = mailbox.squarePosition(index)
+            if position is None:
+                self.assertIs(o, mailbox.OFFBOARD)
+            else:
+                self.assertIs(o, _board.squares[position[0]][position[1]].piece)
+
+    def test_index(self):
+        for x in range(8):
+            for y in range(8):
+                self.assertEqual(mailbox.squarePosition(mailbox.squareIndex((x, y))), (x, y))
+        self.assertEqual(len([p for p in mailbox.POSITIONS if p]), 64)
+
+    def test_game(self):
+        """Plays same moves on both backends"""
+        _game = game.Game(board.Board()).init_new()
+        mb_game = game.Game(board.MailboxBoard()).init_new()
+
+        for i in range(60):
+            self.assertEqual(self.moves_set(_game), self.moves_set(mb_game))
+
+            moves = sorted(_game.getAllMoves(), key=lambda m: (m.moves, m.transformation))
+            if not moves:
+                break
+
+            move = moves[(i * 5) % len(moves)]
+            _game.move(move)
+            mb_move = pieces.PieceMove(*move.moves)
+            mb_move.transformation = move.transformation
+            mb_move.capture = move.capture
+            mb_game.move(mb_move)
+
+            self.check_mailbox(mb_game.board)
+            self.assertEqual(_game.is_check, mb_game.is_check)
+
+
+class MakeUnmakeTests(unittest.TestCase):
+    """make_move / unmake_move testing class"""
+
+    def snapshot(self, _game):
+        pieces_state = []
+        for p in _game.white_pieces + _game.black_pieces + _game.white_captures.values() + _game.black_captures.values():
+            pieces_state.append((p.id, p.type, p.position, p.moves_count))
+
+        bitboards = None
+        if _game.board.bitboards is not None:
+            bitboards = (list(_game.board.bitboards.colors), sorted((k.__name__, list(v)) for k, v in _game.board.bitboards.pieces.items() if any(v)))
+
+        mailbox_state = None
+        if _game.board.mailbox is not None:
+            mailbox_state = [o if o is None or o is mailbox.OFFBOARD else o.id for o in _game.board.mailbox]
+
+        return (
+            _game.serialize(),
+            [p.id for p in _game.white_pieces],
+            [p.id for p in _game.black_pieces],
+            sorted(pieces_state),
+            _game.board.white_king_pos,
+            _game.board.black_king_pos,
+            bitboards,
+            mailbox_state,
+            _game.zobrist_key,
+        )
+
+    def check_all_moves(self, _game, depth=1):
+        before = self.snapshot(_game)
+        for move in _game.getAllMoves():
+            undo = _game.make_move(move)
+            self.assertNotEqual(self.snapshot(_game), before)
+            if depth > 1:
+                self.check_all_moves(_game, depth - 1)
+            _game.unmake_move(undo)
+            self.assertEqual(self.snapshot(_game), before, str(move))
+
+    def test_factory_positions(self):
+        for name in dir(game_factory):
+            if not name.startswith('make_'):
+                continue
+
+            _game = getattr(game_factory, name)()
+            self.check_all_moves(_game, 2)
+
+            for gameboard in (board.BitBoard(), board.MailboxBoard()):
+                bb_game = game.Game(gameboard)
+                bb_game.deserialize(_game.serialize())
+                self.check_all_moves(bb_game, 2)
+
+    def test_new_game(self):
+        self.check_all_moves(game.Game(board.Board()).init_new(), 2)
+
+    def test_move_state(self):
+        _game = game_factory.make_whites_enpassant()
+        _game.move(pieces.PieceMove(((4, 6), (4, 4))))
+
+        moves = [m for m in _game.board.squares[3][4].piece.getMoves(_game.board) if m.capture]
+        self.assertEqual(len(moves), 1)
+
+        undo = _game.make_move(moves[0])
+        self.assertIsNone(_game.board.squares[4][4].piece)
+        self.assertIn('Bp1', _game.white_captures)
+        self.assertTrue(_game.black_moves)
+
+        _game.unmake_move(undo)
+        self.assertEqual(_game.board.squares[4][4].piece.id, 'Bp1')
+        self.assertEqual(_game.board.squares[4][4].piece.moves_count, 1)
+        self.assertNotIn('Bp1', _game.white_captures)
+        self.assertFalse(_game.black_moves)
+
+
+class ZobristTests(unittest.TestCase):
+    """Zobrist key testing class"""
+
+    def play(self, _game, moves):
+        for move in moves:
+            _game.move(pieces.PieceMove(move))
+            self.assertEqual(_game.zobrist_key, zobrist.gameKey(_game))
+
+        return _game
+
+    def test_incremental(self):
+        for B in (board.Board, board.BitBoard):
+            _game = game.Game(B()).init_new()
+            self.assertEqual(_game.zobrist_key, zobrist.gameKey(_game))
+
+            for i in range(30):
+                moves = sorted(_game.getAllMoves(), key=lambda m: (m.moves, m.transformation))
+                if not moves:
+                    break
+
+                undo = _game.make_move(moves[(i * 5) % len(moves)])
+                self.assertEqual(_game.zobrist_key, zobrist.gameKey(_game))
+                _game.unmake_move(undo)
+                self.assertEqual(_game.zobrist_key, zobrist.gameKey(_game))
+
+                _game.move(moves[(i * 3) % len(moves)])
+                self.assertEqual(_game.zobrist_key, zobrist.gameKey(_game))
+
+    def test_factory_positions(self):
+        for name in dir(game_factory):
+            if not name.startswith('make_'):
+                continue
+
+            _game = getattr(game_factory, name)()
+            self.assertEqual(_game.zobrist_key, zobrist.gameKey(_game), name)
+
+            for move in _game.getAllMoves():
+                undo = _game.make_move(move)
+                self.assertEqual(_game.zobrist_key, zobrist.gameKey(_game), name + ': ' + str(move))
+                _game.unmake_move(undo)
+
+    def test_transposition(self):
+        game1 = self.play(game.Game().init_new(), [((6, 0), (5, 2)), ((6, 7), (5, 5)), ((1, 0), (2, 2))])
+        game2 = self.play(game.Game().init_new(), [((1, 0), (2, 2)), ((6, 7), (5, 5)), ((6, 0), (5, 2))])
+        self.assertEqual(game1.zobrist_key, game2.zobrist_key)
+
+        # side to move
+        game3 = self.play(game.Game().init_new(), [((6, 0), (5, 2)), ((6, 7), (5, 5))])
+        game3.black_moves = True
+        self.assertNotEqual(game1.zobrist_key, game3.zobrist_key)
+
+    def test_castling_rights(self):
+        # king goes back and forth - same placement, no castling rights
+        game1 = self.play(game.Game().init_new(), [
+            ((4, 1), (4, 2)), ((4, 6), (4, 5)),
+            ((4, 0), (4, 1)), ((4, 7), (4, 6)),
+            ((4, 1), (4, 0)), ((4, 6), (4, 7)),
+        ])
+        game2 = self.play(game.Game().init_new(), [((4, 1), (4, 2)), ((4, 6), (4, 5))])
+        self.assertEqual(game1.serialize()['board'].keys(), game2.serialize()['board'].keys())
+        self.assertNotEqual(game1.zobrist_key, game2.zobrist_key)
+
+    def test_en_passant(self):
+        # pawns moved two squares vs. two single moves - same placement
+        game1 = self.play(game.Game().init_new(), [((4, 1), (4, 3)), ((0, 6), (0, 4))])
+        game2 = self.play(game.Game().init_new(), [((4, 1), (4, 2)), ((0, 6), (0, 5)), ((4, 2), (4, 3)), ((0, 5), (0, 4))])
+        self.assertNotEqual(game1.zobrist_key, game2.zobrist_key)
+        self.assertEqual(
+            game1.zobrist_key ^ zobrist.EN_PASSANT[3 * 8 + 4] ^ zobrist.EN_PASSANT[4 * 8 + 0],
+            game2.zobrist_key
+        )
+
+
+class MoveLegalityTests(unittest.TestCase):
+    """Pseudo-legal moves + lazy legality testing class"""
+
+    def move_keys(self, moves):
+        return sorted((m.moves, m.transformation) for m in moves)
+
+    def check_game(self, _game, name=''):
+        legality = pieces.MoveLegality(_game.board, _game.black_moves)
+        for p in _game.black_pieces if _game.black_moves else _game.white_pieces:
+            self.assertEqual(
+                self.move_keys(legality.filter(p.getPseudoMoves(_game.board))),
+                self.move_keys(p.getMoves(_game.board)),
+                name + ' ' + str(p)
+            )
+
+    def test_pins(self):
+        _board = board.Board()
+        WK = pieces.Piece(pieces.TypeKing, False)
+        WB = pieces.Piece(pieces.TypeBishop, False)
+        WR = pieces.Piece(pieces.TypeRook, False)
+        Wk = pieces.Piece(pieces.TypeKnight, False)
+        BQ = pieces.Piece(pieces.TypeQueen, True)
+        BR = pieces.Piece(pieces.TypeRook, True)
+        BB = pieces.Piece(pieces.TypeBishop, True)
+        for piece, pos in ((WK, (0, 0)), (WB, (2, 2)), (WR, (0, 3)), (Wk, (4, 0)), (BQ, (5, 5)), (BR, (0, 7)), (BB, (7, 0))):
+            board.BoardManager.initPiece(_board, piece, pos)
+
+        legality = pieces.MoveLegality(_board, False)
+        self.assertFalse(legality.in_check)
+        self.assertEqual(sorted(legality.pins.keys()), [(0, 3), (2, 2)])
+        self.assertEqual(legality.pins[(2, 2)], frozenset([(1, 1), (2, 2), (3, 3), (4, 4), (5, 5)]))
+
+        self.assertEqual(
+            sorted(m.moves[0][1] for m in legality.filter(WB.getPseudoMoves(_board))),
+            [(1, 1), (3, 3), (4, 4), (5, 5)]
+        )
+        self.assertEqual(len(legality.filter(WR.getPseudoMoves(_board))), 6)
+
+        # knight blocks bishop - not pinned (non threatening piece would block too)
+        self.assertNotIn((4, 0), legality.pins)
+        self.assertEqual(self.move_keys(legality.filter(Wk.getPseudoMoves(_board))), self.move_keys(Wk.getMoves(_board)))
+
+    def test_check(self):
+        _board = board.Board()
+        WK = pieces.Piece(pieces.TypeKing, False)
+        WQ = pieces.Piece(pieces.TypeQueen, False)
+        BQ = pieces.Piece(pieces.TypeQueen, True)
+        for piece, pos in ((WK, (0, 0)), (WQ, (3, 7)), (BQ, (7, 7))):
+            board.BoardManager.initPiece(_board, piece, pos)
+
+        legality = pieces.MoveLegality(_board, False)
+        self.assertTrue(legality.in_check)
+        self.assertEqual(
+            sorted(m.moves[0][1] for m in legality.filter(WQ.getPseudoMoves(_board))),
+            [(3, 3), (5, 5), (7, 7)]
+        )
+
+    def test_check_from_make_move(self):
+        """Check computed by make_move is reused, and matches full test"""
+        for name in dir(game_factory):
+            if not name.startswith('make_'):
+                continue
+
+            _game = game.Game(board.BitBoard())
+            _game.deserialize(getattr(game_factory, name)().serialize())
+            for move in _game.getAllMoves():
+                undo = _game.make_move(move)
+                expected = pieces.MoveLegality(_game.board, _game.black_moves).in_check
+                self.assertEqual(_game._moveLegality().in_check, expected, name)
+                _game.unmake_move(undo)
+
+    def test_factory_positions(self):
+        for name in dir(game_factory):
+            if not name.startswith('make_'):
+                continue
+
+            for gameboard in (board.Board(), board.BitBoard(), board.MailboxBoard()):
+                _game = game.Game(gameboard)
+                _game.deserialize(getattr(game_factory, name)().serialize())
+                self.check_game(_game, name)
+
+    def test_game(self):
+        for gameboard in (board.Board(), board.BitBoard(), board.MailboxBoard()):
+            _game = game.Game(gameboard).init_new()
+            for i in range(60):
+                self.check_game(_game, str(i))
+
+                moves = sorted(_game.getAllMoves(), key=lambda m: (m.moves, m.transformation))
+                if not moves:
+                    break
+                _game.move(moves[(i * 11) % len(moves)])
+
+
+class PerftTests(unittest.TestCase):
+    """Move generator node counts testing class"""
+
+    def test_positions(self):
+        for board_name in perft.BOARDS:
+            for name, (make, counts) in perft.POSITIONS.items():
+                for depth in (1, 2):
+                    if depth in counts:
+                        _game = perft.makeGame(name, board_name)
+                        self.assertEqual(perft.perft(_game, depth), counts[depth], name + ' ' + board_name)
+
+    def test_depth3(self):
+        for name in ('new', 'whites_enpassant', 'blacks_promotion', 'whites_castling_long'):
+            self.assertEqual(perft.perft(perft.makeGame(name), 3), perft.POSITIONS[name][1][3], name)
+
+    def test_divide(self):
+        _game = perft.makeGame('whites_promotion')
+        before = _game.serialize()
+        result = perft.divide(_game, 2)
+
+        self.assertEqual(sum(count for move, count in result), perft.POSITIONS['whites_promotion'][1][2])
+        self.assertEqual(_game.serialize(), before)
+
+        names = [perft.moveName(move) for move, count in result]
+        self.assertIn('f7e8q', names)
+        self.assertIn('g7g8n', names)
+
+
+class CapturesOnlyTests(unittest.TestCase):
+    """Captures and promotions generation testing class"""
+
+    def check_game(self, _game, name=''):
+        expected = [
+            m for m in _game.getPseudoMoves()
+            if m.capture or m.transformation or _game.board.squares[m.moves[0][1][0]][m.moves[0][1][1]].piece
+        ]
+        self.assertEqual(
+            sorted((m.moves, m.transformation) for m in _game.getPseudoMoves(captures_only=True)),
+            sorted((m.moves, m.transformation) for m in expected),
+            name
+        )
+
+    def test_check_from_make_move(self):
+        """Check computed by make_move is reused, and matches full test"""
+        for name in dir(game_factory):
+            if not name.startswith('make_'):
+                continue
+
+            _game = game.Game(board.BitBoard())
+            _game.deserialize(getattr(game_factory, name)().serialize())
+            for move in _game.getAllMoves():
+                undo = _game.make_move(move)
+                expected = pieces.MoveLegality(_game.board, _game.black_moves).in_check
+                self.assertEqual(_game._moveLegality().in_check, expected, name)
+                _game.unmake_move(undo)
+
+    def test_factory_positions(self):
+        for name in dir(game_factory):
+            if not name.startswith('make_'):
+                continue
+
+            for gameboard in (board.Board(), board.BitBoard(), board.MailboxBoard()):
+                _game = game.Game(gameboard)
+                _game.deserialize(getattr(game_factory, name)().serialize())
+                self.check_game(_game, name)
+
+                for move in _game.getAllMoves():
+                    undo = _game.make_move(move)
+                    self.check_game(_game, name)
+                    _game.unmake_move(undo)
+
+
+class EvaluationTests(unittest.TestCase):
+    """Incremental evaluation testing class"""
+
+    def check_all_moves(self, _game, depth):
+        evaluation.checkScore(_game.board)
+        if depth == 0:
+            return
+
+        for move in _game.getAllMoves():
+            undo = _game.make_move(move)
+            self.check_all_moves(_game, depth - 1)
+            _game.unmake_move(undo)
+            evaluation.checkScore(_game.board)
+
+    def test_new_game(self):
+        _game = game.Game().init_new()
+        self.assertEqual(_game.score, 0)
+
+        # mirrored tables
+        _game.move(pieces.PieceMove(((4, 1), (4, 3))))
+        score = _game.score
+        self.assertTrue(score > 0)
+        _game.move(pieces.PieceMove(((4, 6), (4, 4))))
+        self.assertEqual(_game.score, 0)
+
+    def test_material(self):
+        _game = game.Game().init_new()
+        _game.strip()
+        _game.initPiece(_game.piece_list['WQ'], (0, 0))
+        _game.initPiece(_game.piece_list['Bp1'], (4, 4))
+
+        # queen a1: 900 - 20, pawn e5 (e4 for black): -(100 + 20)
+        self.assertEqual(_game.score, 760)
+        self.assertEqual(_game.score, evaluation.boardScore(_game.board))
+
+    def test_check_from_make_move(self):
+        """Check computed by make_move is reused, and matches full test"""
+        for name in dir(game_factory):
+            if not name.startswith('make_'):
+                continue
+
+            _game = game.Game(board.BitBoard())
+            _game.deserialize(getattr(game_factory, name)().serialize())
+            for move in _game.getAllMoves():
+                undo = _game.make_move(move)
+                expected = pieces.MoveLegality(_game.board, _game.black_moves).in_check
+                self.assertEqual(_game._moveLegality().in_check, expected, name)
+                _game.unmake_move(undo)
+
+    def test_factory_positions(self):
+        for name in dir(game_factory):
+            if not name.startswith('make_'):
+                continue
+
+            for gameboard in (board.Board(), board.BitBoard(), board.MailboxBoard()):
+                _game = game.Game(gameboard)
+                _game.deserialize(getattr(game_factory, name)().serialize())
+                self.check_all_moves(_game, 2)
+
+    def test_load_tables(self):
+        tables = evaluation.loadTables()
+        self.assertEqual(set(tables.keys()), set(pieces.types_dict.values()))
+        self.assertEqual(evaluation.makeScores(tables), evaluation.SCORES)
+
+        path = tempfile.mktemp(suffix='.json')
+        try:
+            with open(path, 'w') as f:
+                json.dump({'p': [[0] * 8] * 7}, f)
+            self.assertRaises(ValueError, evaluation.loadTables, path)
+        finally:
+            os.remove(path)
+
+
+class SlotsTests(unittest.TestCase):
+    """Compact pieces, moves and squares testing class"""
+
+    def test_no_dict(self):
+        for obj in (pieces.Piece(pieces.TypePawn, False, 'Wp1'), pieces.PieceMove(((0, 1), (0, 2))), board.Square(False)):
+            self.assertFalse(hasattr(obj, '__dict__'))
+            self.assertRaises(AttributeError, setattr, obj, 'foo', 1)
+
+    def test_serialization(self):
+        piece = pieces.Piece(pieces.TypePawn, True, 'Bp1')
+        piece.position = (3, 3)
+        piece.moves_count = 1
+
+        move = pieces.PieceMove(((4, 3), (3, 2)))
+        move.capture = piece
+        move.transformation = ((3, 2), pieces.TypeQueen)
+
+        data = json.loads(json.dumps(move.serialize()))
+        self.assertEqual(data, {
+            'moves': [[[4, 3], [3, 2]]],
+            'tp': [3, 2],
+            'tt': 'Q',
+            'c': {'id': 'Bp1', 't': 'p', 'p': [3, 3], 'm': 1, 'b': True},
+        })
+
+        restored = pieces.PieceMove.deserialize(data)
+        self.assertEqual(json.loads(json.dumps(restored.serialize())), data)
+        self.assertEqual(restored.capture, piece)
+
+    def test_pickle(self):
+        _game = game_factory.make_whites_enpassant()
+        restored = pickle.loads(pickle.dumps(_game, 2))
+        self.assertEqual(restored.serialize()['board'], _game.serialize()['board'])
+        self.assertEqual(sorted(restored.white_captures.keys()), sorted(_game.white_captures.keys()))
+        self.assertEqual(restored.zobrist_key, _game.zobrist_key)
+
+
+PGN_GAMES = """[Event "Test 1"]
+[Result "1-0"]
+
+1. e4 e5 2. Nf3 {main line} Nc6 3. Bb5 (3. Bc4 Bc5) a6 4. Ba4 Nf6 5. O-O Be7 1-0
+
+[Event "Test 2"]
+
+1. e4 c5 2. Nf3 d6 $1 3. d4 cxd4 4. Nxd4 Nf6 5. Nc3 a6 1/2-1/2
+
+[Event "Test 3"]
+
+1. d4 d5 2. c4 e6 3. Nc3 Nf6 ; comment
+4. Bg5 Be7 0-1
+"""
+
+
+class PgnTests(unittest.TestCase):
+    """PGN reading testing class"""
+
+    def test_read(self):
+        games = list(pgn.readGames(PGN_GAMES.splitlines()))
+        self.assertEqual(len(games), 3)
+        self.assertEqual(games[0][:6], ['e4', 'e5', 'Nf3', 'Nc6', 'Bb5', 'a6'])
+        self.assertEqual(games[0][8], 'O-O')
+        self.assertEqual(len(games[1]), 10)
+        self.assertEqual(games[2], ['d4', 'd5', 'c4', 'e6', 'Nc3', 'Nf6', 'Bg5', 'Be7'])
+
+    def test_san(self):
+        _game = game.Game(board.MailboxBoard()).init_new()
+        self.assertEqual(pgn.parseSan(_game, 'e4').moves[0], ((4, 1), (4, 3)))
+        self.assertEqual(pgn.parseSan(_game, 'Nf3').moves[0], ((6, 0), (5, 2)))
+        self.assertRaises(ValueError, pgn.parseSan, _game, 'e5')
+        self.assertRaises(ValueError, pgn.parseSan, _game, 'Zz9')
+
+        # disambiguation, promotion
+        _game = game_factory.make_whites_promotion()
+        self.assertEqual(pgn.parseSan(_game, 'fxe8=Q+').transformation, ((4, 7), pieces.TypeQueen))
+        self.assertEqual(pgn.parseSan(_game, 'g8N').transformation, ((6, 7), pieces.TypeKnight))
+        self.assertRaises(ValueError, pgn.parseSan, _game, 'g8=R')
+
+        # castling
+        _game = game_factory.make_whites_castling_short()
+        self.assertEqual(len(pgn.parseSan(_game, 'O-O').moves), 2)
+
+
+class BookTests(unittest.TestCase):
+    """Opening book testing class"""
+
+    def setUp(self):
+        self.path = tempfile.mktemp(suffix='.bin')
+        self.count = book.buildBook(PGN_GAMES.splitlines(), self.path)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_build(self):
+        # 10 + 10 + 8 plies, 1. e4 entry shared
+        self.assertEqual(self.count, 27)
+        self.assertEqual(os.path.getsize(self.path), len(book.MAGIC) + 27 * book.ENTRY.size)
+        self.assertEqual(len(book.OpeningBook(self.path)), 27)
+
+    def test_probe(self):
+        opening_book = book.OpeningBook(self.path)
+        _game = game.Game().init_new()
+
+        moves = sorted((perft.moveName(move), weight) for move, weight in opening_book.probe(_game))
+        self.assertEqual(moves, [('d2d4', 1), ('e2e4', 2)])
+
+        _game.move(pieces.PieceMove(((4, 1), (4, 3))))
+        moves = sorted((perft.moveName(move), weight) for move, weight in opening_book.probe(_game))
+        self.assertEqual(moves, [('c7c5', 1), ('e7e5', 1)])
+
+        _game.move(pieces.PieceMove(((0, 6), (0, 5))))
+        self.assertEqual(opening_book.probe(_game), [])
+        self.assertIsNone(opening_book.choose(_game))
+
+    def test_game(self):
+        """Book moves are played before generator is used"""
+        played = []
+
+        def generator(_game):
+            played.append(None)
+            return _game.getAllMoves()[0]
+
+        _game = game.Game(board.BitBoard(), generator, book.getBook(self.path)).init_new()
+        for i in range(12):
+            _game.move()
+
+        self.assertLessEqual(len(played), 4)
+        self.assertGreaterEqual(len(played), 2)
+
+    def test_invalid(self):
+        with open(self.path, 'wb') as f:
+            f.write('not a book')
+        self.assertRaises(ValueError, book.OpeningBook(self.path).entries, 0)
+
+
+class TablebaseTests(unittest.TestCase):
+    """Endgame tablebase testing class"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.path = tempfile.mktemp(suffix='.bin')
+        cls.solved = tablebase.buildTables(cls.path)
+        cls.tablebase = tablebase.Tablebase(cls.path)
+
+    @classmethod
+    def tearDownClass(cls):
+        os.remove(cls.path)
+
+    def makeEndgame(self, positions, black_moves=False):
+        """Game with pieces (id -> position) only"""
+        _game = game.Game(board.BitBoard()).init_new()
+        _game.strip()
+        for piece_id, position in positions.items():
+            piece = _game.piece_list[piece_id]
+            piece.moves_count = 1
+            _game.initPiece(piece, position)
+
+        _game.black_moves = black_moves
+        return _game
+
+    def test_build(self):
+        # longest mates with white to move - KQK in 10 moves, KRK in 16 moves
+        for name, plies in (('KQK', 19), ('KRK', 31)):
+            values = self.solved[name]
+            self.assertEqual(max(values[i] for i in range(0, len(values), 2)) - 1, plies)
+
+        self.assertEqual(os.path.getsize(self.path) < 100000, True)
+
+    def test_probe(self):
+        _game = game_factory.make_stalemate()
+        self.assertEqual(self.tablebase.probe(_game), (tablebase.WIN, 1))
+
+        # mate in 1 is played
+        move = self.tablebase.bestMove(_game)
+        _game.move(move)
+        self.assertTrue(_game.is_check)
+        self.assertTrue(_game.is_checkmate)
+
+        # stalemate
+        _game = self.makeEndgame({'WK': (7, 5), 'WQ': (5, 6), 'BK': (7, 7)}, True)
+        self.assertEqual(self.tablebase.probe(_game), (tablebase.DRAW, None))
+
+        # kings only
+        _game = self.makeEndgame({'WK': (7, 5), 'BK': (7, 7)})
+        self.assertEqual(self.tablebase.probe(_game), (tablebase.DRAW, None))
+
+        # not covered
+        self.assertIsNone(self.tablebase.probe(game.Game().init_new()))
+
+    def test_pawn(self):
+        # king in front of pawn on 6th rank wins
+        _game = self.makeEndgame({'WK': (4, 5), 'Wp5': (4, 4), 'BK': (4, 7)})
+        self.assertEqual(self.tablebase.probe(_game)[0], tablebase.WIN)
+        _game.black_moves = True
+        self.assertEqual(self.tablebase.probe(_game)[0], tablebase.LOSS)
+
+        # rook pawn with defending king in corner
+        _game = self.makeEndgame({'WK': (7, 3), 'Wp8': (7, 4), 'BK': (7, 7)})
+        self.assertEqual(self.tablebase.probe(_game), (tablebase.DRAW, None))
+
+    def test_flip(self):
+        """Black strong side is probed as white, flipped on y"""
+        white = self.makeEndgame({'WK': (1, 2), 'Wr1': (6, 1), 'BK': (3, 4)})
+        black = self.makeEndgame({'BK': (1, 5), 'Br1': (6, 6), 'WK': (3, 3)}, True)
+        self.assertEqual(self.tablebase.probe(white), self.tablebase.probe(black))
+        self.assertEqual(self.tablebase.probe(white)[0], tablebase.WIN)
+
+        white.black_moves = True
+        black.black_moves = False
+        self.assertEqual(self.tablebase.probe(white), self.tablebase.probe(black))
+
+    def test_play(self):
+        """Won position is played to mate in expected number of plies"""
+        _game = self.makeEndgame({'WK': (1, 2), 'Wr1': (6, 1), 'BK': (3, 4)})
+        plies = self.tablebase.probe(_game)[1]
+
+        generator = lambda g: self.fail('generator called')
+        for i in range(plies):
+            _game.move(tablebase.tablebaseGenerator(_game, self.tablebase, generator))
+
+        self.assertTrue(_game.is_check)
+        self.assertTrue(_game.is_checkmate)
+
+    def test_kings_required(self):
+        """Positions without one king per side and lone weak king aren't probed"""
+        # rook in place of black king
+        _game = self.makeEndgame({'WK': (0, 0), 'WQ': (3, 0), 'Br1': (7, 7)})
+        self.assertIsNone(self.tablebase.probe(_game))
+
+        # strong side without king
+        _game = self.makeEndgame({'WQ': (3, 0), 'Wr1': (0, 0), 'BK': (7, 7)})
+        self.assertIsNone(self.tablebase.probe(_game))
+        self.assertEqual(tablebase.tablebaseGenerator(_game, self.tablebase, lambda g: 'searched'), 'searched')
+
+    def test_generator(self):
+        """Positions with more pieces are searched by generator"""
+        _game = game.Game().init_new()
+        self.assertEqual(tablebase.tablebaseGenerator(_game, self.tablebase, lambda g: 'searched'), 'searched')
+
+    def test_invalid(self):
+        path = tempfile.mktemp(suffix='.bin')
+        with open(path, 'wb') as f:
+            f.write('not tables')
+        try:
+            self.assertRaises(ValueError, tablebase.Tablebase(path).probe, game.Game().init_new())
+        finally:
+            os.remove(path)
+
+
+class CodecTests(unittest.TestCase):
+    """Compact position codec testing class"""
+
+    def test_new_game(self):
+        _game = game.Game().init_new()
+        data = _game.serialize(True)
+
+        self.assertTrue(data.startswith('rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w - Br2,Bk2,Bb2,BQ,BK,'))
+        self.assertTrue(data.endswith(',Wr2 -'))
+        self.assertLess(len(data), len(json.dumps(_game.serialize())) / 10)
+
+    def test_round_trip(self):
+        for name in dir(game_factory):
+            if not name.startswith('make_'):
+                continue
+
+            _game = getattr(game_factory, name)()
+            moves = _game.getAllMoves()
+            if moves:
+                _game.move(moves[0])
+            data = _game.serialize(True)
+
+            for gameboard in (board.Board(), board.BitBoard(), board.MailboxBoard()):
+                restored = game.Game(gameboard)
+                restored.deserialize(json.loads(json.dumps(data)))
+
+                self.assertEqual(restored.serialize(True), data, name)
+                self.assertEqual(self.gameData(restored), self.gameData(_game), name)
+                self.assertEqual(restored.zobrist_key, _game.zobrist_key, name)
+                self.assertEqual(restored.score, _game.score, name)
+
+    def gameData(self, _game):
+        """Serialized game, captures in id order"""
+        data = _game.serialize()
+        for key in ('white_captures', 'black_captures'):
+            data[key].sort(key=lambda p: p['id'])
+        return data
+
+    def test_state(self):
+        _game = game_factory.make_whites_checkmate1()
+        _game.is_checkmate = True
+        fields = _game.serialize(True).split(' ')
+        self.assertEqual(fields[1:3], ['b', '+#'])
+
+        _game.is_check = False
+        restored = game.Game()
+        restored.deserialize(_game.serialize(True))
+        self.assertFalse(restored.is_check)
+        self.assertTrue(restored.is_checkmate)
+        self.assertTrue(restored.black_moves)
+
+    def test_invalid(self):
+        data = game.Game().init_new().serialize(True)
+        for invalid in (
+            '',
+            data.replace(' w ', ' x '),
+            data.replace('/8/8/', '/8/9/'),
+            data.replace('/8/8/', '/8/'),
+            data.replace('Br2,', ''),
+            data.replace(',Wr2', ',Wr2,Wx'),
+            data.replace('Br2', 'Br2:x'),
+            data[:-1] + 'xWp9',
+        ):
+            self.assertRaises(ValueError, game.Game().deserialize, invalid)
+
+
+class SessionsTests(unittest.TestCase):
+    """Game sessions stores testing class"""
+
+    def setUp(self):
+        self.now = 1000.0
+        self.clock = lambda: self.now
+
+    def makeSession(self):
+        _game = game.Game(board.BitBoard(), lambda g: g.getAllMoves()[0]).init_new()
+        return sessions.Session(_game)
+
+    def getReleased(self, store, id):
+        """Session of store, released as by request which didn't change it"""
+        session = store.get(id)
+        if session is not None:
+            store.release(session)
+        return session
+
+    def test_memory_lru(self):
+        store = sessions.MemoryStore(max_size=2, ttl=60, clock=self.clock)
+        s1, s2, s3 = self.makeSession(), self.makeSession(), self.makeSession()
+
+        store.set(s1)
+        store.set(s2)
+        self.assertIs(self.getReleased(store, s1.id), s1)
+
+        # s2 is least recently used
+        store.set(s3)
+        self.assertEqual(len(store), 2)
+        self.assertIsNone(store.get(s2.id))
+        self.assertIs(self.getReleased(store, s1.id), s1)
+        self.assertIs(self.getReleased(store, s3.id), s3)
+
+        store.delete(s1.id)
+        self.assertIsNone(store.get(s1.id))
+        self.assertIsNone(store.get('unknown'))
+
+    def test_memory_ttl(self):
+        store = sessions.MemoryStore(ttl=60, clock=self.clock)
+        s1, s2 = self.makeSession(), self.makeSession()
+        store.set(s1)
+        store.set(s2)
+
+        # access extends session
+        self.now += 50
+        self.assertIs(self.getReleased(store, s1.id), s1)
+        self.now += 50
+        self.assertIs(self.getReleased(store, s1.id), s1)
+        self.assertIsNone(store.get(s2.id))
+
+        # expired sessions are evicted on set
+        self.now += 100
+        store.set(self.makeSession())
+        self.assertEqual(len(store), 1)
+
+    def test_memory_lock(self):
+        store = sessions.MemoryStore(ttl=60, clock=self.clock)
+        session = self.makeSession()
+        store.set(session)
+        self.assertFalse(session.lock.locked())
+
+        # second request of the game waits until first one stores its move
+        first = store.get(session.id)
+        self.assertIs(first, session)
+        second = []
+        thread = threading.Thread(target=lambda: second.append(store.get(session.id)))
+        thread.start()
+        thread.join(0.2)
+        self.assertTrue(thread.is_alive())
+
+        first.game.move()
+        store.set(first)
+        thread.join(5)
+        self.assertFalse(thread.is_alive())
+        self.assertIs(second[0], session)
+        self.assertTrue(second[0].game.black_moves)
+
+        store.release(second[0])
+        self.assertFalse(session.lock.locked())
+
+    def test_file_store(self):
+        directory = tempfile.mkdtemp()
+        try:
+            store = sessions.FileStore(directory, max_size=2, ttl=60, clock=self.clock)
+            session = self.makeSession()
+            session.game.move()
+            store.set(session)
+
+            restored = store.get(session.id)
+            self.assertEqual(restored.id, session.id)
+            self.assertEqual(restored.game.serialize(True), session.game.serialize(True))
+            self.assertEqual(restored.game.zobrist_key, session.game.zobrist_key)
+            self.assertIsNone(restored.game.move_generator)
+            self.assertIsNotNone(restored.table)
+
+            # stored game is not changed by original
+            self.assertIsNotNone(session.game.move_generator)
+
+            self.assertIsNone(store.get('../' + session.id))
+            self.assertIsNone(store.get(None))
+            self.assertIsNone(store.get('0' * 32))
+
+            self.now += 61
+            self.assertIsNone(store.get(session.id))
+            self.assertEqual(os.listdir(directory), [])
+
+            # oldest are purged above max size
+            stored = []
+            for i in range(3):
+                self.now += 10
+                stored.append(self.makeSession())
+                store.set(stored[-1])
+            store.purge()
+            self.assertIsNone(store.get(stored[0].id))
+            self.assertIsNotNone(store.get(stored[2].id))
+        finally:
+            shutil.rmtree(directory)
+
+    def test_create_store(self):
+        self.assertIsNone(sessions.createStore({}))
+        self.assertIsInstance(sessions.createStore({'CHESS_SESSIONS': True}), sessions.MemoryStore)
+
+        directory = tempfile.mkdtemp()
+        try:
+            store = sessions.createStore({'CHESS_SESSIONS': True, 'CHESS_SESSIONS_DIR': directory})
+            self.assertIsInstance(store, sessions.FileStore)
+        finally:
+            shutil.rmtree(directory)
+
+
+class GameStatusTests(unittest.TestCase):
+    """Game status and legal moves cache testing class"""
+
+    def test_status(self):
+        self.assertEqual(game.Game().init_new().getStatus(), game.ACTIVE)
+        self.assertEqual(game_factory.make_whites_check1().getStatus(), game.CHECK)
+
+        _game = game_factory.make_whites_checkmate1()
+        self.assertEqual(_game.getStatus(), game.CHECKMATE)
+        self.assertTrue(_game.is_checkmate)
+        self.assertFalse(_game.is_stalemate)
+
+    def test_stalemate(self):
+        _game = game.Game().init_new()
+        _game.strip()
+        _game.initPiece(_game.piece_list['WK'], (7, 5))
+        _game.initPiece(_game.piece_list['WQ'], (5, 4))
+        _game.initPiece(_game.piece_list['BK'], (7, 7))
+
+        _game.move(pieces.PieceMove(((5, 4), (5, 6))))
+        self.assertEqual(_game.getStatus(), game.STALEMATE)
+        self.assertFalse(_game.is_check)
+        self.assertFalse(_game.is_checkmate)
+        self.assertTrue(_game.is_stalemate)
+        self.assertEqual(_game.serialize(True).split(' ')[2], '=')
+
+        # data without stalemate flag
+        data = _game.serialize()
+        del data['is_stalemate']
+        data['is_checkmate'] = True
+        restored = game.Game()
+        restored.deserialize(data)
+        self.assertFalse(restored.is_checkmate)
+        self.assertTrue(restored.is_stalemate)
+
+    def test_moves_cache(self):
+        _game = game.Game(board.BitBoard()).init_new()
+
+        calls = []
+        get_pseudo_moves = _game.getPseudoMoves
+        _game.getPseudoMoves = lambda *args: calls.append(None) or get_pseudo_moves(*args)
+
+        moves = _game.getAllMoves()
+        self.assertEqual(len(moves), 20)
+        self.assertTrue(_game.hasLegalMoves())
+
+        # returned list may be changed by caller
+        moves.pop()
+        self.assertEqual(len(_game.getAllMoves()), 20)
+        self.assertEqual(len(calls), 1)
+
+        # other position
+        undo = _game.make_move(moves[0])
+        self.assertEqual(len(_game.getAllMoves()), 20)
+        self.assertEqual(len(calls), 2)
+
+        _game.unmake_move(undo)
+        self.assertEqual([m.moves for m in _game.getAllMoves()[:-1]], [m.moves for m in moves])
+        self.assertEqual(len(calls), 3)
+
+
+class MovesIndexTests(unittest.TestCase):
+    """Legal moves index and move validation testing class"""
+
+    def test_index(self):
+        _game = game.Game(board.BitBoard()).init_new()
+        index = _game.getMovesIndex()
+        self.assertEqual(len(index), 20)
+        self.assertIs(_game.getMovesIndex(), index)
+        self.assertIn(((4, 1), (4, 3), None), index)
+
+        _game.move(pieces.PieceMove(((4, 1), (4, 3))))
+        self.assertIsNot(_game.getMovesIndex(), index)
+        self.assertIn(((4, 6), (4, 4), None), _game.getMovesIndex())
+
+    def test_validation_without_generation(self):
+        """Move validated by index built in the same position"""
+        _game = game.Game(board.BitBoard()).init_new()
+        _game.getMovesIndex()
+
+        calls = []
+        get_pseudo_moves = _game.getPseudoMoves
+        _game.getPseudoMoves = lambda *args: calls.append(None) or get_pseudo_moves(*args)
+
+        _game.move(pieces.PieceMove(((6, 0), (5, 2))))
+        self.assertEqual(calls, [])
+
+    def test_client_move(self):
+        """Legal move is executed instead of client data"""
+        _game = game_factory.make_whites_castling_short()
+
+        # castling by king move only, as deserialized from JSON
+        move = pieces.PieceMove.deserialize({'moves': [[[4, 0], [6, 0]]], 'tt': None, 'c': None})
+        _game.move(move)
+        self.assertEqual(_game.board.squares[6][0].piece.type, pieces.TypeKing)
+        self.assertEqual(_game.board.squares[5][0].piece.type, pieces.TypeRook)
+
+        _game = game_factory.make_whites_promotion()
+        move = pieces.PieceMove(((5, 6), (4, 7)))
+        move.transformation = ((4, 7), pieces.TypeKnight)
+        _game.move(move)
+        self.assertEqual(_game.board.squares[4][7].piece.type, pieces.TypeKnight)
+
+    def test_invalid(self):
+        _game = game.Game(board.BitBoard()).init_new()
+        promotion = game_factory.make_whites_promotion()
+
+        for _game, move in (
+            (_game, pieces.PieceMove(((4, 3), (4, 4)))),
+            (_game, pieces.PieceMove(((4, 6), (4, 4)))),
+            (_game, pieces.PieceMove(((4, 1), (4, 4)))),
+            (_game, pieces.PieceMove(((9, 1), (4, 4)))),
+            (_game, pieces.PieceMove()),
+            (_game, pieces.PieceMove(((4, 1),))),
+            # promotion without piece type
+            (promotion, pieces.PieceMove(((5, 6), (4, 7)))),
+        ):
+            self.assertRaises(ValueError, _game.move, move)
+
+
+class AttackMapTests(unittest.TestCase):
+    """Attack maps testing class"""
+
+    def map_state(self, attack_map):
+        return (attack_map.counts, attack_map.sources, attack_map.attackers)
+
+    def check_all_moves(self, _game, depth):
+        """Maps updated by make_move / unmake_move have to match maps built from scratch"""
+        attack_map = _game.getAttackMap()
+        self.assertEqual(self.map_state(attack_map), self.map_state(attacks.AttackMap(_game.board)))
+        if depth == 0:
+            return
+
+        for move in _game.getAllMoves():
+            undo = _game.make_move(move)
+            self.check_all_moves(_game, depth - 1)
+            _game.unmake_move(undo)
+            self.assertIs(_game.getAttackMap(), attack_map, str(move))
+            self.assertEqual(self.map_state(attack_map), self.map_state(attacks.AttackMap(_game.board)))
+
+    def test_new_game(self):
+        attack_map = game.Game().init_new().getAttackMap()
+
+        # rank 3 is attacked by pawns and knights, rank 4 isn't attacked
+        self.assertEqual(attack_map.count((2, 2), False), 3)
+        self.assertEqual(attack_map.count((0, 2), False), 2)
+        self.assertFalse(attack_map.isAttacked((4, 3), False))
+        self.assertTrue(attack_map.isAttacked((4, 5), True))
+        self.assertFalse(attack_map.isAttacked((4, 5), False))
+
+        # defended own pieces are included, a1 and h1 aren't defended
+        self.assertEqual(attack_map.mobility(False), 22)
+        self.assertEqual(attack_map.mobility(True), 22)
+
+    def test_sliders(self):
+        _board = board.Board()
+        WR = pieces.Piece(pieces.TypeRook, False)
+        BP = pieces.Piece(pieces.TypePawn, True)
+        for piece, pos in ((WR, (0, 0)), (BP, (0, 4))):
+            board.BoardManager.initPiece(_board, piece, pos)
+
+        attack_map = attacks.AttackMap(_board)
+        self.assertTrue(attack_map.isAttacked((0, 4), False))
+        self.assertFalse(attack_map.isAttacked((0, 5), False))
+        self.assertEqual(attack_map.mobility(False), 11)
+
+        # ray extends after blocking piece leaves
+        board.BoardManager.move(_board, pieces.PieceMove(((0, 4), (0, 3))))
+        attack_map.update(_board, [(0, 4), (0, 3)])
+        self.assertFalse(attack_map.isAttacked((0, 4), False))
+        self.assertEqual(attack_map.mobility(False), 10)
+        self.assertEqual(self.map_state(attack_map), self.map_state(attacks.AttackMap(_board)))
+
+    def test_check_from_make_move(self):
+        """Check computed by make_move is reused, and matches full test"""
+        for name in dir(game_factory):
+            if not name.startswith('make_'):
+                continue
+
+            _game = game.Game(board.BitBoard())
+            _game.deserialize(getattr(game_factory, name)().serialize())
+            for move in _game.getAllMoves():
+                undo = _game.make_move(move)
+                expected = pieces.MoveLegality(_game.board, _game.black_moves).in_check
+                self.assertEqual(_game._moveLegality().in_check, expected, name)
+                _game.unmake_move(undo)
+
+    def test_factory_positions(self):
+        for name in dir(game_factory):
+            if not name.startswith('make_'):
+                continue
+
+            for gameboard in (board.Board(), board.BitBoard(), board.MailboxBoard()):
+                _game = game.Game(gameboard)
+                _game.deserialize(getattr(game_factory, name)().serialize())
+                self.check_all_moves(_game, 2)
+
+    def test_legality(self):
+        """Legality tested on maps gives the same moves"""
+        for name in dir(game_factory):
+            if not name.startswith('make_'):
+                continue
+
+            _game = getattr(game_factory, name)()
+            for i in range(20):
+                expected = sorted((m.moves, m.transformation) for m in _game.getAllMoves())
+                legality = pieces.MoveLegality(_game.board, _game.black_moves, attacks.AttackMap(_game.board))
+                self.assertEqual(sorted((m.moves, m.transformation) for m in legality.filter(_game.getPseudoMoves())), expected, name)
+
+                if not expected:
+                    break
+                _game.move(sorted(_game.getAllMoves(), key=lambda m: (m.moves, m.transformation))[(i * 7) % len(expected)])
+
+    def test_castling_through_check(self):
+        _game = game_factory.make_whites_castling_through_check()
+        castlings = lambda: sorted(m.moves[0][1] for m in _game.getAllMoves() if len(m.moves) == 2)
+        self.assertEqual(castlings(), [(2, 0)])
+
+        _game.getAttackMap()
+        _game._moves_key = None
+        self.assertEqual(castlings(), [(2, 0)])
+
+    def test_evaluation(self):
+        _game = game.Game().init_new()
+        self.assertEqual(evaluation.attackScore(_game), 0)
+
+        _game.move(pieces.PieceMove(((4, 1), (4, 3))))
+        self.assertTrue(evaluation.attackScore(_game) > 0)
+
+        evaluation.ATTACKS = True
+        try:
+            self.assertEqual(evaluation.gameScore(_game), _game.board.score + evaluation.attackScore(_game))
+        finally:
+            evaluation.ATTACKS = False
+
+
+class ProfilingTests(unittest.TestCase):
+    """Request profiling hooks testing class"""
+
+    def setUp(self):
+        profiling.stats.reset()
+
+    def tearDown(self):
+        profiling.stop()
+        profiling.stats.reset()
+
+    def test_disabled(self):
+        self.assertIsNone(profiling.current())
+        self.assertEqual(profiling.active, 0)
+
+        _game = game.Game(board.BitBoard(), lambda g: gen_negamax.negamaxGenerator(g, level=2)).init_new()
+        _game.move()
+
+        self.assertIsNone(profiling.stop())
+        self.assertEqual(profiling.stats.profiles, 0)
+
+    def test_game_move(self):
+        _game = game.Game(board.BitBoard(), lambda g: gen_negamax.negamaxGenerator(g, level=2)).init_new()
+
+        profile = profiling.start()
+        self.assertEqual(profiling.active, 1)
+        _game.move()
+        self.assertIs(profiling.stop(), profile)
+        self.assertEqual(profiling.active, 0)
+
+        data = profile.serialize()
+        for name in ('generator', 'validation', 'status'):
+            self.assertEqual(data['timers'][name]['calls'], 1)
+        self.assertTrue(data['elapsed'] >= data['timers']['generator']['ms'])
+
+        counters = data['counters']
+        self.assertTrue(counters['nodes'] >= 20)
+        self.assertTrue(counters['evaluations'] > 0)
+        self.assertTrue(counters['legality_checks'] >= counters['nodes'])
+        self.assertTrue(counters['cutoffs'] > 0)
+
+        # hooks are off after stop
+        _game.move()
+        self.assertEqual(profile.counters, counters)
+
+    def test_minimax(self):
+        _game = game.Game(board.BitBoard()).init_new()
+
+        profile = profiling.start()
+        gen_minimax.minimaxGenerator(_game, level=2)
+        profiling.stop()
+
+        self.assertEqual(sorted(profile.timers.keys()), ['traverse', 'tree_build'])
+        self.assertEqual(profile.counters['nodes'], 420)
+        self.assertEqual(profile.counters['evaluations'], 421)
+        self.assertTrue(profile.counters['tree_evaluations'] > 20)
+        self.assertTrue(profile.counters['cutoffs'] > 0)
+
+    def test_stats(self):
+        for i in range(3):
+            profiling.start()
+            profiling.count('nodes', 10)
+            with profiling.timer('search'):
+                pass
+            profiling.stop()
+
+        data = profiling.stats.serialize()
+        self.assertEqual(data['profiles'], 3)
+        self.assertEqual(data['counters'], {'nodes': 30})
+        self.assertEqual(data['timers']['search']['calls'], 3)
+        self.assertTrue(data['timers']['search']['max_ms'] <= data['timers']['search']['ms'])
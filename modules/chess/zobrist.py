@@ -0,0 +1,69 @@
+"""Zobrist hashing module
+Position key covers piece placement, side to move, castling rights (unmoved kings and rooks)
+and en passant availability (pawns after their first, two squares move).
+Keys are generated from a fixed seed, so they are equal in every process.
+"""
+import random
+
+import pieces
+
+
+_random = random.Random(20130501)
+
+
+def _keys(count):
+    return [_random.getrandbits(64) for i in range(count)]
+
+
+# piece type -> [white keys, black keys], 64 keys each
+PIECES = dict(
+    (pieces.types_dict[t], [_keys(64), _keys(64)])
+    for t in sorted(pieces.types_dict.keys())
+)
+
+# castling rights - unmoved king or rook on square
+UNMOVED = {
+    pieces.TypeKing: [_keys(64), _keys(64)],
+    pieces.TypeRook: [_keys(64), _keys(64)],
+}
+
+# pawn on square may be captured en passant
+EN_PASSANT = _keys(64)
+
+BLACK_MOVES = _random.getrandbits(64)
+
+
+def pieceKey(piece, position):
+    """Key of piece standing on position"""
+    index = position[1] * 8 + position[0]
+    key = PIECES[piece.type][piece.is_black][index]
+
+    if piece.moves_count == 0:
+        unmoved = UNMOVED.get(piece.type)
+        if unmoved:
+            key ^= unmoved[piece.is_black][index]
+    elif piece.moves_count == 1 and piece.type is pieces.TypePawn:
+        if position[1] == (4 if piece.is_black else 3):
+            key ^= EN_PASSANT[index]
+
+    return key
+
+
+def boardKey(board):
+    """Computes board key from scratch"""
+    key = 0
+    for x, row in enumerate(board.squares):
+        for y, square in enumerate(row):
+            if square.piece:
+                key ^= pieceKey(square.piece, (x, y))
+
+    return key
+
+
+def gameKey(game):
+    """Computes game key from scratch"""
+    key = boardKey(game.board)
+    if game.black_moves:
+        key ^= BLACK_MOVES
+
+    return key
@@ -0,0 +1,197 @@
+"""Profiling module
+Named timers and counters of one request. Profiling is started and stopped per thread
+(see start and stop), finished profiles are aggregated per process in `stats`.
+
+Hooks cost nothing but a call when no profile is started in current thread. In hot code
+they are guarded by module-level `active` flag - one global lookup when profiling is off:
+
+    if profiling.active:
+        profiling.count('nodes')
+
+    with profiling.timer('search'):
+        ...
+"""
+import os
+import threading
+import time
+
+
+# number of threads with started profile, hooks are skipped when 0
+active = 0
+
+_local = threading.local()
+_lock = threading.Lock()
+
+
+class Profile(object):
+    """Timers and counters of one request"""
+    def __init__(self):
+        # name -> [calls, seconds]
+        self.timers = {}
+
+        # name -> value
+        self.counters = {}
+
+        self.started = time.time()
+        self.elapsed = None
+
+    def count(self, name, value=1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def addTime(self, name, seconds):
+        timer = self.timers.get(name)
+        if timer is None:
+            self.timers[name] = [1, seconds]
+        else:
+            timer[0] += 1
+            timer[1] += seconds
+
+    def serialize(self):
+        """Profile -> dict, times in milliseconds"""
+        return {
+            'elapsed': _ms(self.elapsed if self.elapsed is not None else time.time() - self.started),
+            'timers': {name: {'calls': calls, 'ms': _ms(seconds)} for name, (calls, seconds) in self.timers.items()},
+            'counters': dict(self.counters),
+        }
+
+
+class Stats(object):
+    """Finished profiles aggregated in one process"""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.profiles = 0
+            self.elapsed = 0.0
+
+            # name -> [calls, seconds, slowest profile seconds]
+            self.timers = {}
+
+            # name -> total
+            self.counters = {}
+
+    def add(self, profile):
+        with self._lock:
+            self.profiles += 1
+            self.elapsed += profile.elapsed
+
+            for name, (calls, seconds) in profile.timers.items():
+                timer = self.timers.get(name)
+                if timer is None:
+                    self.timers[name] = [calls, seconds, seconds]
+                else:
+                    timer[0] += calls
+                    timer[1] += seconds
+                    timer[2] = max(timer[2], seconds)
+
+            for name, value in profile.counters.items():
+                self.counters[name] = self.counters.get(name, 0) + value
+
+    def serialize(self):
+        """Stats -> dict, times in milliseconds"""
+        with self._lock:
+            return {
+                'pid': os.getpid(),
+                'profiles': self.profiles,
+                'elapsed': _ms(self.elapsed),
+                'timers': {
+                    name: {'calls': calls, 'ms': _ms(seconds), 'max_ms': _ms(slowest)}
+                    for name, (calls, seconds, slowest) in self.timers.items()
+                },
+                'counters': dict(self.counters),
+            }
+
+
+# profiles of this process
+stats = Stats()
+
+
+class _Timer(object):
+    """Timer context of started profile"""
+    __slots__ = ('profile', 'name', 'start')
+
+    def __init__(self, profile, name):
+        self.profile = profile
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profile.addTime(self.name, time.time() - self.start)
+        return False
+
+
+class _NoTimer(object):
+    """Timer context when profiling is off"""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NO_TIMER = _NoTimer()
+
+
+def start():
+    """Starts profile in current thread, returns it. Profile already started is replaced."""
+    global active
+
+    profile = Profile()
+    with _lock:
+        if current() is None:
+            active += 1
+        _local.profile = profile
+
+    return profile
+
+
+def stop():
+    """Stops profile of current thread and adds it to stats. Returns profile or None if it wasn't started."""
+    global active
+
+    profile = current()
+    if profile is None:
+        return None
+
+    with _lock:
+        _local.profile = None
+        active -= 1
+
+    profile.elapsed = time.time() - profile.started
+    stats.add(profile)
+    return profile
+
+
+def current():
+    """Profile started in current thread, or None"""
+    return getattr(_local, 'profile', None)
+
+
+def count(name, value=1):
+    """Adds value to counter of current profile"""
+    profile = current()
+    if profile is not None:
+        profile.count(name, value)
+
+
+def timer(name):
+    """Context measuring time of block in current profile"""
+    if not active:
+        return _NO_TIMER
+
+    profile = current()
+    if profile is None:
+        return _NO_TIMER
+
+    return _Timer(profile, name)
+
+
+def _ms(seconds):
+    return round(seconds * 1000.0, 3)
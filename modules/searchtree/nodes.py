@@ -121,12 +121,16 @@ class MinABNode(MinNode):
         self.alpha = alpha
         self.beta = beta
 
+        # alpha and beta before traverse
+        self.window = (alpha, beta)
+
         super(MinABNode, self).__init__(data, value)
 
     def traverseNode(self, node):
         # pass alpha and beta
         node.alpha = self.alpha
         node.beta = self.beta
+        node.window = (self.alpha, self.beta)
 
         # traverse node
         node.traverse()
@@ -146,12 +150,16 @@ class MaxABNode(MaxNode):
         self.alpha = alpha
         self.beta = beta
 
+        # alpha and beta before traverse
+        self.window = (alpha, beta)
+
         super(MaxABNode, self).__init__(data, value)
 
     def traverseNode(self, node):
         # pass alpha and beta
         node.alpha = self.alpha
         node.beta = self.beta
+        node.window = (self.alpha, self.beta)
 
         # traverse node
         node.traverse()